@@ -65,7 +65,7 @@ if __name__ == "__main__":
         try:
             temps = lakeshore.read_temperatures()
             redis.store({'status:temps:ln2tank': temps['ln2'],
-                         'status:temps:lhetank': temps['lhe']}, timeseries=True)
+                         'status:temps:lhetank': temps['lhe']}, timeseries=True, batch=True)
         except (IOError, ValueError) as e:
             log.error(f"Communication with LakeShore 240 failed: {e}")
         except RedisError as e:
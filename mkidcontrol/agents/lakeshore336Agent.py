@@ -84,24 +84,24 @@ def initializer(device):
         log.warning('Storing device settings to redis failed')
 
 
-def callback(tvals, svals):
-    vals = tvals + svals
-    keys = TEMP_KEYS + SENSOR_VALUE_KEYS
-    d = {k: x for k, x in zip(keys, vals)}
+def callback(reading):
     try:
-        if all(i is None for i in vals):
+        if reading is None:
             redis.store({STATUS_KEY: "Error"})
         else:
-            redis.store(d, timeseries=True)
-            redis.store({STATUS_KEY: "OK"})
+            vals = reading['temp'] + reading['sensor']
+            keys = TEMP_KEYS + SENSOR_VALUE_KEYS
+            redis.store_batch(data={STATUS_KEY: "OK"}, ts_data={k: x for k, x in zip(keys, vals)})
     except RedisError:
         log.warning('Storing LakeShore336 data to redis failed!')
 
 
 if __name__ == "__main__":
 
+    from mkidcontrol.config import REDIS_SCHEMA  # Not at the top, config imports this module for its TS_KEYS
+
     util.setup_logging('lakeshore336Agent')
-    redis.setup_redis(ts_keys=TS_KEYS)
+    redis.setup_redis(ts_keys=TS_KEYS, store_policies=REDIS_SCHEMA['store_policies'])
 
     try:
         log.debug(f"Connecting to LakeShore 336")
@@ -124,16 +124,18 @@ if __name__ == "__main__":
         log.critical(f"Error in communicating with redis: {e}")
         sys.exit(1)
 
-    lakeshore.monitor(QUERY_INTERVAL, (lakeshore.temp, lakeshore.sensor_vals), value_callback=callback)
+    lakeshore.monitor(QUERY_INTERVAL, lakeshore.read_all, value_callback=callback)
 
     try:
         while True:
-            for key, val in redis.listen(COMMAND_KEYS):
+            for command in redis.listen_commands('ls336', COMMAND_KEYS):
+                key, val = command
                 log.debug(f"heard {key} -> {val}!")
                 try:
                     cmd = LakeShoreCommand(key.removeprefix('command:'), val)
                 except ValueError as e:
                     log.warning(f"Ignoring invalid command ('{key}={val}'): {e}")
+                    command.fail(e)
                     continue
                 try:
                     lakeshore.handle_command(cmd)
@@ -142,6 +144,7 @@ if __name__ == "__main__":
                 except IOError as e:
                     redis.store({STATUS_KEY: f"Error {e}"})
                     log.error(f"Comm error: {e}")
+                    command.fail(e)
     except RedisError as e:
         log.critical(f"Redis server error! {e}")
         sys.exit(1)
@@ -21,7 +21,7 @@ import time
 import numpy as np
 
 from mkidcontrol.mkidredis import RedisError
-from mkidcontrol.devices import LakeShore372, InstrumentException
+from mkidcontrol.devices import LakeShore372, LakeShore372ScanAcquisition, InstrumentException
 import mkidcontrol.util as util
 from mkidcontrol.commands import COMMANDS372, LakeShoreCommand, ENABLED_372_INPUT_CHANNELS
 import mkidcontrol.mkidredis as redis
@@ -45,6 +45,13 @@ SN_KEY = 'status:device:ls372:sn'
 
 QUERY_INTERVAL = 1
 
+# In scan mode the agent follows the scanner (see LakeShore372ScanAcquisition) and stores every new conversion
+# instead of reading every input every QUERY_INTERVAL. Each poll chains 10 queries (SCAN?, HTR? 0 and 4 readings of each
+# of the control and the scanned input), so polling every 0.6 s uses 17 of the 372's 20 queries/s, leaving room for
+# commands, and the ~0.45 s the rate limit spaces a poll's queries over fits within the interval
+SCAN_ACQUISITION = True
+SCAN_POLL_INTERVAL = 0.6
+
 SETTING_KEYS = tuple(COMMANDS372.keys())
 
 COMMAND_KEYS = [f"command:{k}" for k in SETTING_KEYS]
@@ -118,25 +125,40 @@ def initializer(device):
         log.warning('Storing device settings to redis failed')
 
 
-def callback(temps, ress, exs, ov):
-    vals = temps + ress + exs + [ov]
-    keys = TEMPERATURE_KEYS + RESISTANCE_KEYS + EXCITATION_POWER_KEYS + (OUTPUT_VOLTAGE_KEY, )
-
-    d = {k: x for k, x in zip(keys, vals)}
+def callback(reading):
     try:
-        if all(i is None for i in vals):
+        if reading is None:
             redis.store({STATUS_KEY: "Error"})
         else:
-            redis.store(d, timeseries=True)
-            redis.store({STATUS_KEY: "OK"})
+            vals = reading['temp'] + reading['sensor'] + reading['excitation_power'] + [reading['output_voltage']]
+            keys = TEMPERATURE_KEYS + RESISTANCE_KEYS + EXCITATION_POWER_KEYS + (OUTPUT_VOLTAGE_KEY, )
+            redis.store_batch(data={STATUS_KEY: "OK"}, ts_data={k: x for k, x in zip(keys, vals)})
+    except RedisError:
+        log.warning('Storing LakeShore372 data to redis failed!')
+
+
+def scan_callback(result):
+    try:
+        if result is None:
+            redis.store({STATUS_KEY: "Error"})
+            return
+        samples, output_voltage = result
+        for t, channel, reading in samples:
+            i = ENABLED_372_INPUT_CHANNELS.index(channel)
+            redis.store_batch(ts_data={TEMPERATURE_KEYS[i]: reading['temp'], RESISTANCE_KEYS[i]: reading['sensor'],
+                                       EXCITATION_POWER_KEYS[i]: reading['excitation_power']},
+                              timestamp=int(t * 1000))
+        redis.store_batch(data={STATUS_KEY: "OK"}, ts_data={OUTPUT_VOLTAGE_KEY: output_voltage})
     except RedisError:
         log.warning('Storing LakeShore372 data to redis failed!')
 
 
 if __name__ == "__main__":
 
+    from mkidcontrol.config import REDIS_SCHEMA  # Not at the top, config imports this module for its TS_KEYS
+
     util.setup_logging('lakeshore372Agent')
-    redis.setup_redis(ts_keys=TS_KEYS)
+    redis.setup_redis(ts_keys=TS_KEYS, store_policies=REDIS_SCHEMA['store_policies'])
 
     try:
         log.debug(f"Connecting to LakeShore 372...")
@@ -161,26 +183,43 @@ if __name__ == "__main__":
         log.critical(f"Error in communicating with redis: {e}")
         sys.exit(1)
 
-    lakeshore.monitor(QUERY_INTERVAL, (lakeshore.temp, lakeshore.sensor_vals, lakeshore.excitation_power, lakeshore.output_voltage), value_callback=callback)
+    acquisition = None
+    if SCAN_ACQUISITION:
+        acquisition = LakeShore372ScanAcquisition(lakeshore, ENABLED_372_INPUT_CHANNELS)
+        try:
+            fastest = acquisition.refresh_scanner_settings()
+            if fastest is not None and fastest < 2 * SCAN_POLL_INTERVAL:
+                log.warning(f"Scanner pause + dwell of {fastest} s is too short to poll every {SCAN_POLL_INTERVAL} s")
+            lakeshore.monitor(SCAN_POLL_INTERVAL, acquisition.poll, value_callback=scan_callback)
+        except IOError as e:
+            log.error(f"Unable to read the scanner settings, polling all inputs: {e}")
+            acquisition = None
+    if acquisition is None:
+        lakeshore.monitor(QUERY_INTERVAL, lakeshore.read_all, value_callback=callback)
 
     try:
         while True:
-            for key, val in redis.listen(COMMAND_KEYS):
+            for command in redis.listen_commands('ls372', COMMAND_KEYS):
+                key, val = command
                 log.debug(f"heard {key} -> {val}!")
                 try:
                     cmd = LakeShoreCommand(key.removeprefix('command:'), val)
                 except ValueError as e:
                     log.warning(f"Ignoring invalid command ('{key}={val}'): {e}")
+                    command.fail(e)
                     continue
                 try:
                     lakeshore.handle_command(cmd)
                     redis.store({cmd.setting: cmd.value})
+                    if acquisition is not None and ':input-channel-' in cmd.setting:
+                        acquisition.refresh_scanner_settings()
                     # NB. Lakeshore 372 is working in service of the magnet. It cannot command the magnet to change the
                     #  setpoint. Setpoint changes are handled by the magnet agent.
                     redis.store({STATUS_KEY: "OK"})
                 except IOError as e:
                     redis.store({STATUS_KEY: f"Error"})
                     log.error(f"Comm error: {e}")
+                    command.fail(e)
     except RedisError as e:
         log.critical(f"Redis server error! {e}")
         sys.exit(1)
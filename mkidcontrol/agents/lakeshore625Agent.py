@@ -148,7 +148,7 @@ def initializer(device):
 def callback(cur, field, ov):
     d = {k: float(x) for k, x in zip((MAGNET_CURRENT_KEY, MAGNET_FIELD_KEY, OUTPUT_VOLTAGE_KEY), (cur, field, ov)) if
          x}
-    redis.store(d, timeseries=True)
+    redis.store(d, timeseries=True, batch=True)
 
 
 if __name__ == "__main__":
@@ -177,7 +177,8 @@ if __name__ == "__main__":
     # main loop, listen for commands and handle them
     try:
         while True:
-            for key, val in redis.listen(COMMAND_KEYS):
+            for command in redis.listen_commands('ls625', COMMAND_KEYS):
+                key, val = command
                 log.debug(f"lakeshore625agent received {key}, {val}. Trying to send a command")
                 key = key.removeprefix('command:')
                 try:
@@ -185,8 +186,9 @@ if __name__ == "__main__":
                         try:
                             limits = lakeshore.limits  # N.B. This is a fast call and if the command needs it it will have it, otherwise it will be ignored
                             cmd = LakeShoreCommand(key, val, limit_vals=limits)
-                        except ValueError:
+                        except ValueError as e:
                             log.warning(f"Ignoring invalid command ('{key}={val}'): {e}")
+                            command.fail(e)
                             continue
                         log.info(f"Processing command '{cmd}'")
                         lakeshore.send(cmd.ls_string)
@@ -207,6 +209,7 @@ if __name__ == "__main__":
                 except IOError as e:
                     redis.store({STATUS_KEY: f"Error {e}"})
                     log.error(f"Comm error: {e}")
+                    command.fail(e)
     except RedisError as e:
         log.critical(f"Redis server error! {e}", exc_info=True)
         sys.exit(1)
@@ -31,7 +31,7 @@ if __name__ == "__main__":
 
     log= util.setup_logging('hemttempAgent')
 
-    redis = PCRedis(create_ts_keys=KEYS)
+    redis = MKIDRedis(ts_keys=KEYS)
     hemtduino = Hemtduino(port=DEVICE, baudrate=115200, timeout=0.1)
 
     try:
@@ -50,8 +50,8 @@ if __name__ == "__main__":
 
     while True:
         try:
-            redis.store({key: v for key, v in zip(KEYS, hemtduino.read_hemt_data())}, timeseries=True)
-            redis.store({STATUS_KEY: 'OK'})
+            redis.store_batch(data={STATUS_KEY: 'OK'},
+                              ts_data={key: v for key, v in zip(KEYS, hemtduino.read_hemt_data())})
         except RedisError as e:
             log.error(f"Redis error {e}")
             sys.exit(1)
@@ -3,123 +3,261 @@ Author: Noah Swimmer, 3 February 2021
 
 The goal of this program is to monitor for the potential signs of a quench in the PICTURE-C Magnet and, if found,
 to report the quench as fast as possible to shut of the magnet and prevent any damage to it.
+
+Run with --xkid to watch the XKID magnet (the Lake Shore 625 current) instead. Each sample of the current is checked as
+soon as it is stored, so a quench is reported within one sample period of showing (--poll to poll the current instead).
 """
 
+import argparse
+import queue
 import mkidcontrol.mkidredis as redis
 from mkidcontrol.mkidredis import RedisError
 import mkidcontrol.util as util
 from mkidcontrol.devices import SIM960
+from mkidcontrol.agents.picturec.currentduinoAgent import QUERY_INTERVAL as SAMPLE_INTERVAL
+from mkidcontrol.agents.lakeshore625Agent import QUERY_INTERVAL as XKID_SAMPLE_INTERVAL
 from logging import getLogger
 import time
-import numpy as np
 
 
 TS_KEYS = ['status:temps:mkidarray:temp', 'status:highcurrentboard:current',
            'status:temps:lhetank', 'status:temps:ln2tank']
 LOOP_INTERVAL = .1
+WATCHDOG_INTERVAL = 1  # s, how often the current is checked without a notification of a new sample
 QUENCH_KEY = 'command:event:quenching'
+QUENCH_LATENCY_KEY = 'status:quench:detection-latency'  # s, from the sample showing the quench to its publication
+
+CURRENT_KEY = 'status:highcurrentboard:current'  # PICTURE-C, the currentduino's reading of the SIM960 driven current
+XKID_CURRENT_KEY = 'status:magnet:current'  # XKID, the Lake Shore 625's output current
+XKID_MAX_DERAMP_RATE = 0.100  # A/s, the fastest device-settings:magnet:deramp-rate allowed (COMMANDSMAGNET)
+QUENCH_SLOPE_FACTOR = 5  # The current falling this many times faster than the fastest allowed deramp is a quench
+QUENCH_WINDOW = 3  # s, the current slope is fit to the samples of about this long (but at least MIN_POINTS samples)
+MIN_POINTS = 3
 
 MAX_STARTUP_LAG_TIME_SECONDS = 600
 
-sim = SIM960('/dev/sim960', connect=False)
 
+class SlidingSlope:
+    """
+    The least-squares slope of the last n (t, y) samples, updated in O(1) as each sample is added.
 
-class QuenchMonitor:
-    def __init__(self, npoints:int=30):
-        self.npoints_for_smoothing = npoints
-        self.timestream = self.initialize_data()
-        self.di_dt = self.initialize_di_dt()
-        self.smoothed_di_dt = self.initialize_smoothed(self.npoints_for_smoothing)
-        self.max_deramp_rate = -1 * sim.MAX_CURRENT_SLOPE
+    The samples are kept in a ring buffer with the running sums of t, y, t^2 and ty, so the memory is fixed and adding a
+    sample costs a few float operations. Times are held relative to the oldest sample in the buffer, which is moved up
+    (and the sums recomputed, which also drops any accumulated rounding) every time the buffer wraps.
+    """
+    def __init__(self, n: int = 30):
+        if n < 2:
+            raise ValueError('A slope needs at least 2 points')
+        self.n = n
+        self.count = 0
+        self._t = [0.0] * n
+        self._y = [0.0] * n
+        self._next = 0  # Index of the oldest sample, which the next one replaces
+        self._origin = 0.0
+        self._st = self._sy = self._stt = self._sty = 0.0
 
+    def __len__(self):
+        return self.count
 
-    def update(self):
-        new_data = redis.read('status:highcurrentboard:current')
-        if new_data[0] == self.timestream[-1][0]:
-            pass
+    @property
+    def full(self):
+        return self.count == self.n
+
+    def add(self, t: float, y: float):
+        t -= self._origin
+        i = self._next
+        if self.count == self.n:
+            ot, oy = self._t[i], self._y[i]
+            self._st -= ot
+            self._sy -= oy
+            self._stt -= ot * ot
+            self._sty -= ot * oy
         else:
-            self.di_dt.append((new_data[0], 1000 * (new_data[1] - self.timestream[-1][1])/(new_data[0] - self.timestream[-1][0])))
-            self.timestream.append(new_data)
-            ts_for_smooth = np.array(self.timestream[-self.npoints_for_smoothing:])
-            self.smoothed_di_dt.append((new_data[0], 1000 * np.polyfit(ts_for_smooth[:, 0], ts_for_smooth[:, 1], 1)[0]))
+            self.count += 1
+        self._t[i], self._y[i] = t, y
+        self._st += t
+        self._sy += y
+        self._stt += t * t
+        self._sty += t * y
+        self._next = (i + 1) % self.n
+        if self._next == 0:
+            self._rebase()
 
+    def _rebase(self):
+        # Only called as the buffer wraps, when it is full and its oldest sample is at index 0
+        shift = self._t[0]
+        self._origin += shift
+        self._t = [t - shift for t in self._t]
+        self._st, self._sy = sum(self._t), sum(self._y)
+        self._stt = sum(t * t for t in self._t)
+        self._sty = sum(t * y for t, y in zip(self._t, self._y))
 
+    @property
+    def slope(self):
+        """ The slope (units of y per unit of t) of the samples, None if there are fewer than 2 or they share a time """
+        n = self.count
+        if n < 2:
+            return None
+        denominator = n * self._stt - self._st * self._st
+        if denominator <= 0:
+            return None
+        return (n * self._sty - self._st * self._sy) / denominator
 
-    def initialize_data(self):
-        """
-        returns a 2 column array where column 0 is time (ms) and column 1 is current (A) up to the
-        last MAX_STARTUP_LAG_TIME_SECONDS. If there is no data in this time range, it will return an empty array
-        """
-        now = time.time() * 1000
-        first_time = MAX_STARTUP_LAG_TIME_SECONDS * 1000
-        return redis.pcr_range('status:highcurrentboard:current', int(now-first_time), int(now))
 
-    def initialize_di_dt(self):
+def window_points(sample_interval):
+    """ The number of samples of the current, stored every sample_interval seconds, to fit the slope to """
+    return max(MIN_POINTS, round(QUENCH_WINDOW / sample_interval))
+
+
+class QuenchMonitor:
+    """
+    Watches the magnet current timeseries (key) for a quench, a fall in the current faster than QUENCH_SLOPE_FACTOR
+    times max_deramp_rate (A/s). The di/dt is the least-squares slope over the last npoints samples, so no quench is
+    reported until there are npoints samples.
+    """
+    def __init__(self, npoints: int = 30, key=CURRENT_KEY, max_deramp_rate=SIM960.MAX_CURRENT_SLOPE):
+        self.key = key
+        self.npoints_for_smoothing = npoints
+        self.max_deramp_rate = -1 * abs(max_deramp_rate)
+        self.slope = SlidingSlope(npoints)
+        self.last = None  # The latest (time (ms), current (A)) sample
+        self.di_dt = None  # (time (ms), di/dt (A/s)) from the latest two samples
+        self.smoothed_di_dt = None  # (time (ms), di/dt (A/s)) fit to the latest npoints samples
+        self.initialize_data()
+
+    def add(self, t, current):
+        """ Add a sample of the current (A) at t (UNIX time in ms). Samples no later than the latest are ignored """
+        if self.last is not None:
+            if t <= self.last[0]:
+                return
+            self.di_dt = (t, 1000 * (current - self.last[1]) / (t - self.last[0]))
+        self.last = (t, current)
+        self.slope.add(t / 1000, current)
+        if self.slope.full:
+            self.smoothed_di_dt = (t, self.slope.slope)
+
+    def update(self):
         """
-        returns a 2 column array where column 0 is time (ms) and column 1 is the current di/dt (A/s). The timestamps
-        will match those from initialize_data
+        Add the samples stored since the latest one seen, checking for a quench after each. Returns the time (ms) of the
+        first of them to show a quench or None
         """
-        tsl = len(self.timestream)
-        di_dt = []
-        if tsl > 1:
-            for i in range(tsl-1):
-                di_dt.append((self.timestream[i+1][0],
-                              1000*((self.timestream[i+1][1] - self.timestream[i][1])/
-                                    (self.timestream[i+1][0] - self.timestream[i][0]))))
-        return di_dt
-
-    def initialize_smoothed(self, npoints:int=30):
+        quenched_at = None
+        for t, current in redis.mkr_range(self.key, self.last[0] + 1 if self.last else None):
+            if t is None:
+                break
+            self.add(t, float(current))
+            if quenched_at is None and self.check_quench():
+                quenched_at = t
+        return quenched_at
+
+    def initialize_data(self):
         """
-        Do smoothing
+        Add the samples of up to the last MAX_STARTUP_LAG_TIME_SECONDS (at most the last npoints are kept)
         """
-        tsl = len(self.di_dt)
-        ts = np.array(self.timestream)
-        smoothed = []
-        if tsl > npoints:
-            for i in range(tsl-npoints):
-                smoothed.append((ts[i+npoints][0],
-                                 1000 * np.polyfit(ts[i:i+npoints][:, 0],
-                                                   ts[i:i+npoints][:, 1], 1)[0]))
-        return smoothed
+        now = time.time() * 1000
+        for t, current in redis.mkr_range(self.key, int(now - 1000 * MAX_STARTUP_LAG_TIME_SECONDS), int(now)):
+            if t is None:
+                break
+            self.add(t, float(current))
 
     def check_quench(self):
-        return self.smoothed_di_dt[-1][1] <= 5 * self.max_deramp_rate
+        if self.smoothed_di_dt is None:
+            return False
+        return self.smoothed_di_dt[1] <= QUENCH_SLOPE_FACTOR * self.max_deramp_rate
 
 
-if __name__ == "__main__":
+def report_quench(sample_time, log):
+    """
+    Publish QUENCH_KEY and record the detection latency, the time since sample_time (ms) of the sample that showed the
+    quench, in QUENCH_LATENCY_KEY
+    """
+    now = time.time()
+    redis.publish(QUENCH_KEY, f'QUENCH:{now}', store=False)
+    latency = now - sample_time / 1000
+    log.critical(f"Quench detected, {1e3 * latency:.0f} ms after the sample that showed it.")
+    redis.store({QUENCH_LATENCY_KEY: latency})
 
-    util.setup_logging('quenchAgent')
-    redis.setup_redis(ts_keys=TS_KEYS)
 
-    q = QuenchMonitor()
+def watch(q, log, watchdog=WATCHDOG_INTERVAL):
+    """
+    Check for a quench as soon as each sample of the current is stored (signalled by a keyspace notification) and report
+    it on the first sample to show it, once per quench. Should notifications be lost the current is still checked every
+    watchdog seconds. Passes up any redis errors.
+    """
+    quenching = False
+    with redis.watch_keys(q.key) as listener:
+        q.update()  # Anything stored before the subscription
+        log.debug(f'Watching {q.key} for quenches')
+        while True:
+            try:
+                listener.get(timeout=watchdog)
+            except queue.Empty:
+                pass
+            quenched_at = q.update()
+            if quenched_at is not None and not quenching:
+                report_quench(quenched_at, log)
+            quenching = q.check_quench()
 
-    warning = False
-    log = getLogger('quenchAgent')
-    log.debug('Starting quench monitoring')
 
+def poll(q, log):
+    """
+    Check for a quench every LOOP_INTERVAL and report it once it has been seen twice in a row. Passes up any redis
+    errors.
+    """
+    warning = False
     steps_since_first_quench = 0
     while True:
-        try:
-            q.update()
-            quench = q.check_quench()
+        q.update()
+        quench = q.check_quench()
 
-            log.debug(f"Checked for quench - quench={quench}")
+        log.debug(f"Checked for quench - quench={quench}")
 
-            if quench:
-                steps_since_first_quench += 1
-                if warning:
-                    redis.publish(QUENCH_KEY, f'QUENCH:{time.time()}', store=False)
-                    log.critical(f"Quench detected.")
-                else:
-                    warning = True
+        if quench:
+            steps_since_first_quench += 1
+            if warning:
+                report_quench(q.last[0], log)
             else:
-                if steps_since_first_quench > 0:
-                    steps_since_first_quench += 1
-                if steps_since_first_quench > 10:
-                    warning = False
-                    steps_since_first_quench = 0
-        except RedisError as e:
-            log.critical(f"Redis server error! {e}")
-            break
+                warning = True
+        else:
+            if steps_since_first_quench > 0:
+                steps_since_first_quench += 1
+            if steps_since_first_quench > 10:
+                warning = False
+                steps_since_first_quench = 0
         time.sleep(LOOP_INTERVAL)
 
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Magnet quench monitor')
+    parser.add_argument('--xkid', default=False, action='store_true',
+                        help='Watch the XKID Lake Shore 625 current instead of the PICTURE-C high current board')
+    parser.add_argument('--npoints', default=None, type=int,
+                        help=f'Number of samples to fit the current slope to, by default those of {QUENCH_WINDOW} s')
+    parser.add_argument('--poll', default=False, action='store_true',
+                        help=f'Poll the current every {LOOP_INTERVAL} s and require two detections in a row instead of '
+                             f'checking each sample as it is stored')
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+
+    args = parse_args()
+    util.setup_logging('quenchAgent')
+    redis.setup_redis(ts_keys=TS_KEYS)
+
+    if args.xkid:
+        q = QuenchMonitor(args.npoints or window_points(XKID_SAMPLE_INTERVAL), key=XKID_CURRENT_KEY,
+                          max_deramp_rate=XKID_MAX_DERAMP_RATE)
+    else:
+        q = QuenchMonitor(args.npoints or window_points(SAMPLE_INTERVAL))
+
+    log = getLogger('quenchAgent')
+    log.debug('Starting quench monitoring')
+
+    try:
+        if args.poll:
+            poll(q, log)
+        else:
+            watch(q, log)
+    except RedisError as e:
+        log.critical(f"Redis server error! {e}")
@@ -111,7 +111,7 @@ if __name__ == "__main__":
     # ---------------------------------- MAIN OPERATION (The eternal loop) BELOW HERE ----------------------------------
     def callback(t, r, v):
         d = {k: x for k, x in zip((TEMP_KEY, RES_KEY, OUTPUT_VOLTAGE_KEY), (t, r, v)) if x}
-        redis.store(d, timeseries=True)
+        redis.store(d, timeseries=True, batch=True)
     sim.monitor(QUERY_INTERVAL, (sim.temp, sim.resistance, sim.output_voltage), value_callback=callback)
 
     while True:
@@ -99,7 +99,7 @@ def monitor_callback(iv, ov, oc):
     d = {k: v for k, v in zip((INPUT_VOLTAGE_KEY, OUTPUT_VOLTAGE_KEY, MAGNET_CURRENT_KEY), (iv, ov, oc))
          if v is not None}  # NB 'if is not None' - > so we don't store bad data
     try:
-        redis.store(d, timeseries=True)
+        redis.store(d, timeseries=True, batch=True)
     except RedisError:
         getLogger(__name__).warning('Storing magnet status to redis failed')
 
@@ -150,7 +150,13 @@ class MagnetController(LockedMachine):
     BLOCKS = defaultdict(set)  # This holds the sim960 commands that are blocked out in a given state i.e.
                                #  'regulating':('device-settings:sim960:setpoint-mode',)
 
-    def __init__(self, statefile='./magnetstate.txt'):
+    def __init__(self, statefile='./magnetstate.txt', sim=None, clock=time.time, timer=threading.Timer, start=True):
+        """
+        sim is the SIM960 to control, by default the one at DEVICE (monitored into redis). clock (returning UNIX time)
+        and timer (with the signature of threading.Timer) may be replaced to run the controller in simulated time, see
+        mkidcontrol.simulators.magnetcycle. With start=False the main loop is not started and the controller only
+        moves on when tick() is called.
+        """
         transitions = [
             #Allow aborting from any point, trigger will always succeed
             {'trigger': 'abort', 'source': '*', 'dest': 'deramping'},
@@ -236,14 +242,17 @@ class MagnetController(LockedMachine):
                   # Entering ramping MUST succeed
                   State('deramping', on_enter='record_entry'))
 
-        sim = SIM960(port=DEVICE, baudrate=9600, timeout=0.1, initializer=self.initialize_sim)
-        # NB If the settings are manufacturer defaults then the sim960 had a major upset, generally initialize_sim
-        # will not be called
+        if sim is None:
+            sim = SIM960(port=DEVICE, baudrate=9600, timeout=0.1, initializer=self.initialize_sim)
+            # NB If the settings are manufacturer defaults then the sim960 had a major upset, generally initialize_sim
+            # will not be called
 
-        # Kick off a thread to run forever and just log data into redis
-        sim.monitor(QUERY_INTERVAL, (sim.input_voltage, sim.output_voltage, sim.setpoint),
-                    value_callback=monitor_callback)
+            # Kick off a thread to run forever and just log data into redis
+            sim.monitor(QUERY_INTERVAL, (sim.input_voltage, sim.output_voltage, sim.setpoint),
+                        value_callback=monitor_callback)
 
+        self.clock = clock
+        self.timer = timer
         self.statefile = statefile
         self.sim = sim
         self.lock = threading.RLock()
@@ -252,7 +261,7 @@ class MagnetController(LockedMachine):
         self._mainthread = None
 
         initial = compute_initial_state(self.sim, self.statefile)
-        self.state_entry_time = {initial: time.time()}
+        self.state_entry_time = {initial: self.clock()}
         LockedMachine.__init__(self, transitions=transitions, initial=initial, states=states, machine_context=self.lock,
                                send_event=True)
 
@@ -260,7 +269,8 @@ class MagnetController(LockedMachine):
             self.firmware_pull()
             self.set_redis_settings(init_blocked=False)  #allow IO and Redis errors to shut things down.
 
-        self.start_main()
+        if start:
+            self.start_main()
 
     def initialize_sim(self):
         """
@@ -326,11 +336,15 @@ class MagnetController(LockedMachine):
         self._mainthread.daemon = True
         self._mainthread.start()
 
+    def tick(self):
+        """ Run one iteration of the main loop """
+        self.next()
+        getLogger(__name__).debug(f"Magnet state is: {self.state}")
+
     def _main(self):
         while self._run:
             try:
-                self.next()
-                getLogger(__name__).debug(f"Magnet state is: {self.state}")
+                self.tick()
             except IOError:
                 getLogger(__name__).info(exc_info=True)
             except MachineError:
@@ -357,7 +371,7 @@ class MagnetController(LockedMachine):
         if current_state in ('ramping', 'off', 'hs_closing'):
             time_to_cool = ((soak_current - current_current) / ramp_rate) + soak_time + ((0 - soak_current) / deramp_rate)
         if current_state in ('soaking', 'hs_opening'):
-            time_to_cool = (time.time() - self.state_entry_time['soaking']) + ((0 - soak_current) / deramp_rate)
+            time_to_cool = (self.clock() - self.state_entry_time['soaking']) + ((0 - soak_current) / deramp_rate)
         if current_state in ('cooling', 'deramping'):
             time_to_cool = -1 * current_current / deramp_rate
 
@@ -369,7 +383,7 @@ class MagnetController(LockedMachine):
         if self.state not in ('off', 'deramping'):
             raise ValueError(f'Cooldown in progress, abort before scheduling.')
 
-        now = datetime.now()
+        now = datetime.fromtimestamp(self.clock())
         time_needed = self.min_time_until_cool
 
         if time < now + time_needed:
@@ -377,7 +391,7 @@ class MagnetController(LockedMachine):
 
         self.cancel_scheduled_cooldown()
         redis.store({COOLDOWN_SCHEDULED_KEY: 'no'})
-        t = threading.Timer((time - time_needed - now).seconds, self.start) # TODO (For JB): self.start?
+        t = self.timer((time - time_needed - now).seconds, self.start) # TODO (For JB): self.start?
         self.scheduled_cooldown = (time - time_needed, t)
         redis.store({COOLDOWN_SCHEDULED_KEY: 'yes'})
         t.daemon = True
@@ -507,7 +521,7 @@ class MagnetController(LockedMachine):
 
     def soak_time_expired(self, event):
         try:
-            return (time.time() - self.state_entry_time['soaking']) >= float(redis.read(SOAK_TIME_KEY))
+            return (self.clock() - self.state_entry_time['soaking']) >= float(redis.read(SOAK_TIME_KEY))
         except RedisError:
             return False
 
@@ -569,7 +583,7 @@ class MagnetController(LockedMachine):
             self.sim.send(cmd.sim_string)
 
     def record_entry(self, event):
-        self.state_entry_time[self.state] = time.time()
+        self.state_entry_time[self.state] = self.clock()
         redis.store({MAGNET_STATE_KEY: self.state})
         write_persisted_state(self.statefile, self.state)
 
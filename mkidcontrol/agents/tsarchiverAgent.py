@@ -0,0 +1,102 @@
+"""
+Program for keeping a long-term record of the redis timeseries.
+
+Redis only retains REDIS_TS_RETENTION of raw samples for each key in REDIS_TS_KEYS. Every ARCHIVE_INTERVAL seconds
+this agent copies all samples newer than the last archived one into the TSArchive (see mkidcontrol/tsarchive.py) at
+the path in the redis key paths:ts-archive-dir. Once a day is over its many small chunks are consolidated into a
+single file per key.
+
+Query the archive together with live redis using MKIDRedis.range_archived.
+"""
+
+import os
+import sys
+import time
+import logging
+
+from mkidcontrol.mkidredis import RedisError, TS_ARCHIVE_DIR_KEY
+import mkidcontrol.mkidredis as redis
+import mkidcontrol.util as util
+from mkidcontrol.tsarchive import TSArchive, utc_day
+from mkidcontrol.config import REDIS_TS_KEYS, REDIS_TS_RETENTION
+
+DEFAULT_ARCHIVE_DIR = '/home/kids/tsarchive'
+ARCHIVE_INTERVAL = 5 * 60  # Seconds, must be well under REDIS_TS_RETENTION
+SETTLE_MS = 10 * 1000  # Samples younger than this are left for the next pass, in case any are still being written
+
+log = logging.getLogger('tsarchiverAgent')
+
+
+def archive_new_samples(archive, last_archived):
+    """
+    Copy every sample of REDIS_TS_KEYS newer than last_archived[key] (and older than SETTLE_MS) from redis to the
+    archive, updating last_archived. Returns the number of samples archived.
+    """
+    end = int(time.time() * 1000) - SETTLE_MS
+    if any(last_archived.get(k) is None for k in REDIS_TS_KEYS):
+        start = None
+    else:
+        start = min(last_archived.values()) + 1
+    data = redis.range_many(REDIS_TS_KEYS, start, end)
+
+    n = 0
+    for k, (t, v) in data.items():
+        last = last_archived.get(k)
+        if last is not None:
+            keep = t > last
+            t, v = t[keep], v[keep]
+        if not t.size:
+            continue
+        if last is not None and t[0] - last > REDIS_TS_RETENTION:
+            log.warning(f"{k} may have samples missing from the archive between {last} and {int(t[0])}")
+        n += archive.write(k, t, v)
+        last_archived[k] = int(t[-1])
+    return n
+
+
+def consolidate_finished_days(archive):
+    """ Merge the chunks of every day before today into one file per key and day """
+    today = utc_day(time.time() * 1000)
+    for k in archive.keys():
+        for day in archive.days(k):
+            if day < today:
+                archive.consolidate(k, day)
+
+
+if __name__ == "__main__":
+
+    util.setup_logging('tsarchiverAgent')
+    redis.setup_redis(ts_keys=REDIS_TS_KEYS)
+
+    try:
+        path = redis.read(TS_ARCHIVE_DIR_KEY, error_missing=False)
+        if not path:
+            path = DEFAULT_ARCHIVE_DIR
+            redis.store({TS_ARCHIVE_DIR_KEY: path})
+    except RedisError as e:
+        log.critical(f"Redis server error! {e}")
+        sys.exit(1)
+    os.makedirs(path, exist_ok=True)
+    archive = TSArchive(path)
+    log.info(f"Archiving {len(REDIS_TS_KEYS)} timeseries keys to {path}")
+
+    last_archived = {k: archive.last_timestamp(k) for k in REDIS_TS_KEYS}
+    consolidated_day = None
+    while True:
+        try:
+            n = archive_new_samples(archive, last_archived)
+            log.debug(f"Archived {n} samples")
+        except RedisError as e:
+            log.critical(f"Redis server error! {e}")
+            sys.exit(1)
+        except OSError as e:
+            log.error(f"Unable to write to the archive at {path}: {e}")
+
+        today = utc_day(time.time() * 1000)
+        if today != consolidated_day:
+            try:
+                consolidate_finished_days(archive)
+                consolidated_day = today
+            except OSError as e:
+                log.error(f"Unable to consolidate the archive at {path}: {e}")
+        time.sleep(ARCHIVE_INTERVAL)
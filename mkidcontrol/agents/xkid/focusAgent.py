@@ -95,14 +95,15 @@ def callback(pos):
         if all(i is None for i in vals):
             redis.store({STATUS_KEY: "Error"})
         else:
-            redis.store(d, timeseries=True)
-            redis.store({STATUS_KEY: "OK"})
+            redis.store_batch(data={STATUS_KEY: "OK"}, ts_data=d)
     except RedisError:
         log.warning('Storing filter wheel data to redis failed!')
 
 
 if __name__ == "__main__":
-    redis.setup_redis(ts_keys=TS_KEYS)
+    from mkidcontrol.config import REDIS_SCHEMA  # Not at the top, config imports this module for its TS_KEYS
+
+    redis.setup_redis(ts_keys=TS_KEYS, store_policies=REDIS_SCHEMA['store_policies'])
     util.setup_logging('focusAgent')
 
     try:
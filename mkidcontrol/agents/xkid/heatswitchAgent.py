@@ -78,9 +78,8 @@ def monitor_callback(mpos, mstate):
             # N.B. If there is an error on the query, the value passed is None
             redis.store({STATUS_KEY: "Error"})
         else:
-            redis.store(timeseries_d, timeseries=True)
-            redis.store(d)
-            redis.store({STATUS_KEY: "OK"})
+            d[STATUS_KEY] = "OK"
+            redis.store_batch(data=d, ts_data=timeseries_d)
     except RedisError:
         log.warning('Storing motor position to redis failed')
 
@@ -119,7 +118,9 @@ def compute_initial_state(heatswitch):
 
 if __name__ == "__main__":
 
-    redis.setup_redis(ts_keys=TS_KEYS)
+    from mkidcontrol.config import REDIS_SCHEMA  # Not at the top, config imports this module for its TS_KEYS
+
+    redis.setup_redis(ts_keys=TS_KEYS, store_policies=REDIS_SCHEMA['store_policies'])
     util.setup_logging('heatswitchAgent')
 
     try:
@@ -138,7 +139,8 @@ if __name__ == "__main__":
 
     try:
         while True:
-            for key, val in redis.listen(COMMAND_KEYS):
+            for command in redis.listen_commands('heatswitch', COMMAND_KEYS):
+                key, val = command
 
                 log.debug(f"HeatswitchAgent received {key}, {val}.")
                 key = key.removeprefix('command:')
@@ -147,6 +149,7 @@ if __name__ == "__main__":
                         cmd = LakeShoreCommand(key, val)
                     except ValueError as e:
                         log.warning(f"Ignoring invalid command ('{key}={val}'): {e}")
+                        command.fail(e)
                         continue
                     try:
                         log.info(f"Processing command '{cmd}'")
@@ -155,6 +158,7 @@ if __name__ == "__main__":
                             if current_pos.lower() in ['opening', 'closing']:
                                 # N.B. Don't try to reverse motion while the heatswitch is opening/closing
                                 log.warning(f"Trying to send command {val} while heatswitch is {current_pos}. Command ignored!")
+                                command.fail(f"Heatswitch is {current_pos}")
                             else:
                                 log.info(f"Commanding heatswitch to {val} from heatswitch {current_pos}")
                                 if val.lower() == "open":
@@ -174,6 +178,7 @@ if __name__ == "__main__":
                     except IOError as e:
                         redis.store({STATUS_KEY: f"Error {e}"})
                         log.error(f"Comm error: {e}")
+                        command.fail(e)
     except RedisError as e:
         log.error(f"Redis server error! {e}")
         sys.exit(1)
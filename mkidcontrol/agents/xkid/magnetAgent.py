@@ -12,6 +12,7 @@ It will run even with no lakeshore/heatswitch/etc., although it will not allow a
 
 import sys
 import time
+import queue
 import logging
 import threading
 from datetime import datetime, timedelta
@@ -21,7 +22,7 @@ from transitions import MachineError, State
 from transitions.extensions import LockedMachine, LockedGraphMachine
 import pkg_resources
 
-from mkidcontrol.devices import write_persisted_state, load_persisted_state
+from mkidcontrol.devices import write_persisted_state, load_persisted_state, HeatswitchPosition
 from mkidcontrol.mkidredis import RedisError
 import mkidcontrol.util as util
 import mkidcontrol.mkidredis as redis
@@ -60,7 +61,7 @@ CONTROLLER_STATUS_KEY = 'status:magnet:status'
 
 TS_KEYS = (MAGNET_CURRENT_KEY, MAGNET_FIELD_KEY)
 
-COMMAND_KEYS = [f"command:{k}" for k in MAGNET_COMMAND_KEYS + SETTING_KEYS]
+COMMAND_KEYS = [f"command:{k}" for k in MAGNET_COMMAND_KEYS + SETTING_KEYS + (QUENCH_KEY,)]
 
 DEVICE_TEMP_KEY = 'status:temps:device-stage:temp'
 REGULATION_TEMP_KEY = "device-settings:magnet:regulating-temp"
@@ -73,6 +74,87 @@ class StateError(Exception):
     pass
 
 
+class MagnetSnapshot:
+    """
+    The redis state the MagnetController's conditions and status depend on, read in one batched round trip per tick
+    so that every decision of a tick sees the same values. A key that could not be read raises RedisError when used,
+    as reading it on its own would have.
+    """
+    KEYS = (MAGNET_CURRENT_KEY, ls625.DESIRED_CURRENT_KEY, SOAK_CURRENT_KEY, SOAK_TIME_KEY, RAMP_RATE_KEY,
+            DERAMP_RATE_KEY, DEVICE_TEMP_KEY, REGULATION_TEMP_KEY, IMPOSE_UPPER_LIMIT_ON_REGULATION_KEY,
+            heatswitch.HEATSWITCH_POSITION_KEY, ls372.OUTPUT_MODE_KEY, ls372.OUTPUT_RANGE_KEY)
+
+    def __init__(self, values, taken=None):
+        self.values = values
+        self.taken = time.time() if taken is None else taken
+
+    @classmethod
+    def read(cls, clock=time.time):
+        return cls(redis.read(list(cls.KEYS), error_missing=False), taken=clock())
+
+    def get(self, key):
+        value = self.values.get(key)
+        if value is None:
+            raise RedisError(f"{key} could not be read from redis")
+        return value[1] if isinstance(value, tuple) else value
+
+    def timestamp(self, key):
+        """ The UNIX time in ms of the sample read of timeseries key """
+        value = self.values.get(key)
+        if not isinstance(value, tuple):
+            raise RedisError(f"No sample of {key} could be read from redis")
+        return value[0]
+
+    @property
+    def current(self):
+        return float(self.get(MAGNET_CURRENT_KEY))
+
+    @property
+    def desired_current(self):
+        return float(self.get(ls625.DESIRED_CURRENT_KEY))
+
+    @property
+    def soak_current(self):
+        return float(self.get(SOAK_CURRENT_KEY))
+
+    @property
+    def soak_time(self):
+        """ In seconds, it is stored in minutes """
+        return float(self.get(SOAK_TIME_KEY)) * 60
+
+    @property
+    def ramp_rate(self):
+        return float(self.get(RAMP_RATE_KEY))
+
+    @property
+    def deramp_rate(self):
+        """ Negative, it is stored as a positive number """
+        return -1 * float(self.get(DERAMP_RATE_KEY))
+
+    @property
+    def device_temp(self):
+        return float(self.get(DEVICE_TEMP_KEY))
+
+    @property
+    def regulation_temp(self):
+        return float(self.get(REGULATION_TEMP_KEY))
+
+    @property
+    def upper_limit_enforced(self):
+        return self.values.get(IMPOSE_UPPER_LIMIT_ON_REGULATION_KEY) == "on"
+
+    @property
+    def heatswitch_closed(self):
+        """ As heatswitch.is_closed() """
+        return self.values.get(heatswitch.HEATSWITCH_POSITION_KEY) == HeatswitchPosition.CLOSED
+
+    @property
+    def ls372_in_pid(self):
+        """ As ls372.in_pid_output() """
+        return (self.values.get(ls372.OUTPUT_MODE_KEY) == "Closed Loop" and
+                self.values.get(ls372.OUTPUT_RANGE_KEY) != '0')
+
+
 def compute_initial_state(statefile):
     # TODO: Check legality and test logic
     initial_state = 'deramping'  # always safe to start here
@@ -175,11 +257,21 @@ def compute_initial_state(statefile):
 # mach = LockedGraphMachine(model=m, transitions=t, states=s)
 
 class MagnetController(LockedMachine):
+    # The main loop runs next() whenever one of WATCHED_KEYS changes (changes within SETTLE_TIME of one another are
+    # taken together), when woken (commands, entering a state) and failing that every LOOP_INTERVAL as a watchdog
     LOOP_INTERVAL = 1
+    SETTLE_TIME = 0.05
+    WATCHED_KEYS = (MAGNET_CURRENT_KEY, DEVICE_TEMP_KEY, ls625.DESIRED_CURRENT_KEY, heatswitch.HEATSWITCH_POSITION_KEY,
+                    ls372.OUTPUT_MODE_KEY, ls372.OUTPUT_RANGE_KEY)
     BLOCKS = defaultdict(set)  # This holds the ls625 commands that are blocked out in a given state
     MAX_CURRENT = 9.44  # Amps
 
-    def __init__(self, statefile='./magnetstate.txt'):
+    def __init__(self, statefile='./magnetstate.txt', clock=time.time, timer=threading.Timer, start=True):
+        """
+        clock (returning UNIX time) and timer (with the signature of threading.Timer, used for scheduled cooldowns) may
+        be replaced to run the controller in simulated time, see mkidcontrol.simulators.magnetcycle. With start=False
+        the main loop is not started and the controller only moves on when tick() is called.
+        """
         transitions = [
             # Allow aborting from any point, trigger will always succeed
             {'trigger': 'abort', 'source': '*', 'dest': 'start_deramping'},
@@ -200,6 +292,8 @@ class MagnetController(LockedMachine):
             {'trigger': 'next', 'source': 'hs_closing', 'dest': 'start_ramping', 'conditions': 'heatswitch_closed'},
             {'trigger': 'next', 'source': 'hs_closing', 'dest': None, 'prepare': 'close_heatswitch'},
 
+            # the ramp is commanded on entering start_ramping (and again while it has yet to show), as a steady current
+            # passes ramp_ok
             {'trigger': 'next', 'source': 'start_ramping', 'dest': None, 'before': 'begin_ramp_up', 'unless': 'ramp_ok'},
             {'trigger': 'next', 'source': 'start_ramping', 'dest': 'ramping', 'conditions': 'ramp_ok'},
 
@@ -231,7 +325,8 @@ class MagnetController(LockedMachine):
             {'trigger': 'next', 'source': 'hs_opening', 'dest': None,
              'prepare': ('open_heatswitch', 'ls372_to_pid')},
 
-            {'trigger': 'next', 'source': 'start_cooling', 'dest': None, 'before': 'begin_ramp_down'},
+            {'trigger': 'next', 'source': 'start_cooling', 'dest': None, 'before': 'begin_ramp_down',
+             'unless': 'deramp_ok'},
             {'trigger': 'next', 'source': 'start_cooling', 'dest': 'cooling', 'conditions': 'deramp_ok'},
 
             # stay in cooling, decreasing the current a bit until the device is regulatable
@@ -252,7 +347,8 @@ class MagnetController(LockedMachine):
              'conditions': ('device_regulatable', 'ls372_in_pid')},
             {'trigger': 'next', 'source': 'regulating', 'dest': 'start_deramping'},
 
-            {'trigger': 'next', 'source': 'start_deramping', 'dest': None, 'prepare': 'begin_ramp_down'},
+            {'trigger': 'next', 'source': 'start_deramping', 'dest': None, 'prepare': 'begin_ramp_down',
+             'unless': 'deramp_ok'},
             {'trigger': 'next', 'source': 'start_deramping', 'dest': 'deramping', 'conditions': 'deramp_ok'},
 
             # stay in deramping, trying to decrement the current, until the device is off then move to off
@@ -270,18 +366,23 @@ class MagnetController(LockedMachine):
         states = (  # Entering off MUST succeed
             State('off', on_enter=['record_entry', 'kill_current']),
             State('hs_closing', on_enter='record_entry'),
-            State('start_ramping', on_enter='record_entry'),
+            State('start_ramping', on_enter=['record_entry', 'begin_ramp_up']),
             State('ramping', on_enter='record_entry'),
             State('soaking', on_enter='record_entry'),
             State('hs_opening', on_enter='record_entry'),
-            State('start_cooling', on_enter='record_entry'),
+            State('start_cooling', on_enter=['record_entry', 'begin_ramp_down']),
             State('cooling', on_enter='record_entry'),
             State('regulating', on_enter='record_entry'),
-            State('start_deramping', on_enter='record_entry'),
+            State('start_deramping', on_enter=['record_entry', 'begin_ramp_down']),
             # Entering ramping MUST succeed
             State('deramping', on_enter='record_entry'))
 
+        self.clock = clock
+        self.timer = timer
         self.last_5_currents = []
+        self._last_current_time = None  # The timestamp of the newest sample in last_5_currents
+        self._snapshot = None
+        self._listener = None
         self.statefile = statefile
         self.lock = threading.RLock()
         self.scheduled_cooldown = None
@@ -289,11 +390,12 @@ class MagnetController(LockedMachine):
         self._mainthread = None
 
         initial = compute_initial_state(self.statefile)
-        self.state_entry_time = {initial: time.time()}
+        self.state_entry_time = {initial: self.clock()}
         LockedMachine.__init__(self, transitions=transitions, initial=initial, states=states, machine_context=self.lock,
                                send_event=True)
 
-        self.start_main()
+        if start:
+            self.start_main()
 
     def start_main(self):
         self._run = True  # Set to false to kill the m
@@ -301,20 +403,79 @@ class MagnetController(LockedMachine):
         self._mainthread.daemon = True
         self._mainthread.start()
 
+    @property
+    def snapshot(self):
+        """ The MagnetSnapshot of the current tick of the main loop (read now if the loop has yet to take one) """
+        if self._snapshot is None:
+            self._snapshot = MagnetSnapshot.read(self.clock)
+        return self._snapshot
+
+    def wake(self):
+        """ Have the main loop run next() now rather than at the next change or watchdog tick """
+        listener = self._listener
+        if listener is not None:
+            listener.wake()
+
+    def _wait(self, listener):
+        """
+        Wait for a change to one of WATCHED_KEYS, a wake() or LOOP_INTERVAL to pass, gathering any further changes
+        within SETTLE_TIME of the first. Returns a dict of the number of changes of each key.
+        """
+        changes = defaultdict(int)
+        timeout = self.LOOP_INTERVAL
+        deadline = None
+        while timeout > 0:
+            try:
+                channel, event = listener.get(timeout=timeout)
+            except queue.Empty:
+                break
+            if channel is not None:
+                changes[channel.partition('__:')[2]] += 1
+            if deadline is None:
+                deadline = time.monotonic() + self.SETTLE_TIME
+            timeout = deadline - time.monotonic()
+        return changes
+
+    def _record_currents(self, n_samples):
+        """
+        Add the magnet current samples taken since the last tick (n_samples were reported) to last_5_currents. A tick
+        without a new sample adds nothing and if several arrived they are all fetched.
+        """
+        latest = self._snapshot.timestamp(MAGNET_CURRENT_KEY)
+        if latest == self._last_current_time:
+            return
+        if n_samples > 1 and self._last_current_time is not None:
+            samples = [v for t, v in redis.mkr_range(MAGNET_CURRENT_KEY, start=self._last_current_time + 1,
+                                                     end=latest) if t is not None]
+        else:
+            samples = [self._snapshot.current]
+        self.last_5_currents = (self.last_5_currents + samples)[-5:]
+        self._last_current_time = latest
+
+    def tick(self, changes=None):
+        """
+        Run one iteration of the main loop: read the snapshot, record any new current samples and run next(). changes
+        is the number of changes of each key since the last tick (see _wait), if known.
+        """
+        self._snapshot = MagnetSnapshot.read(self.clock)
+        self._record_currents((changes or {}).get(MAGNET_CURRENT_KEY, 0))
+        self.next()
+        log.debug(f"Magnet state is: {self.state}")
+
     def _main(self):
         while self._run:
             try:
-                self.last_5_currents.append(float(redis.read(MAGNET_CURRENT_KEY)[1]))
-                self.last_5_currents = self.last_5_currents[-5:]
-                self.next()
-                log.debug(f"Magnet state is: {self.state}")
+                if self._listener is None or self._listener.closed:
+                    self._listener = redis.watch_keys(self.WATCHED_KEYS)
+                self.tick(self._wait(self._listener))
             except IOError:
-                log.info(exc_info=True)
+                log.info("IOError in magnet main loop", exc_info=True)
+                time.sleep(self.LOOP_INTERVAL)
             except MachineError:
-                log.info(exc_info=True)
+                log.info("MachineError in magnet main loop", exc_info=True)
+                time.sleep(self.LOOP_INTERVAL)
             except RedisError:
-                log.info(exc_info=True)
-            finally:
+                log.info("RedisError in magnet main loop", exc_info=True)
                 time.sleep(self.LOOP_INTERVAL)
 
     @property
@@ -322,11 +483,12 @@ class MagnetController(LockedMachine):
         """
         return an estimate of the time to cool from the current state
         """
-        soak_current = float(redis.read(SOAK_CURRENT_KEY))
-        soak_time = float(redis.read(SOAK_TIME_KEY)) * 60  # Soak time stored in minues, must be in seconds
-        ramp_rate = float(redis.read(RAMP_RATE_KEY))
-        deramp_rate = -1 * float(redis.read(DERAMP_RATE_KEY))  # Deramp rate is stored as a POSITIVE number
-        current_current = self.last_5_currents[-1]
+        snapshot = self.snapshot
+        soak_current = snapshot.soak_current
+        soak_time = snapshot.soak_time
+        ramp_rate = snapshot.ramp_rate
+        deramp_rate = snapshot.deramp_rate
+        current_current = snapshot.current
         current_state = self.state  # NB: If current_state is regulating time_to_cool will return 0 since it is already cool.
 
         time_to_cool = 0
@@ -334,7 +496,7 @@ class MagnetController(LockedMachine):
             time_to_cool = ((soak_current - current_current) / ramp_rate) + soak_time + (
                     (0 - soak_current) / deramp_rate)
         if current_state in ('soaking', 'hs_opening'):
-            time_to_cool = (time.time() - self.state_entry_time['soaking']) + ((0 - soak_current) / deramp_rate)
+            time_to_cool = (snapshot.taken - self.state_entry_time['soaking']) + ((0 - soak_current) / deramp_rate)
         if current_state in ('cooling', 'deramping', 'start_cooling', 'start_deramping'):
             time_to_cool = -1 * current_current / deramp_rate
 
@@ -346,7 +508,7 @@ class MagnetController(LockedMachine):
         if self.state not in ('off', 'deramping'):
             raise ValueError(f'Cooldown in progress, abort before scheduling.')
 
-        now = datetime.now()
+        now = datetime.fromtimestamp(self.clock())
         time_needed = self.min_time_until_cool
 
         if time < now + time_needed:
@@ -356,7 +518,7 @@ class MagnetController(LockedMachine):
         self.cancel_scheduled_cooldown()
         redis.store({COOLDOWN_SCHEDULED_KEY: 'no'})
         redis.store({SCHEDULED_COOLDOWN_TIMESTAMP_KEY: ''})
-        t = threading.Timer((time - time_needed - now).seconds, self.start)  # TODO (For JB): self.start?
+        t = self.timer((time - time_needed - now).seconds, self.start)  # TODO (For JB): self.start?
         self.scheduled_cooldown = (time - time_needed, t)
 
         redis.store({COOLDOWN_SCHEDULED_KEY: 'yes'})
@@ -399,15 +561,14 @@ class MagnetController(LockedMachine):
             # return redis.read('device-settings:ls625:control-mode') == "Sum" and \
             #        float(redis.read('device-settings:ls625:desired-current')) == 0.0 and \
             #        abs(float(redis.read(MAGNET_CURRENT_KEY)[1])) <= 0.005
-            return float(redis.read('device-settings:ls625:desired-current')) == 0.0 and \
-                   abs(float(redis.read(MAGNET_CURRENT_KEY)[1])) <= 0.005
+            return self.snapshot.desired_current == 0.0 and abs(self.snapshot.current) <= 0.005
         except IOError:
             return False
 
     def heatswitch_closed(self, event):
         """return true iff heatswitch is closed"""
         try:
-            return heatswitch.is_closed()
+            return self.snapshot.heatswitch_closed
         except RedisError:
             return False
 
@@ -432,7 +593,7 @@ class MagnetController(LockedMachine):
 
     def ls372_in_pid(self, event):
         try:
-            return ls372.in_pid_output()
+            return self.snapshot.ls372_in_pid
         except RedisError:
             return False
 
@@ -445,7 +606,7 @@ class MagnetController(LockedMachine):
     def begin_ramp_up(self, event):
         soak_current = None
         try:
-            soak_current = abs(float(redis.read(SOAK_CURRENT_KEY)))
+            soak_current = abs(self.snapshot.soak_current)
         except RedisError:
             log.warning(f"Unable to pull {SOAK_CURRENT_KEY}, using default value of {self.MAX_CURRENT}")
 
@@ -454,7 +615,7 @@ class MagnetController(LockedMachine):
                 ls625.start_ramp_up(soak_current)
             else:
                 ls625.start_ramp_up()
-        except Exception:
+        except Exception as e:
             log.warning(f"Cycle could not be started! {e}")
 
     def begin_ramp_down(self, event):
@@ -487,14 +648,14 @@ class MagnetController(LockedMachine):
 
     def soak_time_expired(self, event):
         try:
-            return (time.time() - self.state_entry_time['soaking']) >= (float(redis.read(SOAK_TIME_KEY)) * 60)
+            return (self.snapshot.taken - self.state_entry_time['soaking']) >= self.snapshot.soak_time
         except RedisError:
             return False
 
     def current_ready_to_soak(self, event):
         try:
-            current = float(redis.read(MAGNET_CURRENT_KEY)[1])
-            soak_current = float(redis.read(SOAK_CURRENT_KEY))
+            current = self.snapshot.current
+            soak_current = self.snapshot.soak_current
             diff = (current - soak_current) / soak_current
             return abs(diff) <= 0.04 or (current >= soak_current)
         except RedisError:
@@ -502,8 +663,8 @@ class MagnetController(LockedMachine):
 
     def current_at_soak(self, event):
         try:
-            current = float(redis.read(MAGNET_CURRENT_KEY)[1])
-            soak_current = float(redis.read(SOAK_CURRENT_KEY))
+            current = self.snapshot.current
+            soak_current = self.snapshot.soak_current
             diff = (current - soak_current) / soak_current
             return abs(diff) <= 0.04 or (current >= soak_current)
         except RedisError:
@@ -511,7 +672,7 @@ class MagnetController(LockedMachine):
 
     def device_ready_for_regulate(self, event):
         try:
-            return float(redis.read(DEVICE_TEMP_KEY)[1]) <= float(redis.read(REGULATION_TEMP_KEY))
+            return self.snapshot.device_temp <= self.snapshot.regulation_temp
         except RedisError:
             return False
 
@@ -522,10 +683,9 @@ class MagnetController(LockedMachine):
         NOTE: enforce_upper_limit is controlled by an ENGINEERING KEY that must be changed DIRECTLY IN REDIS. It cannot
          be commanded and must be manually changed
         """
-        enforce_upper_limit = redis.read(IMPOSE_UPPER_LIMIT_ON_REGULATION_KEY)
-        if enforce_upper_limit == "on":
+        if self.snapshot.upper_limit_enforced:
             try:
-                return float(redis.read(DEVICE_TEMP_KEY)[1]) <= MAX_REGULATE_TEMP
+                return self.snapshot.device_temp <= MAX_REGULATE_TEMP
             except RedisError:
                 return False
         else:
@@ -540,14 +700,17 @@ class MagnetController(LockedMachine):
             return False
 
     def record_entry(self, event):
-        self.state_entry_time[self.state] = time.time()
+        self.state_entry_time[self.state] = self.clock()
         redis.store({MAGNET_STATE_KEY: self.state.replace('_', ' ')})
         write_persisted_state(self.statefile, self.state)
+        self.wake()
 
 
 if __name__ == "__main__":
     util.setup_logging('magnetAgent')
-    redis.setup_redis(ts_keys=TS_KEYS)
+    # The state machine rereads device settings every loop, they change only a few times a night
+    # The device temperature is a timeseries of the lakeshore372Agent's, read along with the magnet's own
+    redis.setup_redis(ts_keys=TS_KEYS + (DEVICE_TEMP_KEY,), cache_prefixes=('device-settings:',))
     # MAX_REGULATE_TEMP = 1.50 * float(redis.read(REGULATION_TEMP_KEY))
     MAX_REGULATE_TEMP = np.inf
 
@@ -563,7 +726,8 @@ if __name__ == "__main__":
     # main loop, listen for commands and handle them
     try:
         while True:
-            for key, val in redis.listen(COMMAND_KEYS):
+            for command in redis.listen_commands('magnet', COMMAND_KEYS):
+                key, val = command
                 log.debug(f"Redis listened to something! Key: {key} -- Val: {val}")
                 key = key.removeprefix('command:')
                 if key in SETTING_KEYS:
@@ -571,10 +735,11 @@ if __name__ == "__main__":
                         log.debug(f"Setting {key} -> {val}")
                         cmd = LakeShoreCommand(key, val)
                         redis.store({key: val})
-                    except (IOError, StateError):
-                        pass
-                    except ValueError:
+                    except (IOError, StateError) as e:
+                        command.fail(e)
+                    except ValueError as e:
                         log.warning(f"Ignoring invalid command ('{key}={val}'): {e}")
+                        command.fail(e)
                 # NB I'm disinclined to include forced state overrides but they would go here
                 elif key == REGULATION_TEMP_KEY:
                     MAX_REGULATE_TEMP = 1.50 * float(redis.read(REGULATION_TEMP_KEY))
@@ -593,11 +758,13 @@ if __name__ == "__main__":
                         redis.store({SCHEDULED_COOLDOWN_TIMESTAMP_KEY: f"{time.timestamp()}"})
                     except ValueError as e:
                         log.error(e)
+                        command.fail(e)
                 elif key == COLD_NOW_CMD:
                     try:
                         controller.start()
-                    except MachineError:
+                    except MachineError as e:
                         log.info('Cooldown already in progress', exc_info=True)
+                        command.fail(e)
                 elif key == CANCEL_COOLDOWN_CMD:
                     try:
                         controller.cancel_scheduled_cooldown()
@@ -605,8 +772,11 @@ if __name__ == "__main__":
                         redis.store({SCHEDULED_COOLDOWN_TIMESTAMP_KEY: ""})
                     except Exception as e:
                         log.error(e)
+                        command.fail(e)
                 else:
                     log.info(f'Ignoring {key}:{val}')
+                    command.fail('Unknown command')
+                controller.wake()
                 redis.store({CONTROLLER_STATUS_KEY: controller.status})
 
     except RedisError as e:
@@ -17,6 +17,27 @@ REDIS_DB = 0
 
 REDIS_TS_RETENTION = 60 * 60 * 1000  # 60 min
 
+# Compaction rules (bucket ms, aggregation, retention ms) kept for every timeseries key so long windows can be plotted
+# without pulling every raw sample, see MKIDRedis.range(max_points=...)
+REDIS_TS_COMPACTIONS = ((60 * 1000, 'avg', 7 * 24 * 60 * 60 * 1000),  # 1 min, kept for 1 week
+                        (60 * 1000, 'min', 7 * 24 * 60 * 60 * 1000),
+                        (60 * 1000, 'max', 7 * 24 * 60 * 60 * 1000),
+                        (10 * 60 * 1000, 'avg', 30 * 24 * 60 * 60 * 1000))  # 10 min, kept for 30 days
+
+# Publishing policies (see mkidredis.StorePolicy) for telemetry that is mostly constant. A value is only written (and
+# published) when it changes by more than the deadband, and at least every max_interval seconds as a heartbeat.
+# Temperatures and the magnet current are deliberately absent, the control loops and quench detection want every sample.
+STATUS_HEARTBEAT = 60  # s
+REDIS_STORE_POLICIES = {'status:device:ls336:status': dict(max_interval=STATUS_HEARTBEAT),
+                        'status:device:ls372:status': dict(max_interval=STATUS_HEARTBEAT),
+                        'status:device:heatswitch:status': dict(max_interval=STATUS_HEARTBEAT),
+                        'status:device:heatswitch:position': dict(max_interval=STATUS_HEARTBEAT),
+                        'status:device:focus:status': dict(max_interval=STATUS_HEARTBEAT),
+                        'status:device:ls372:output-voltage': dict(deadband=1e-3, max_interval=STATUS_HEARTBEAT),
+                        'status:device:heatswitch:motor-position': dict(max_interval=STATUS_HEARTBEAT),
+                        'status:device:focus:position-mm': dict(deadband=1e-4, max_interval=STATUS_HEARTBEAT),
+                        'status:device:focus:position-encoder': dict(max_interval=STATUS_HEARTBEAT)}
+
 
 TS_KEYS = ('status:temps:50k-stage:temp', 'status:temps:50k-stage:voltage', 'status:temps:3k-stage:temp',
            'status:temps:3k-stage:voltage', 'status:temps:1k-stage:temp', 'status:temps:1k-stage:resistance',
@@ -64,6 +85,8 @@ FLASK_TCS_KEYS = ("tcs:airmass", "tcs:rotoff", "tcs:ra", "tcs:dec", "tcs:el", "t
 FLASK_KEYS = list(COMMAND_DICT.keys()) + list(REDIS_TS_KEYS) + list(REDIS_STATUS_KEYS)
 
 REDIS_SCHEMA = {'timeseries': {k: REDIS_TS_RETENTION for k in REDIS_TS_KEYS},
+                'compactions': {k: REDIS_TS_COMPACTIONS for k in REDIS_TS_KEYS},
+                'store_policies': REDIS_STORE_POLICIES,
                 'channels': (),
                 'keys': {'device-settings:ls336:input-channel-a:name': '',
                          'device-settings:ls336:input-channel-b:name': '',
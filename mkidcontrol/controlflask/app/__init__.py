@@ -20,7 +20,7 @@ import click
 import sys
 import numpy as np
 
-from mkidcontrol.config import REDIS_TS_KEYS
+from mkidcontrol.config import REDIS_TS_KEYS, REDIS_SCHEMA
 
 from mkidcontrol.config import Config
 
@@ -79,7 +79,7 @@ def create_app(config_class=Config, cliargs=None):
     bootstrap.init_app(app)
     moment.init_app(app)
     babel.init_app(app)
-    redis.setup_redis(ts_keys=REDIS_TS_KEYS)
+    redis.setup_redis(ts_keys=REDIS_TS_KEYS, ts_compactions=REDIS_SCHEMA['compactions'])
     app.redis = redis
 
     dashcfg = loadcfg(redis.read('gen2:dashboard-yaml'))
@@ -45,6 +45,7 @@ from mkidcontrol.controlflask.app.main.forms import *
 
 from mkidcontrol.agents.xkid.observingAgent import OBSERVING_EVENT_KEY, DATA_DIR_KEY
 from mkidcontrol.agents.xkid.conexAgent import CONEX_REF_X_KEY, CONEX_REF_Y_KEY, PIXEL_REF_X_KEY, PIXEL_REF_Y_KEY
+from mkidcontrol.devices import METRICS_KEY, METRICS_FLUSH_INTERVAL
 
 # TODO: ObsLog, ditherlog, dashboardlog
 
@@ -69,6 +70,9 @@ redis.setup_redis(ts_keys=REDIS_TS_KEYS)
 
 log = setup_logging('controlDirector')
 
+CHART_MAX_POINTS = 2000  # Charts are a few hundred pixels wide, more samples than this are just wasted bandwidth
+COMMAND_TIMEOUT = 5  # s, how long a form submission waits for the agent to apply the settings
+
 
 def guess_language(x):
     return 'en'
@@ -191,21 +195,43 @@ def log_viewer():
     return render_template('log_viewer.html', title=_('Log Viewer'), form=form)
 
 
+@bp.route('/device_metrics', methods=['GET'])
+def device_metrics():
+    """
+    Flask endpoint for the serial I/O metrics the agents store in redis (see mkidcontrol.devices.DeviceMetrics). Shows
+    each device's totals and round trip time histogram, and its commands by the time spent on them, for tuning poll
+    rates and finding the instruments that take up the most time.
+    """
+    devices = {}
+    keys = redis.redis_keys(METRICS_KEY.format(name='*', kind='io'))
+    for key in sorted(k.decode('utf-8') if isinstance(k, bytes) else k for k in keys):
+        name = key.split(':')[2]
+        try:
+            io = redis.read(key, decode_json=True)
+            commands = redis.read(METRICS_KEY.format(name=name, kind='commands'), decode_json=True)
+        except (KeyError, RedisError) as e:
+            log.warning(f"Unable to read the I/O metrics of {name}: {e}")
+            continue
+        devices[name] = {'io': io, 'commands': sorted(commands.items(), key=lambda c: -c[1]['total'])}
+    return render_template('device_metrics.html', title=_('Device I/O'), devices=devices,
+                           refresh=METRICS_FLUSH_INTERVAL)
+
+
 @bp.route('/heater/<device>/<channel>', methods=['GET', 'POST'])
 def heater(device, channel):
     if request.method == 'POST':
+        commands = []
         for key in request.form.keys():
             try:
                 x = LakeShoreCommand(
                     f"device-settings:{device}:heater-channel-{request.form.get('channel').lower()}:{key.replace('_', '-')}",
                     request.form.get(key))
                 log.info(f"Sending command:{x.setting}' -> {x.value} ")
-                msg_listeners = current_app.redis.publish(f"command:{x.setting}", x.value, store=False)
-                log.info(f"Command sent successfully, heard by {msg_listeners} listeners")
+                commands.append(current_app.redis.send_command(device, f"command:{x.setting}", x.value))
             except ValueError as e:
                 log.warning(f"Value error: {e} in parsing commands")
                 log.debug(f"Unrecognized field to send as command: {key}")
-            time.sleep(0.15)
+        wait_for_commands(commands)
 
     if device == "ls372":
         from mkidcontrol.controlflask.app.main.forms import OutputHeaterForm
@@ -236,18 +262,18 @@ def thermometry(device, channel, filter):
         return redirect(url_for('main.page_not_found'))
 
     if request.method == 'POST':
+        commands = []
         for key in request.form.keys():
             try:
                 x = LakeShoreCommand(
                     f"device-settings:{device}:input-channel-{request.form.get('channel').lower()}:{key.replace('_', '-')}",
                     request.form.get(key))
                 log.info(f"Sending command:{x.setting}' -> {x.value} ")
-                msg_listeners = current_app.redis.publish(f"command:{x.setting}", x.value, store=False)
-                log.info(f"Command sent successfully, heard by {msg_listeners} listeners")
+                commands.append(current_app.redis.send_command(device, f"command:{x.setting}", x.value))
             except ValueError as e:
                 log.warning(f"Value error: {e} in parsing commands")
                 log.debug(f"Unrecognized field to send as command: {key}")
-            time.sleep(.15)
+        wait_for_commands(commands)
 
     # TODO: Turn all of this if/else into a single 'thermometry' form
     if device == 'ls336':
@@ -292,16 +318,16 @@ def cycle_settings():
     cyclesettings = MagnetCycleSettings(current_app.redis)
 
     if request.method == 'POST':
+        commands = []
         for key in request.form.keys():
             try:
                 x = LakeShoreCommand(f"device-settings:magnet:{key.replace('_', '-')}", request.form.get(key))
                 log.info(f"Sending command:{x.setting}' -> {x.value} ")
-                msg_listeners = current_app.redis.publish(f"command:{x.setting}", x.value, store=False)
-                log.info(f"Command sent successfully, heard by {msg_listeners} listeners")
+                commands.append(current_app.redis.send_command('magnet', f"command:{x.setting}", x.value))
             except ValueError as e:
                 log.warning(f"Value error: {e} in parsing commands")
                 log.debug(f"Unrecognized field to send as command: {key}")
-            time.sleep(0.15)
+        wait_for_commands(commands)
 
     form = MagnetCycleSettingsForm(**(vars(cyclesettings)))
 
@@ -315,17 +341,17 @@ def ls625():
     ls625settings = LS625MagnetSettings(current_app.redis)
 
     if request.method == 'POST':
+        commands = []
         for key in request.form.keys():
             try:
                 x = LakeShoreCommand(f"device-settings:ls625:{key.replace('_', '-')}", request.form.get(key),
                                      limit_vals=ls625settings.limits)
                 log.info(f"Sending command:{x.setting}' -> {x.value} ")
-                msg_listeners = current_app.redis.publish(f"command:{x.setting}", x.value, store=False)
-                log.info(f"Command sent successfully, heard by {msg_listeners} listeners")
+                commands.append(current_app.redis.send_command('ls625', f"command:{x.setting}", x.value))
             except ValueError as e:
                 log.warning(f"Value error: {e} in parsing commands")
                 log.debug(f"Unrecognized field to send as command: {key}")
-            time.sleep(0.15)
+        wait_for_commands(commands)
 
     form = Lakeshore625ControlForm(**vars(ls625settings))
 
@@ -339,16 +365,16 @@ def heatswitch():
     hs = Heatswitch(current_app.redis)
 
     if request.method == "POST":
+        commands = []
         for key in request.form.keys():
             try:
                 x = LakeShoreCommand(f"device-settings:heatswitch:{key.replace('_', '-')}", request.form.get(key))
                 log.info(f"Sending command:{x.setting}' -> {x.value} ")
-                msg_listeners = current_app.redis.publish(f"command:{x.setting}", x.value, store=False)
-                log.info(f"Command sent successfully, heard by {msg_listeners} listeners")
+                commands.append(current_app.redis.send_command('heatswitch', f"command:{x.setting}", x.value))
             except ValueError as e:
                 log.warning(f"Value error: {e} in parsing commands")
                 log.debug(f"Unrecognized field to send as command: {key}")
-            time.sleep(0.15)
+        wait_for_commands(commands)
 
     form = HeatSwitchForm(**vars(hs))
 
@@ -622,16 +648,30 @@ def pixel_lightcurve(init=True, time=None, cts=None, pix_x=-1, pix_y=-1):
     return fig
 
 
+def wait_for_commands(commands, timeout=COMMAND_TIMEOUT):
+    """ Wait (up to timeout seconds in total) for the agents to complete the commands sent with send_command """
+    for c, record in zip(commands, current_app.redis.wait_commands(commands, timeout=timeout)):
+        if record is None:
+            log.warning(f"{c.agent} did not complete command {c.key} -> {c.value} within {timeout} s")
+        elif not record['ok']:
+            log.warning(f"{c.agent} failed command {c.key} -> {c.value}: {record['error']}")
+        else:
+            log.info(f"{c.agent} completed command {c.key} -> {c.value}")
+
+
+def local_datetimes(t_ms):
+    """ Convert an array of UNIX timestamps in ms to an array of local time numpy datetimes for plotting """
+    offset_ms = datetime.now().astimezone().utcoffset().total_seconds() * 1000
+    return (t_ms + offset_ms).astype('datetime64[ms]')
+
+
 def create_fig(name):
     since = None
     first_tval = int((datetime.now() - timedelta(hours=5)).timestamp() * 1000) if not since else since
-    timestream = np.array(current_app.redis.mkr_range(FLASK_CHART_KEYS[name], f"{first_tval}"))
-    if timestream[0][0] is not None:
-        times = [datetime.fromtimestamp(t / 1000).strftime("%m/%d/%Y %H:%M:%S") for t in timestream[:, 0]]
-        vals = list(timestream[:, 1])
-    else:
-        times = [None]
-        vals = [None]
+    timestream = np.array(current_app.redis.mkr_range(FLASK_CHART_KEYS[name], f"{first_tval}",
+                                                       max_points=CHART_MAX_POINTS), dtype=np.float64)
+    times = local_datetimes(timestream[:, 0])
+    vals = timestream[:, 1]
     fig = go.Figure()
     fig.add_trace(go.Scatter(x=times, y=vals, mode='lines', name=f"{name}"))
     fig.update_layout(dict(title=f"{name}", xaxis=dict(tickangle=45, nticks=3)))
@@ -644,14 +684,9 @@ def multi_sensor_fig(titles):
     first_tval = int((datetime.now() - timedelta(hours=0.5)).timestamp() * 1000) if not since else since
     keys = [FLASK_CHART_KEYS[title] for title in titles]
 
-    timestreams = [np.array(current_app.redis.mkr_range(key, f"{first_tval}")) for key in keys]
-    times = []
-    for ts in timestreams:
-        if ts[0][0] is not None:
-            times.append([datetime.fromtimestamp(t / 1000).strftime("%m/%d/%Y %H:%M:%S") for t in ts[:, 0]])
-        else:
-            times.append([None])
-    vals = [list(ts[:, 1]) for ts in timestreams]
+    timestreams = current_app.redis.range_many(keys, f"{first_tval}")
+    times = [local_datetimes(timestreams[key][0]) for key in keys]
+    vals = [timestreams[key][1] for key in keys]
 
     update_menus = []
     for n, t in enumerate(titles):
@@ -6,10 +6,21 @@ TODO: Add 'off' to devices so they don't just query unnecessarily
 
 from logging import getLogger
 import numpy as np
+import asyncio
+import bisect
 import enum
+import heapq
+import inspect
+import itertools
 import logging
+import math
+import random
+import re
 import time
 import threading
+from collections import deque
+from concurrent.futures import Future
+from contextlib import contextmanager
 import serial
 from serial import SerialException
 from lakeshore import InstrumentException
@@ -27,6 +38,7 @@ from lakeshore import Model372CurveHeader, Model372CurveFormat, Model336CurveHea
     Model336DiodeRange, Model336ThermocoupleRange
 
 from mkidcontrol.mkidredis import RedisError
+import mkidcontrol.mkidredis as redis
 
 from mkidcontrol.commands import SimCommand, LakeShoreCommand
 
@@ -99,6 +111,704 @@ def load_persisted_state(statefile):
 #         log.warning('Storing device settings to redis failed')
 
 
+class PollJob:
+    """
+    A function run by a PollScheduler every interval seconds. Runs are scheduled on the absolute deadlines
+    phase + n * interval (in UNIX time), so the period does not drift with the time the function takes and e.g. 1 Hz
+    jobs run on whole seconds. If a run overruns one or more deadlines they are skipped and counted as missed.
+
+    A function may instead return a Future (e.g. of a DeviceIOQueue item) that the run is timed to without the
+    scheduler waiting for it. Deadlines that pass before the future is done are counted as missed, and a run handed
+    the future of the still waiting previous one (coalesced) is not counted again.
+    """
+    def __init__(self, func: callable, interval: float, phase: float = 0.0, name=None):
+        if interval <= 0:
+            raise ValueError('Poll interval must be positive')
+        self.func = func
+        self.interval = interval
+        self.phase = phase
+        self.name = name if name else getattr(func, '__name__', repr(func))
+        self.cancelled = False
+        self.deadline = self.next_deadline(time.time())
+        self._pending = None  # The future of the last run, if func returns one
+        self._lock = threading.Lock()
+
+        self.runs = 0
+        self.missed = 0
+        self.jitter_max = 0.0
+        self.duration_max = 0.0
+        self._jitter_total = 0.0
+        self._duration_total = 0.0
+
+    def next_deadline(self, now):
+        """ The first deadline of the job after now """
+        return self.phase + (math.floor((now - self.phase) / self.interval) + 1) * self.interval
+
+    def cancel(self):
+        """ Stop running the job, a run in progress is finished """
+        self.cancelled = True
+
+    def run(self):
+        """ Run the job for its current deadline and advance to the next one """
+        deadline = self.deadline
+        start = time.time()
+        try:
+            result = self.func()
+        except Exception:
+            log.error(f"Poll job {self.name} raised an exception", exc_info=True)
+            result = None
+        if isinstance(result, Future):
+            if result is not self._pending:
+                self._pending = result
+                result.add_done_callback(lambda future: self._finished(deadline, start, future))
+        else:
+            self._finished(deadline, start)
+        self.deadline = max(deadline + self.interval, self.next_deadline(time.time()))
+
+    def _finished(self, deadline, start, future=None):
+        """ Record a run for deadline started at start, done now """
+        done = time.time()
+        if future is not None and not future.cancelled() and future.exception() is not None:
+            log.error(f"Poll job {self.name} raised an exception", exc_info=future.exception())
+        jitter = start - deadline
+        with self._lock:
+            self.runs += 1
+            self.jitter_max = max(self.jitter_max, jitter)
+            self._jitter_total += jitter
+            self.duration_max = max(self.duration_max, done - start)
+            self._duration_total += done - start
+            if deadline + self.interval <= done:
+                missed = round((self.next_deadline(done) - deadline - self.interval) / self.interval)
+                self.missed += missed
+                log.getChild('poll').warning(f"Poll job {self.name} missed {missed} deadline(s): started "
+                                             f"{jitter:.3f} s late and took {done - start:.3f} s")
+
+    def stats(self):
+        """ Dict of the run count, missed deadlines and mean/max jitter (start - deadline) and durations in s """
+        return {'interval': self.interval, 'runs': self.runs, 'missed': self.missed,
+                'jitter_mean': self._jitter_total / self.runs if self.runs else 0.0, 'jitter_max': self.jitter_max,
+                'duration_mean': self._duration_total / self.runs if self.runs else 0.0,
+                'duration_max': self.duration_max}
+
+
+class PollScheduler:
+    """
+    Runs any number of PollJobs from a single thread, each on its own absolute schedule (see PollJob). Jobs run one at
+    a time, so a job that takes too long delays the others, which shows up in their jitter and missed counts (device
+    monitors only queue their reads, see MonitorMixin). Use the phase of a job to keep jobs with the same interval from
+    contending for the same instant.
+
+    Devices share the module level poll_scheduler through MonitorMixin.monitor.
+    """
+    def __init__(self, name='Poll Scheduler'):
+        self.name = name
+        self._queue = []  # Heap of (deadline, sequence, job)
+        self._sequence = itertools.count()
+        self._wakeup = threading.Condition()
+        self._thread = None
+
+    def schedule(self, func: callable, interval: float, phase: float = 0.0, name=None):
+        """ Run func every interval s, offset by phase s from whole multiples of interval. Returns the job """
+        job = PollJob(func, interval, phase=phase, name=name)
+        with self._wakeup:
+            heapq.heappush(self._queue, (job.deadline, next(self._sequence), job))
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+                self._thread.start()
+            self._wakeup.notify()
+        return job
+
+    def jobs(self):
+        """ The scheduled (not cancelled) jobs, soonest first """
+        with self._wakeup:
+            return [job for _, _, job in sorted(self._queue) if not job.cancelled]
+
+    def _next_job(self):
+        with self._wakeup:
+            while True:
+                while self._queue and self._queue[0][2].cancelled:
+                    heapq.heappop(self._queue)
+                if not self._queue:
+                    self._wakeup.wait()
+                    continue
+                wait = self._queue[0][0] - time.time()
+                if wait <= 0:
+                    return heapq.heappop(self._queue)[2]
+                self._wakeup.wait(wait)
+
+    def _run(self):
+        while True:
+            job = self._next_job()
+            job.run()
+            if not job.cancelled:
+                with self._wakeup:
+                    heapq.heappush(self._queue, (job.deadline, next(self._sequence), job))
+
+
+poll_scheduler = PollScheduler()
+
+
+class MonitorMixin:
+    """
+    Mixin giving a device a monitor() that polls it on the shared poll_scheduler
+    """
+    _monitor_job = None
+
+    def monitor(self, interval: float, monitor_func: (callable, tuple), value_callback: (callable, tuple) = None,
+                phase: float = 0.0, scheduler: PollScheduler = None):
+        """
+        Given a monitoring function (or is of the same) and either one or the same number of optional callback
+        functions call the monitors every interval. If one callback it will get all the values in the order of the
+        monitor funcs, if a list of the same number as of monitorables each will get a single value.
+
+        Monitor functions may not return None.
+
+        When there is a 1-1 correspondence the callback is not called in the event of a monitoring error.
+        If a single callback is present for multiple monitor functions values that had errors will be sent as None.
+        Function must accept as many arguments as monitor functions.
+
+        Polls run on the absolute deadlines phase + n * interval of the scheduler (poll_scheduler by default), see
+        PollJob. Returns the PollJob, whose stats() report the timing.
+        """
+        if not isinstance(monitor_func, (list, tuple)):
+            monitor_func = (monitor_func,)
+        if value_callback is not None and not isinstance(value_callback, (list, tuple)):
+            value_callback = (value_callback,)
+        if not (value_callback is None or len(monitor_func) == len(value_callback) or len(value_callback) == 1):
+            raise ValueError('When specified, the number of callbacks must be one or the number of monitor functions')
+
+        def f():
+            vals = []
+            for func in monitor_func:
+                try:
+                    vals.append(func())
+                except IOError as e:
+                    log.getChild('io').error(f"Failed to poll {func}: {e}")
+                    vals.append(None)
+
+            if value_callback is not None:
+                if len(value_callback) > 1 or len(monitor_func) == 1:
+                    for v, cb in zip(vals, value_callback):
+                        try:
+                            cb(v)
+                        except Exception as e:
+                            log.error(f"Callback {cb} error. arg={v}.", exc_info=True)
+                else:
+                    cb = value_callback[0]
+                    try:
+                        cb(*vals)
+                    except Exception as e:
+                        log.error(f"Callback {cb} error. args={vals}.", exc_info=True)
+
+        return self._schedule_monitor(f, interval, phase=phase, scheduler=scheduler,
+                                      name=f"{getattr(self, 'name', type(self).__name__)} monitor")
+
+    def _schedule_monitor(self, tick, interval, phase=0.0, scheduler=None, name=None):
+        """
+        (Re)place the monitor job of the device. Devices with an I/O queue queue each tick as one MONITOR item without
+        waiting for it, so a tick is merged into one still waiting and the scheduler is not held up by the device
+        """
+        if isinstance(self, QueuedIOMixin):
+            poll = tick
+
+            def tick():
+                return self.io_queue.submit(poll, priority=IOPriority.MONITOR, coalesce='monitor', throttle=False)
+
+        if self._monitor_job is not None:
+            self._monitor_job.cancel()
+        scheduler = scheduler if scheduler is not None else poll_scheduler
+        self._monitor_job = scheduler.schedule(tick, interval, phase=phase, name=name)
+        return self._monitor_job
+
+
+class LatencyStats:
+    """
+    Running statistics of a device's I/O: the count, mean and max of all query round trips (in seconds), percentiles
+    over the most recent window of them, and the number of failed queries.
+    """
+    def __init__(self, window=1000):
+        self.count = 0
+        self.errors = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.last = None
+        self._recent = deque(maxlen=window)
+
+    def record(self, duration):
+        self.count += 1
+        self.total += duration
+        self.max = max(self.max, duration)
+        self.last = duration
+        self._recent.append(duration)
+
+    def record_error(self):
+        self.errors += 1
+
+    def stats(self):
+        """ Dict of the latency statistics in seconds """
+        recent = np.array(self._recent) if self._recent else np.zeros(1)
+        return {'count': self.count, 'errors': self.errors, 'mean': self.total / self.count if self.count else 0.0,
+                'max': self.max, 'last': self.last, 'p50': float(np.percentile(recent, 50)),
+                'p95': float(np.percentile(recent, 95)), 'p99': float(np.percentile(recent, 99))}
+
+
+class IOPriority:
+    """ Priorities of the items in a DeviceIOQueue, lowest first """
+    SAFETY = 0  # e.g. killing the magnet current
+    COMMAND = 1  # user and agent commands and queries, the default
+    MONITOR = 2  # periodic monitoring reads
+    NAMES = {SAFETY: 'safety', COMMAND: 'command', MONITOR: 'monitor'}
+
+
+class TokenBucket:
+    """ Limits a single consumer to rate operations per second on average, with bursts of up to burst operations """
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def take(self, n=1):
+        """ Take n tokens, sleeping until they are available. Returns the time slept """
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= n:
+            self.tokens -= n
+            return 0.0
+        wait = (n - self.tokens) / self.rate
+        time.sleep(wait)
+        self.tokens = 0
+        self.updated = now + wait
+        return wait
+
+
+class DeviceIOQueue:
+    """
+    Serializes the I/O of one device through a worker thread, running queued items in IOPriority order (then in order
+    of submission), so that e.g. a command never waits behind more than the item in progress. A MONITOR item (e.g. a
+    monitor tick of several reads) runs any waiting items of higher priority before each of its nested I/O operations,
+    so they wait behind at most the operation in progress. Every I/O operation takes a token from an optional
+    TokenBucket to respect the device's rate limit, or with throttle=n (e.g. a chain of n queries sent as one message)
+    n tokens.
+
+    Items submitted with a coalesce key that is already waiting in the queue are merged into the waiting item (both
+    callers get its result), so a backed up queue holds at most one monitoring read however often the monitor asks.
+
+    stats() reports the queue depth, how long items of each priority waited to start, how many were coalesced and
+    the time spent waiting for the rate limit.
+    """
+    def __init__(self, name, rate=None, burst=1):
+        self.name = name
+        self.bucket = TokenBucket(rate, burst) if rate else None
+        self._queue = []  # Heap of (priority, sequence, item)
+        self._sequence = itertools.count()
+        self._waiting = {}  # coalesce key: queued item
+        self._ready = threading.Condition()
+        self._worker = None
+        self.running_priority = None  # Priority of the item the worker is running
+
+        self.max_depth = 0
+        self.coalesced = 0
+        self.throttle_wait = 0.0
+        self.wait = {p: LatencyStats() for p in IOPriority.NAMES}
+
+    def on_worker(self):
+        """ Whether the calling thread is the worker, which runs nested I/O immediately """
+        return self._worker is not None and threading.current_thread() is self._worker
+
+    def throttle(self, n=1):
+        """ Wait for the rate limit, if any, to allow n operations. Called by the worker before each I/O operation """
+        if self.bucket is not None:
+            self.throttle_wait += self.bucket.take(n)
+
+    def submit(self, func, *args, priority=IOPriority.COMMAND, coalesce=None, throttle=True, **kwargs):
+        """ Queue func(*args, **kwargs) to run on the worker, returns a concurrent.futures.Future of its result """
+        with self._ready:
+            if coalesce is not None and coalesce in self._waiting:
+                self.coalesced += 1
+                return self._waiting[coalesce]['future']
+            item = {'func': func, 'args': args, 'kwargs': kwargs, 'future': Future(), 'priority': priority,
+                    'coalesce': coalesce, 'throttle': throttle, 'submitted': time.perf_counter()}
+            heapq.heappush(self._queue, (priority, next(self._sequence), item))
+            if coalesce is not None:
+                self._waiting[coalesce] = item
+            self.max_depth = max(self.max_depth, len(self._queue))
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run, name=f"{self.name} I/O", daemon=True)
+                self._worker.start()
+            self._ready.notify()
+        return item['future']
+
+    def call(self, func, *args, priority=IOPriority.COMMAND, coalesce=None, throttle=True, **kwargs):
+        """ Run func(*args, **kwargs) on the worker and return its result (or raise its exception) """
+        if self.on_worker():
+            if self.running_priority == IOPriority.MONITOR:
+                self._run_waiting(before=IOPriority.MONITOR)
+            if throttle:
+                self.throttle(throttle)
+            return func(*args, **kwargs)
+        return self.submit(func, *args, priority=priority, coalesce=coalesce, throttle=throttle, **kwargs).result()
+
+    def depth(self):
+        with self._ready:
+            return len(self._queue)
+
+    def stats(self):
+        """ Dict of the queue depth and coalescing/rate limiting counters and per priority wait statistics """
+        return {'depth': self.depth(), 'max_depth': self.max_depth, 'coalesced': self.coalesced,
+                'throttle_wait': self.throttle_wait,
+                'wait': {IOPriority.NAMES[p]: w.stats() for p, w in self.wait.items()}}
+
+    def _pop(self, before=None):
+        """ Take the next item off the queue, if there is one (of higher priority than before) """
+        with self._ready:
+            if not self._queue or (before is not None and self._queue[0][0] >= before):
+                return None
+            _, _, item = heapq.heappop(self._queue)
+            if item['coalesce'] is not None:
+                self._waiting.pop(item['coalesce'], None)
+            return item
+
+    def _run_waiting(self, before):
+        """ Run the waiting items of higher priority than before, from the worker """
+        item = self._pop(before=before)
+        while item is not None:
+            self._execute(item)
+            item = self._pop(before=before)
+
+    def _execute(self, item):
+        future = item['future']
+        if not future.set_running_or_notify_cancel():
+            return
+        self.wait[item['priority']].record(time.perf_counter() - item['submitted'])
+        previous = self.running_priority
+        self.running_priority = item['priority']
+        try:
+            if item['throttle']:
+                self.throttle(item['throttle'])
+            future.set_result(item['func'](*item['args'], **item['kwargs']))
+        except BaseException as e:
+            future.set_exception(e)
+        finally:
+            self.running_priority = previous
+
+    def _run(self):
+        while True:
+            with self._ready:
+                while not self._queue:
+                    self._ready.wait()
+                item = self._pop()
+            self._execute(item)
+
+
+_io_queue_lock = threading.Lock()
+_io_priority = threading.local()
+
+
+class QueuedIOMixin:
+    """
+    Mixin routing a device's I/O through its own DeviceIOQueue (created on first use), rate limited to IO_RATE_LIMIT
+    operations per second if that is set. I/O runs at COMMAND priority unless made in an io_priority() block, e.g.
+
+        with device.io_priority(IOPriority.SAFETY):
+            device.send('SETI 0')
+    """
+    IO_RATE_LIMIT = None  # Operations per second, None for no limit
+    IO_BURST = 1
+
+    @property
+    def io_queue(self):
+        queue = self.__dict__.get('_io_queue')
+        if queue is None:
+            with _io_queue_lock:
+                queue = self.__dict__.get('_io_queue')
+                if queue is None:
+                    name = self.__dict__.get('name', type(self).__name__)
+                    queue = self.__dict__['_io_queue'] = DeviceIOQueue(name, rate=self.IO_RATE_LIMIT,
+                                                                       burst=self.IO_BURST)
+        return queue
+
+    @staticmethod
+    @contextmanager
+    def io_priority(priority):
+        """ Run the I/O made by the calling thread within the block at priority """
+        previous = getattr(_io_priority, 'priority', IOPriority.COMMAND)
+        _io_priority.priority = priority
+        try:
+            yield
+        finally:
+            _io_priority.priority = previous
+
+    def current_io_priority(self):
+        """ The priority of the I/O being made: of the queued item the worker is running, else of the calling thread """
+        queue = self.__dict__.get('_io_queue')
+        if queue is not None and queue.on_worker() and queue.running_priority is not None:
+            return queue.running_priority
+        return getattr(_io_priority, 'priority', IOPriority.COMMAND)
+
+    def io_call(self, func, *args, priority=None, coalesce=None, throttle=True, **kwargs):
+        """ Run an I/O operation func(*args, **kwargs) through the device's I/O queue """
+        if priority is None:
+            priority = getattr(_io_priority, 'priority', IOPriority.COMMAND)
+        return self.io_queue.call(func, *args, priority=priority, coalesce=coalesce, throttle=throttle, **kwargs)
+
+
+CONNECTION_STATE_KEY = 'status:device:{name}:connection'
+
+
+def publish_connection_state(name, state):
+    """ Store a device's connection state in redis under CONNECTION_STATE_KEY, if this process has set up redis """
+    if redis.mkidredis is None:
+        return
+    try:
+        redis.store({CONNECTION_STATE_KEY.format(name=name.lower()): state})
+    except RedisError as e:
+        log.warning(f"Unable to store the connection state of {name}: {e}")
+
+
+class ConnectionManager:
+    """
+    Circuit breaker guarding a device's connection attempts.
+
+    While the circuit is closed the device is connected and used as normal, its port is only checked to still be
+    open every health_interval seconds. The first failure (to connect or to communicate) opens the circuit: no
+    connection is attempted until retry_at, so I/O fails immediately (except IOPriority.SAFETY I/O, which always makes
+    an attempt), and after that one attempt is let through (half-open). Each further failure doubles the delay, from
+    base_delay up to max_delay (with +-jitter to keep devices on a shared adapter apart). Failures are forgotten once
+    the connection has stayed up for stable_time, so a connection that keeps dropping right after being made keeps
+    backing off. Every change of state is passed to on_state_change(name, state), by default publish_connection_state.
+    """
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half-open'
+
+    def __init__(self, name, base_delay=0.5, max_delay=60.0, jitter=0.1, stable_time=30.0, health_interval=1.0,
+                 on_state_change=publish_connection_state):
+        self.name = name
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.jitter = jitter
+        self.stable_time = stable_time
+        self.health_interval = health_interval
+        self.on_state_change = on_state_change
+        self.state = self.CLOSED
+        self.failures = 0  # Consecutive, see stable_time
+        self.retry_at = 0.0
+        self.last_error = None
+        self._connected_at = None
+        self._checked_at = -math.inf
+        self.stats = {'connects': 0, 'failures': 0, 'rejected': 0}
+
+    def _set_state(self, state):
+        if state == self.state:
+            return
+        log.getChild('io').info(f"{self.name} connection {self.state} -> {state}")
+        self.state = state
+        if self.on_state_change is not None:
+            self.on_state_change(self.name, state)
+
+    def allow(self, force=False):
+        """
+        Whether a connection attempt may be made now, moving an open circuit past its retry time (or if force, e.g. to
+        kill the magnet current, at once) to half-open
+        """
+        if self.state != self.OPEN:
+            return True
+        if not force and time.monotonic() < self.retry_at:
+            self.stats['rejected'] += 1
+            return False
+        self._set_state(self.HALF_OPEN)
+        return True
+
+    def check_due(self):
+        """ Whether the port should be checked to still be open """
+        return time.monotonic() - self._checked_at >= self.health_interval
+
+    def checked(self):
+        self._checked_at = time.monotonic()
+
+    def connected(self):
+        self.stats['connects'] += 1
+        self._connected_at = time.monotonic()
+        self.checked()
+        self._set_state(self.CLOSED)
+
+    def failed(self, error):
+        """ Record a failure to connect or communicate. Failures while the circuit is open are the same outage """
+        if self.state == self.OPEN:
+            return
+        now = time.monotonic()
+        if self._connected_at is not None and now - self._connected_at >= self.stable_time:
+            self.failures = 0
+        self._connected_at = None
+        self._checked_at = -math.inf
+        self.failures += 1
+        self.stats['failures'] += 1
+        self.last_error = error
+        delay = min(self.base_delay * 2 ** (self.failures - 1), self.max_delay)
+        delay *= 1 + self.jitter * (2 * random.random() - 1)
+        self.retry_at = now + delay
+        log.getChild('io').warning(f"{self.name} connection failed ({error}), retrying in {delay:.1f} s")
+        self._set_state(self.OPEN)
+
+    def describe(self):
+        """ A description of an open circuit, for error messages """
+        return (f"{self.failures} consecutive failures (last: {self.last_error}), next attempt in "
+                f"{max(self.retry_at - time.monotonic(), 0):.1f} s")
+
+
+
+METRICS_KEY = 'metrics:device:{name}:{kind}'
+METRICS_FLUSH_INTERVAL = 10  # s, how often flush_device_metrics() stores the metrics in redis
+LATENCY_BUCKETS = (0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1.0, 2.0, 5.0)  # s, histogram upper bounds
+_COMMAND_WORD = re.compile(r'[:*]?\d*[A-Za-z]*\??')
+
+
+def command_name(msg):
+    """
+    The name under which DeviceMetrics files msg: the command word of a text command without its arguments ('KRDG?'
+    for 'KRDG? 1', '1PAU' for the Conex '1PAU0.3', '?' for an arduino query), 'pin n' for a (pin, value) byte pair and
+    the names joined with ';' for several chained commands
+    """
+    if isinstance(msg, (tuple, list, bytes, bytearray)):
+        if msg and all(isinstance(m, str) for m in msg):
+            return ';'.join(map(command_name, msg))
+        return f"pin {msg[0]}" if msg else '<empty>'
+    msg = str(msg).strip()
+    if ';' in msg:
+        return ';'.join(command_name(m) for m in msg.split(';') if m.strip())
+    return _COMMAND_WORD.match(msg).group() or msg[:8] or '<empty>'
+
+
+def _histogram_percentile(histogram, q, maximum):
+    """ The upper bound of the LATENCY_BUCKETS bucket holding the qth percentile (maximum for the overflow bucket) """
+    total = sum(histogram)
+    if not total:
+        return 0.0
+    cumulative = 0
+    for i, count in enumerate(histogram):
+        cumulative += count
+        if cumulative >= q / 100 * total:
+            return LATENCY_BUCKETS[i] if i < len(LATENCY_BUCKETS) else maximum
+    return maximum
+
+
+class DeviceMetrics:
+    """
+    In memory I/O metrics of one device: for each command (see command_name()) the number of writes, queries, errors
+    and timeouts and a histogram of the query round trip times (LATENCY_BUCKETS), and for the device the bytes written
+    and read and the number of connections made. Recording is a few counter updates under a lock, cheap enough for
+    every exchange. The metrics accumulate for the life of the process, flush_device_metrics() stores snapshots of
+    them in redis.
+    """
+    def __init__(self, name):
+        self.name = name
+        self.since = time.time()
+        self.bytes_out = 0
+        self.bytes_in = 0
+        self.connects = 0
+        self.commands = {}
+        self._last_command = None  # A read timing out is charged to the command written last
+        self._lock = threading.Lock()
+
+    def _command(self, name):
+        command = self.commands.get(name)
+        if command is None:
+            command = self.commands[name] = {'writes': 0, 'queries': 0, 'errors': 0, 'timeouts': 0, 'total': 0.0,
+                                             'max': 0.0, 'histogram': [0] * (len(LATENCY_BUCKETS) + 1)}
+        return command
+
+    def wrote(self, msg, nbytes):
+        with self._lock:
+            self._last_command = command_name(msg)
+            self._command(self._last_command)['writes'] += 1
+            self.bytes_out += nbytes
+
+    def read(self, nbytes, timeout=False):
+        with self._lock:
+            self.bytes_in += nbytes
+            if timeout:
+                self._command(self._last_command or '<none>')['timeouts'] += 1
+
+    def queried(self, msg, duration=None, error=False):
+        """ Record a query of msg that took duration seconds, or failed if error """
+        with self._lock:
+            command = self._command(command_name(msg))
+            command['queries'] += 1
+            if error:
+                command['errors'] += 1
+                return
+            command['total'] += duration
+            command['max'] = max(command['max'], duration)
+            command['histogram'][bisect.bisect_left(LATENCY_BUCKETS, duration)] += 1
+
+    def connected(self):
+        with self._lock:
+            self.connects += 1
+
+    def snapshot(self):
+        """ The device totals and the per command metrics (with their mean, p50 and p95 round trip times), as dicts """
+        with self._lock:
+            commands = {name: dict(c, histogram=list(c['histogram'])) for name, c in self.commands.items()}
+            io = {'since': self.since, 'updated': time.time(), 'bytes_out': self.bytes_out, 'bytes_in': self.bytes_in,
+                  'connects': self.connects, 'reconnects': max(self.connects - 1, 0)}
+        histogram = [0] * (len(LATENCY_BUCKETS) + 1)
+        for c in commands.values():
+            successes = c['queries'] - c['errors']
+            c['mean'] = c['total'] / successes if successes else 0.0
+            c['p50'] = _histogram_percentile(c['histogram'], 50, c['max'])
+            c['p95'] = _histogram_percentile(c['histogram'], 95, c['max'])
+            histogram = [a + b for a, b in zip(histogram, c['histogram'])]
+        for total in ('writes', 'queries', 'errors', 'timeouts'):
+            io[total] = sum(c[total] for c in commands.values())
+        io['busy'] = sum(c['total'] for c in commands.values())  # s spent in successful queries
+        io['histogram'] = histogram
+        io['buckets'] = LATENCY_BUCKETS
+        return io, commands
+
+
+_device_metrics = {}
+_device_metrics_lock = threading.Lock()
+_device_metrics_job = None
+
+
+def device_metrics(name):
+    """
+    The DeviceMetrics of the device name (devices of the same name share them). The first call schedules
+    flush_device_metrics() every METRICS_FLUSH_INTERVAL seconds on the poll_scheduler.
+    """
+    global _device_metrics_job
+    with _device_metrics_lock:
+        metrics = _device_metrics.get(name)
+        if metrics is None:
+            metrics = _device_metrics[name] = DeviceMetrics(name)
+        if _device_metrics_job is None:
+            _device_metrics_job = poll_scheduler.schedule(flush_device_metrics, METRICS_FLUSH_INTERVAL,
+                                                          name='device metrics flush')
+    return metrics
+
+
+def flush_device_metrics():
+    """
+    Store a snapshot of every device's metrics in redis as json, the device totals under METRICS_KEY with kind 'io'
+    and the per command metrics with kind 'commands', if this process has set up redis
+    """
+    if redis.mkidredis is None:
+        return
+    with _device_metrics_lock:
+        metrics = list(_device_metrics.values())
+    data = {}
+    for m in metrics:
+        io, commands = m.snapshot()
+        data[METRICS_KEY.format(name=m.name.lower(), kind='io')] = io
+        data[METRICS_KEY.format(name=m.name.lower(), kind='commands')] = commands
+    try:
+        redis.store(data, encode_json=True, batch=True)
+    except RedisError as e:
+        log.warning(f"Unable to store the device metrics: {e}")
+
+
 class MagnetState:
     MANUAL = 0
     PID = 1
@@ -114,9 +824,23 @@ class HeatswitchPosition:
     CLOSING = 'Closing'
 
 
-class SerialDevice:
+class SerialDevice(QueuedIOMixin, MonitorMixin):
+    """
+    A device on a serial port that speaks a line based protocol.
+
+    query() sends a command and reads the reply until the response terminator (or a newline if there is none) arrives,
+    waiting no longer than response_timeout seconds, so a query takes as long as the device needs to reply. Devices
+    that can not accept a command immediately after the previous exchange can set min_gap, the minimum time in seconds
+    between the end of one exchange and the next command. The round trip time of every query is recorded in
+    self.latency (see LatencyStats), and per command in self.metrics along with the bytes transferred, timeouts and
+    connections (see DeviceMetrics).
+
+    Connection attempts are guarded by self.connection (see ConnectionManager): after a failure the device is not
+    reconnected until its backoff delay has passed, I/O fails immediately with an IOError until then.
+    """
     def __init__(self, port, baudrate=115200, timeout=0.1, parity=serial.PARITY_NONE, bytesize=serial.EIGHTBITS,
-                 xonxoff=False, stopbits=serial.STOPBITS_ONE, name=None, terminator='\n', response_terminator=''):
+                 xonxoff=False, stopbits=serial.STOPBITS_ONE, name=None, terminator='\n', response_terminator='',
+                 response_timeout=1.0, min_gap=0.0):
         self.ser = None
         self.parity = parity
         self.bytesize = bytesize
@@ -128,6 +852,12 @@ class SerialDevice:
         self.name = name if name else self.port
         self.terminator = terminator
         self._response_terminator = response_terminator
+        self.response_timeout = response_timeout
+        self.min_gap = min_gap
+        self.latency = LatencyStats()
+        self._last_io = 0.0  # time.monotonic() of the end of the last exchange, for min_gap
+        self.connection = ConnectionManager(self.name)
+        self.metrics = device_metrics(self.name)
         self._rlock = threading.RLock()
 
     def _preconnect(self):
@@ -157,17 +887,26 @@ class SerialDevice:
         Connect to a serial port. If reconnect is True, closes the port first and then tries to reopen it. First asks
         the port if it is already open. If so, returns nothing and allows the calling function to continue on. If port
         is not already open, first attempts to create a serial.Serial object and establish the connection.
-        Raises an IOError if the serial connection is unable to be established.
+        Raises an IOError if the serial connection is unable to be established, or without trying if the connection
+        manager is still backing off after a failure (unless this is IOPriority.SAFETY I/O).
         """
         if reconnect:
             self.disconnect()
 
         try:
             if self.ser.isOpen():
+                self.connection.checked()
                 return
         except Exception:
             pass
 
+        if not self.connection.allow(force=self.current_io_priority() == IOPriority.SAFETY):
+            msg = f"Not connecting to {self.port}: {self.connection.describe()}"
+            log.getChild('io').debug(msg)
+            if raise_errors:
+                raise IOError(msg)
+            return False
+
         log.debug(f"Connecting to {self.port} at {self.baudrate}")
         try:
             self._preconnect()
@@ -175,10 +914,13 @@ class SerialDevice:
                               parity=self.parity, bytesize=self.bytesize, xonxoff=self.xonxoff,
                               stopbits=self.stopbits)
             self._postconnect()
+            self.connection.connected()
+            self.metrics.connected()
             log.getChild('io').info(f"port {self.port} connection established")
             return True
         except (serial.SerialException, IOError) as e:
             self.ser = None
+            self.connection.failed(e)
             log.getChild('io').error(f"Conntecting to port {self.port} failed: {e}")
             if raise_errors:
                 raise e
@@ -207,121 +949,478 @@ class SerialDevice:
         Send a message to a serial port. If connect is True, try to connect to the serial port before sending the
         message. Formats message according to the class's format_msg function before attempting to write to serial port.
         If IOError or SerialException occurs, first disconnect from the serial port, then log and raise the error.
+        The message is sent through the device's I/O queue.
         """
+        return self.io_call(self._send, msg, connect=connect)
+
+    def _ensure_connected(self):
+        """ connect() unless the port was last found open less than connection.health_interval ago """
+        if self.ser is None or self.connection.check_due():
+            self.connect()
+
+    def _io_failed(self, error):
+        """ Disconnect after an I/O error, backing off before the next connection attempt """
+        self.connection.failed(error)
+        self.disconnect()
+
+    def _send(self, msg: str, connect=True):
         with self._rlock:
             if connect:
-                self.connect()
+                self._ensure_connected()
             try:
-                msg = self.format_msg(msg)
-                log.getChild('io').debug(f"Sending '{msg}'")
-                self.ser.write(msg)
+                data = self.format_msg(msg)
+                log.getChild('io').debug(f"Sending '{data}'")
+                self.ser.write(data)
+                self.metrics.wrote(msg, len(data))
             except (serial.SerialException, IOError) as e:
-                self.disconnect()
+                self._io_failed(e)
                 log.getChild('io').error(f"...failed: {e}")
                 raise e
 
-    def receive(self):
+    def receive(self, timeout=None):
         """
-        Receives a message from a serial port. Assumes that the message consists of a single line. If a message is
-        received, decode it and strip it of any newline characters. In the case of an error or serialException,
-        disconnects from the serial port and raises an IOError.
+        Receives a message from a serial port. Reads until the response terminator (or a newline if the device has
+        none) or until timeout seconds (default self.response_timeout) pass. If a message is received, decode it and
+        strip it of any newline characters. In the case of an error or serialException, disconnects from the serial
+        port and raises an IOError.
         """
+        end = self._response_terminator if self._response_terminator else '\n'
+        end = end.encode('utf-8')
+        deadline = time.monotonic() + (self.response_timeout if timeout is None else timeout)
         with self._rlock:
             try:
-                data = self.ser.readline().decode("utf-8")
+                data = self.ser.read_until(end)
+                while not data.endswith(end) and time.monotonic() < deadline:
+                    data += self.ser.read_until(end)
+                self.metrics.read(len(data), timeout=not data.endswith(end))
+                data = data.decode("utf-8")
                 log.getChild('io').debug(f"Read {escapeString(data)} from {self.name}")
                 if not data.endswith(self._response_terminator):
-                    raise IOError("Got incomplete response. Consider increasing timeout.")
+                    raise IOError("Got incomplete response. Consider increasing response_timeout.")
                 return data.strip()
             except (IOError, serial.SerialException) as e:
-                self.disconnect()
+                self._io_failed(e)
                 log.getChild('io').debug(f"Send failed {e}")
                 raise IOError(e)
 
+    def _wait_min_gap(self):
+        """ Sleep until min_gap has passed since the end of the last exchange """
+        wait = self._last_io + self.min_gap - time.monotonic()
+        if wait > 0:
+            time.sleep(wait)
+
     def query(self, cmd: str, **kwargs):
         """
-        Send command and wait for a response, kwargs passed to send, raises only IOError
+        Send command and wait for a response through the device's I/O queue, kwargs passed to send, raises only IOError.
+        Queries chained with ';' count as one operation each against IO_RATE_LIMIT
         """
+        return self.io_call(self._query, cmd, throttle=cmd.count(';') + 1, **kwargs)
+
+    def _query(self, cmd: str, **kwargs):
         with self._rlock:
+            self._wait_min_gap()
+            start = time.perf_counter()
             try:
-                self.send(cmd, **kwargs)
-                time.sleep(.1)
-                return self.receive()
+                self._send(cmd, **kwargs)
+                response = self.receive()
             except Exception as e:
+                self.latency.record_error()
+                self.metrics.queried(cmd, error=True)
                 raise IOError(e)
+            finally:
+                self._last_io = time.monotonic()
+            duration = time.perf_counter() - start
+            self.latency.record(duration)
+            self.metrics.queried(cmd, duration)
+            return response
+
+
+
+class AsyncSerialDevice:
+    """
+    The asyncio counterpart of SerialDevice: a device on a serial port that speaks a line based protocol, with
+    coroutines connect(), send(), receive() and query() in place of blocking calls, so that one event loop can drive
+    any number of devices concurrently.
+
+    The constructor arguments, format_msg(), response_timeout, min_gap, self.latency, self.metrics and self.connection
+    are those of SerialDevice, the _preconnect(), _postconnect() and _predisconnect() hooks are coroutines. The port
+    is opened non-blocking and read when the event loop reports it readable (so POSIX only). Reads are bounded with
+    asyncio.wait_for(), cancelling a query cancels its read, and any late reply to it is discarded before the next
+    query. Exchanges with the device are serialized by an asyncio.Lock, concurrent queries of one device take their
+    turn.
+    """
+    def __init__(self, port, baudrate=115200, timeout=0.1, parity=serial.PARITY_NONE, bytesize=serial.EIGHTBITS,
+                 xonxoff=False, stopbits=serial.STOPBITS_ONE, name=None, terminator='\n', response_terminator='',
+                 response_timeout=1.0, min_gap=0.0):
+        self.ser = None
+        self.parity = parity
+        self.bytesize = bytesize
+        self.port = port
+        self.baudrate = baudrate
+        self.xonxoff = xonxoff
+        self.stopbits = stopbits
+        self.timeout = timeout
+        self.name = name if name else self.port
+        self.terminator = terminator
+        self._response_terminator = response_terminator
+        self.response_timeout = response_timeout
+        self.min_gap = min_gap
+        self.latency = LatencyStats()
+        self._last_io = 0.0  # time.monotonic() of the end of the last exchange, for min_gap
+        self.connection = ConnectionManager(self.name)
+        self.metrics = device_metrics(self.name)
+        self._buffer = bytearray()
+        # Made on first use, so that they belong to the loop running the device
+        self._exchange_lock = None
+        self._connect_lock = None
+
+    @property
+    def exchange_lock(self):
+        if self._exchange_lock is None:
+            self._exchange_lock = asyncio.Lock()
+        return self._exchange_lock
+
+    @property
+    def connect_lock(self):
+        if self._connect_lock is None:
+            self._connect_lock = asyncio.Lock()
+        return self._connect_lock
+
+    async def _preconnect(self):
+        """ Override to perform an action immediately prior to connection, raise IOError to not open the port """
+        pass
 
-    def monitor(self, interval: float, monitor_func: (callable, tuple), value_callback: (callable, tuple) = None):
+    async def _postconnect(self):
         """
-        Given a monitoring function (or is of the same) and either one or the same number of optional callback
-        functions call the monitors every interval. If one callback it will get all the values in the order of the
-        monitor funcs, if a list of the same number as of monitorables each will get a single value.
+        Override to perform an action immediately after connection (use connect=False for any I/O). Default is to sleep
+        for twice the timeout. Raise IOError if there are issues with the connection.
+        """
+        await asyncio.sleep(2 * self.timeout)
 
-        Monitor functions may not return None.
+    async def _predisconnect(self):
+        """ Override to perform an action immediately prior to disconnection (use connect=False for any I/O) """
+        pass
 
-        When there is a 1-1 correspondence the callback is not called in the event of a monitoring error.
-        If a single callback is present for multiple monitor functions values that had errors will be sent as None.
-        Function must accept as many arguments as monitor functions.
+    async def connect(self, reconnect=False, raise_errors=True, force=False):
         """
-        if not isinstance(monitor_func, (list, tuple)):
-            monitor_func = (monitor_func,)
-        if value_callback is not None and not isinstance(value_callback, (list, tuple)):
-            value_callback = (value_callback,)
-        if not (value_callback is None or len(monitor_func) == len(value_callback) or len(value_callback) == 1):
-            raise ValueError('When specified, the number of callbacks must be one or the number of monitor functions')
+        As SerialDevice.connect(): open the port (closing it first if reconnect is True) unless it is already open, and
+        return True if a connection was made. Raises an IOError if the connection can not be established or, without
+        trying, if the connection manager is still backing off after a failure (returns False if not raise_errors).
+        force makes an attempt even while backing off.
+        """
+        if reconnect:
+            await self.disconnect()
 
-        def f():
-            while True:
-                vals = []
-                for func in monitor_func:
-                    try:
-                        vals.append(func())
-                    except IOError as e:
-                        log.getChild('io').error(f"Failed to poll {func}: {e}")
-                        vals.append(None)
-
-                if value_callback is not None:
-                    if len(value_callback) > 1 or len(monitor_func) == 1:
-                        for v, cb in zip(vals, value_callback):
-                            try:
-                                cb(v)
-                            except Exception as e:
-                                log.getChild('io').error(f"Callback {cb} error. arg={v}.", exc_info=True)
-                    else:
-                        cb = value_callback[0]
-                        try:
-                            cb(*vals)
-                        except Exception as e:
-                            log.error(f"Callback {cb} error. args={vals}.", exc_info=True)
+        async with self.connect_lock:
+            if self.ser is not None and self.ser.isOpen():
+                self.connection.checked()
+                return
 
-                time.sleep(interval)
+            if not self.connection.allow(force=force):
+                msg = f"Not connecting to {self.port}: {self.connection.describe()}"
+                log.getChild('io').debug(msg)
+                if raise_errors:
+                    raise IOError(msg)
+                return False
 
-        self._monitor_thread = threading.Thread(target=f, name='Monitor Thread')
-        self._monitor_thread.daemon = True
-        self._monitor_thread.start()
+            log.debug(f"Connecting to {self.port} at {self.baudrate}")
+            try:
+                await self._preconnect()
+                self.ser = Serial(port=self.port, baudrate=self.baudrate, timeout=0, parity=self.parity,
+                                  bytesize=self.bytesize, xonxoff=self.xonxoff, stopbits=self.stopbits)
+                self._buffer.clear()
+                await self._postconnect()
+                self.connection.connected()
+                self.metrics.connected()
+                log.getChild('io').info(f"port {self.port} connection established")
+                return True
+            except (serial.SerialException, IOError) as e:
+                self._close()
+                self.connection.failed(e)
+                log.getChild('io').error(f"Conntecting to port {self.port} failed: {e}")
+                if raise_errors:
+                    raise e
+                return False
 
+    async def disconnect(self):
+        """ Close the port, logging but not raising any error from _predisconnect() """
+        try:
+            await self._predisconnect()
+        except Exception as e:
+            log.getChild('io').info(f"Exception during disconnect: {e}")
+        self._close()
 
-class SimDevice(SerialDevice):
-    def __init__(self, name, port, baudrate=9600, timeout=0.1, connect=True, initializer=None):
-        """The initialize callback is called after _simspecificconnect iff _initialized is false. The callback
-        will be passed this object and should raise IOError if the device can not be initialized. If it completes
-        without exception (or is not specified) the device will then be considered initialized
-        The .initialized_at_last_connect attribute may be checked to see if initilization ran.
-        """
+    def _close(self):
+        try:
+            if self.ser is not None:
+                self.ser.close()
+        except Exception as e:
+            log.getChild('io').info(f"Exception during disconnect: {e}")
+        self.ser = None
+        self._buffer.clear()
+
+    def _io_failed(self, error):
+        """ Close the port after an I/O error, backing off before the next connection attempt """
+        self.connection.failed(error)
+        self._close()
+
+    async def _ensure_connected(self):
+        if self.ser is None or self.connection.check_due():
+            await self.connect()
+
+    def format_msg(self, msg: str):
+        """Subclass may implement to apply hardware specific formatting"""
+        if msg and msg[-1] != self.terminator:
+            msg = msg+self.terminator
+        return msg.encode('utf-8')
+
+    async def send(self, msg: str, connect=True):
+        """ As SerialDevice.send() """
+        if connect:
+            await self._ensure_connected()
+        async with self.exchange_lock:
+            self._write(msg)
+
+    def _write(self, msg):
+        try:
+            if self.ser is None:
+                raise IOError(f"{self.name} is not connected")
+            data = self.format_msg(msg)
+            log.getChild('io').debug(f"Sending '{data}'")
+            self.ser.write(data)
+            self.metrics.wrote(msg, len(data))
+        except (serial.SerialException, IOError) as e:
+            self._io_failed(e)
+            log.getChild('io').error(f"...failed: {e}")
+            raise e
+
+    async def receive(self, timeout=None):
+        """ As SerialDevice.receive() """
+        async with self.exchange_lock:
+            return await self._receive(timeout)
+
+    async def _receive(self, timeout=None):
+        end = self._response_terminator if self._response_terminator else '\n'
+        end = end.encode('utf-8')
+        try:
+            if self.ser is None:
+                raise IOError(f"{self.name} is not connected")
+            try:
+                data = await asyncio.wait_for(self._read_until(end),
+                                              self.response_timeout if timeout is None else timeout)
+                self.metrics.read(len(data))
+            except asyncio.TimeoutError:
+                data = bytes(self._buffer)
+                self._buffer.clear()
+                self.metrics.read(len(data), timeout=True)
+            data = data.decode("utf-8")
+            log.getChild('io').debug(f"Read {escapeString(data)} from {self.name}")
+            if not data.endswith(self._response_terminator):
+                raise IOError("Got incomplete response. Consider increasing response_timeout.")
+            return data.strip()
+        except (IOError, serial.SerialException) as e:
+            self._io_failed(e)
+            log.getChild('io').debug(f"Send failed {e}")
+            raise IOError(e)
+
+    async def _read_until(self, end):
+        while True:
+            i = self._buffer.find(end)
+            if i >= 0:
+                data = bytes(self._buffer[:i + len(end)])
+                del self._buffer[:i + len(end)]
+                return data
+            await self._readable()
+            self._buffer += self.ser.read(self.ser.in_waiting or 1)
+
+    async def _readable(self):
+        """ Wait for the event loop to report the port readable """
+        loop = asyncio.get_running_loop()
+        ready = loop.create_future()
+        fd = self.ser.fileno()
+        loop.add_reader(fd, lambda: ready.done() or ready.set_result(None))
+        try:
+            await ready
+        finally:
+            loop.remove_reader(fd)
+
+    def _discard_input(self):
+        """ Drop anything read but not consumed, e.g. the late reply to a query that was cancelled or timed out """
+        if self.ser is not None and (self._buffer or self.ser.in_waiting):
+            log.getChild('io').debug(f"Discarding stale input from {self.name}")
+            self._buffer.clear()
+            self.ser.reset_input_buffer()
+
+    async def _wait_min_gap(self):
+        wait = self._last_io + self.min_gap - time.monotonic()
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    async def query(self, cmd: str, connect=True):
+        """ Send command and wait for a response, raises only IOError """
+        try:
+            if connect:
+                await self._ensure_connected()
+            async with self.exchange_lock:
+                await self._wait_min_gap()
+                start = time.perf_counter()
+                try:
+                    self._discard_input()
+                    self._write(cmd)
+                    response = await self._receive()
+                finally:
+                    self._last_io = time.monotonic()
+        except Exception as e:
+            self.latency.record_error()
+            self.metrics.queried(cmd, error=True)
+            raise IOError(e)
+        duration = time.perf_counter() - start
+        self.latency.record(duration)
+        self.metrics.queried(cmd, duration)
+        return response
+
+
+class EventLoopThread:
+    """
+    An asyncio event loop running in a daemon thread (started on first use), on which synchronous code can run
+    coroutines with run(). AsyncBackedSerialDevices share the module level io_loop, so the I/O of every such device
+    in the process is done by the one loop.
+    """
+    def __init__(self, name='Device I/O loop'):
+        self.name = name
+        self._loop = None
+        self._lock = threading.Lock()
+
+    @property
+    def loop(self):
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                threading.Thread(target=self._loop.run_forever, name=self.name, daemon=True).start()
+        return self._loop
+
+    def run(self, coro):
+        """ Run coro on the loop and return its result (or raise its exception), blocking until it is done """
+        loop = self.loop
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is loop:
+            coro.close()
+            raise RuntimeError(f"{self.name} can not wait for itself, await the coroutine instead")
+        return asyncio.run_coroutine_threadsafe(coro, loop).result()
+
+
+io_loop = EventLoopThread()
+
+
+def _transport_attribute(name):
+    """ A property standing for the attribute of the same name of an AsyncBackedSerialDevice's transport, self.aio """
+    return property(lambda self: getattr(self.aio, name), lambda self, value: setattr(self.aio, name, value))
 
-        super().__init__(port, baudrate, timeout, name=name, response_terminator='\r\n')
 
+class AsyncBackedSerialDevice(SerialDevice):
+    """
+    A SerialDevice whose I/O is done by an AsyncSerialDevice, self.aio, on the shared io_loop. The synchronous API
+    (with the I/O queue, monitors and connection manager on top of it) is a thin wrapper around the asyncio one, while
+    asyncio code may use self.aio directly to drive the device alongside others.
+
+    The framing (format_msg) and the connection handshake are those of self.aio, the port settings, latency and
+    connection manager are shared with it. _postconnect() is left for whatever the synchronous class needs to do
+    once self.aio has connected.
+    """
+    ser = _transport_attribute('ser')
+    port = _transport_attribute('port')
+    baudrate = _transport_attribute('baudrate')
+    timeout = _transport_attribute('timeout')
+    parity = _transport_attribute('parity')
+    bytesize = _transport_attribute('bytesize')
+    xonxoff = _transport_attribute('xonxoff')
+    stopbits = _transport_attribute('stopbits')
+    terminator = _transport_attribute('terminator')
+    _response_terminator = _transport_attribute('_response_terminator')
+    response_timeout = _transport_attribute('response_timeout')
+    min_gap = _transport_attribute('min_gap')
+    latency = _transport_attribute('latency')
+    metrics = _transport_attribute('metrics')
+    _last_io = _transport_attribute('_last_io')
+    connection = _transport_attribute('connection')
+
+    def __init__(self, aio: AsyncSerialDevice):
+        self.aio = aio
+        super().__init__(aio.port, aio.baudrate, aio.timeout, parity=aio.parity, bytesize=aio.bytesize,
+                         xonxoff=aio.xonxoff, stopbits=aio.stopbits, name=aio.name, terminator=aio.terminator,
+                         response_terminator=aio._response_terminator, response_timeout=aio.response_timeout,
+                         min_gap=aio.min_gap)
+
+    def _postconnect(self):
+        """ Override to perform an action once self.aio has connected, raise IOError if there are issues """
+        pass
+
+    def connect(self, reconnect=False, raise_errors=True):
+        """ As SerialDevice.connect(), connecting self.aio and then calling _postconnect() """
+        connected = io_loop.run(self.aio.connect(reconnect=reconnect, raise_errors=raise_errors,
+                                                 force=self.current_io_priority() == IOPriority.SAFETY))
+        if not connected:
+            return connected
+        try:
+            self._postconnect()
+            return True
+        except (serial.SerialException, IOError) as e:
+            self._io_failed(e)
+            log.getChild('io').error(f"Conntecting to port {self.port} failed: {e}")
+            if raise_errors:
+                raise e
+            return False
+
+    def disconnect(self):
+        io_loop.run(self.aio.disconnect())
+
+    def _io_failed(self, error):
+        self.aio._io_failed(error)
+
+    def format_msg(self, msg):
+        return self.aio.format_msg(msg)
+
+    def _send(self, msg, connect=True):
+        if connect:
+            self._ensure_connected()
+        io_loop.run(self.aio.send(msg, connect=False))
+
+    def receive(self, timeout=None):
+        return io_loop.run(self.aio.receive(timeout))
+
+    def _query(self, cmd, connect=True):
+        if connect:
+            try:
+                self._ensure_connected()
+            except Exception as e:
+                self.latency.record_error()
+                self.metrics.queried(cmd, error=True)
+                raise IOError(e)
+        return io_loop.run(self.aio.query(cmd, connect=False))
+
+
+class AsyncSimDevice(AsyncSerialDevice):
+    """
+    The asyncio transport of the SRS SIM modules (see SimDevice): upper case commands, finding the module in a SIM900
+    mainframe if there is one and checking its *IDN? on connection. The optional initializer is called (and awaited if
+    it returns an awaitable) after _simspecificconnect() until it has once completed without exception.
+    """
+    def __init__(self, name, port, baudrate=9600, timeout=0.1, initializer=None):
+        super().__init__(port, baudrate, timeout, name=name, response_terminator='\r\n')
         self.sn = None
         self.firmware = None
         self.mainframe_slot = None
         self.mainframe_exitstring = 'XYZ'
         self.initializer = initializer
-        self._monitor_thread = None
         self._initialized = False
-        self.initialized_at_last_connect = False
-        if connect:
-            self.connect(raise_errors=False)
 
-    def _walk_mainframe(self, name):
+    def format_msg(self, msg: str):
+        return super().format_msg(msg.strip().upper())
+
+    async def _walk_mainframe(self, name):
         """
         Walk the mainframe to find self.name in the device models
 
@@ -330,15 +1429,15 @@ class SimDevice(SerialDevice):
 
         will populate self.firmware and self.sn on success
         """
-        id_msg = self.query("*IDN?", connect=False)
+        id_msg = await self.query("*IDN?", connect=False)
         manufacturer, model, _, _ = id_msg.split(",")
         if model != 'SIM900':
             raise RuntimeError('Mainframe not present')
 
         for slot in range(1, 9):
-            self.send(f"CONN {slot}, '{self.mainframe_exitstring}'")
-            time.sleep(.1)
-            id_msg = self.query("*IDN?", connect=False)
+            await self.send(f"CONN {slot}, '{self.mainframe_exitstring}'", connect=False)
+            await asyncio.sleep(.1)
+            id_msg = await self.query("*IDN?", connect=False)
             try:
                 manufacturer, model, _, _ = id_msg.split(",")
             except Exception:
@@ -351,42 +1450,27 @@ class SimDevice(SerialDevice):
                 self.mainframe_slot=slot
                 return slot
             else:
-                self.send(f"{self.mainframe_exitstring}\n", connect=False)
+                await self.send(f"{self.mainframe_exitstring}\n", connect=False)
         raise KeyError(f'{name} not found in any mainframe slot')
 
-    def _predisconnect(self):
+    async def _predisconnect(self):
         if self.mainframe_slot is not None:
-            self.send(f"{self.mainframe_exitstring}\n", connect=False)
+            await self.send(f"{self.mainframe_exitstring}\n", connect=False)
 
-    def reset(self):
-        """
-        Send a reset command to the SIM device. This should not be used in regular operation, but if the device is not
-        working it is a useful command to be able to send.
-        BE CAREFUL - This will reset certain parameters which are set for us to read out the thermometer in the
-        PICTURE-C cryostat (as of 2020, a LakeShore RX102-A).
-        If you do perform a reset, it will then be helpful to restore the 'default settings' which we have determined
-        to be the optimal to read out the hardware we have.
-        """
-        log.getChild('io').info(f"Resetting the {self.name}!")
-        self.send("*RST")
+    async def _preconnect(self):
+        await asyncio.sleep(1)
 
-    def format_msg(self, msg: str):
-        return super().format_msg(msg.strip().upper())
-
-    def _simspecificconnect(self):
+    async def _simspecificconnect(self):
         pass
 
-    def _preconnect(self):
-        time.sleep(1)
-
-    def _postconnect(self):
+    async def _postconnect(self):
         try:
-            self.send(self.mainframe_exitstring)
-            self._walk_mainframe(self.name)
+            await self.send(self.mainframe_exitstring, connect=False)
+            await self._walk_mainframe(self.name)
         except RuntimeError:
             pass
 
-        id_msg = self.query("*IDN?", connect=False)
+        id_msg = await self.query("*IDN?", connect=False)
         try:
             manufacturer, model, self.sn, self.firmware = id_msg.split(",")  # See manual page 2-20
         except ValueError:
@@ -398,6 +1482,57 @@ class SimDevice(SerialDevice):
             log.critical(msg)
             raise IOError(msg)
 
+        await self._simspecificconnect()
+
+        if self.initializer and not self._initialized:
+            result = self.initializer(self)
+            if inspect.isawaitable(result):
+                await result
+            self._initialized = True
+
+
+class SimDevice(AsyncBackedSerialDevice):
+    """
+    An SRS SIM module, a thin synchronous wrapper around its AsyncSimDevice transport which finds it in the mainframe
+    and checks its identity on connection.
+    """
+    sn = _transport_attribute('sn')
+    firmware = _transport_attribute('firmware')
+    mainframe_slot = _transport_attribute('mainframe_slot')
+    mainframe_exitstring = _transport_attribute('mainframe_exitstring')
+
+    def __init__(self, name, port, baudrate=9600, timeout=0.1, connect=True, initializer=None):
+        """The initialize callback is called after _simspecificconnect iff _initialized is false. The callback
+        will be passed this object and should raise IOError if the device can not be initialized. If it completes
+        without exception (or is not specified) the device will then be considered initialized
+        The .initialized_at_last_connect attribute may be checked to see if initilization ran.
+        """
+
+        super().__init__(AsyncSimDevice(name, port, baudrate, timeout))
+
+        self.initializer = initializer
+        self._monitor_job = None
+        self._initialized = False
+        self.initialized_at_last_connect = False
+        if connect:
+            self.connect(raise_errors=False)
+
+    def reset(self):
+        """
+        Send a reset command to the SIM device. This should not be used in regular operation, but if the device is not
+        working it is a useful command to be able to send.
+        BE CAREFUL - This will reset certain parameters which are set for us to read out the thermometer in the
+        PICTURE-C cryostat (as of 2020, a LakeShore RX102-A).
+        If you do perform a reset, it will then be helpful to restore the 'default settings' which we have determined
+        to be the optimal to read out the hardware we have.
+        """
+        log.getChild('io').info(f"Resetting the {self.name}!")
+        self.send("*RST")
+
+    def _simspecificconnect(self):
+        pass
+
+    def _postconnect(self):
         self._simspecificconnect()
 
         if self.initializer and not self._initialized:
@@ -422,12 +1557,16 @@ class SimDevice(SerialDevice):
         for setting, value in settings_to_load.items():
             try:
                 cmd = SimCommand(setting, value)
-                log.debug(cmd)
-                self.send(cmd.sim_string)
-                ret[setting] = value
             except ValueError as e:
                 log.warning(f"Skipping bad setting: {e}")
-                ret[setting] = self.query(cmd.sim_query_string)
+                try:
+                    ret[setting] = self.query(SimCommand(setting).sim_query_string)
+                except ValueError:
+                    pass  # Not a setting of the device at all, there is nothing to read back
+                continue
+            log.debug(cmd)
+            self.send(cmd.sim_string)
+            ret[setting] = value
         return ret
 
     def read_schema_settings(self, settings):
@@ -438,7 +1577,7 @@ class SimDevice(SerialDevice):
         return ret
 
 
-class Focus(TDC001):
+class Focus(MonitorMixin, TDC001):
     MINIMUM_POSITION_ENCODER = 0
     MINIMUM_POSITION_MM = 0
     MAXIMUM_POSITION_ENCODER = 1727750
@@ -605,77 +1744,28 @@ class Focus(TDC001):
                 self.set_jog_params(to_change)
             elif 'move' in param_type:
                 self.set_move_params(to_change)
-            elif 'velocity' in param_type:
-                self.set_velocity_params(to_change)
-            else:
-                raise ValueError(f"Unknown parameter type to update for focus slider!")
-        except (IOError, SerialException) as e:
-            log.getChild('io').warning(f"Can't communicate with focus slider! {e}")
-            raise IOError(f"Can't communicate with focus slider! {e}")
-
-    @property
-    def params(self):
-        try:
-            home_params = self.homeparams_
-            jog_params = self.jogparams
-            move_params = self.genmoveparams
-            vel_params = self.velparams
-        except Exception as e:
-            raise Exception(f"Error querying params for focus! {e}")
-
-        return {'home': home_params,
-                'jog': jog_params,
-                'move': move_params,
-                'velocity': vel_params}
-
-    def monitor(self, interval: float, monitor_func: (callable, tuple), value_callback: (callable, tuple) = None):
-        """
-        Given a monitoring function (or is of the same) and either one or the same number of optional callback
-        functions call the monitors every interval. If one callback it will get all the values in the order of the
-        monitor funcs, if a list of the same number as of monitorables each will get a single value.
-
-        Monitor functions may not return None.
-
-        When there is a 1-1 correspondence the callback is not called in the event of a monitoring error.
-        If a single callback is present for multiple monitor functions values that had errors will be sent as None.
-        Function must accept as many arguments as monitor functions.
-        """
-        if not isinstance(monitor_func, (list, tuple)):
-            monitor_func = (monitor_func,)
-        if value_callback is not None and not isinstance(value_callback, (list, tuple)):
-            value_callback = (value_callback,)
-        if not (value_callback is None or len(monitor_func) == len(value_callback) or len(value_callback) == 1):
-            raise ValueError('When specified, the number of callbacks must be one or the number of monitor functions')
-
-        def f():
-            while True:
-                vals = []
-                for func in monitor_func:
-                    try:
-                        vals.append(func())
-                    except IOError as e:
-                        log.getChild('io').error(f"Failed to poll {func}: {e}")
-                        vals.append(None)
-
-                if value_callback is not None:
-                    if len(value_callback) > 1 or len(monitor_func) == 1:
-                        for v, cb in zip(vals, value_callback):
-                            try:
-                                cb(v)
-                            except Exception as e:
-                                log.error(f"Callback {cb} error. arg={v}.", exc_info=True)
-                    else:
-                        cb = value_callback[0]
-                        try:
-                            cb(*vals)
-                        except Exception as e:
-                            log.error(f"Callback {cb} error. args={vals}.", exc_info=True)
+            elif 'velocity' in param_type:
+                self.set_velocity_params(to_change)
+            else:
+                raise ValueError(f"Unknown parameter type to update for focus slider!")
+        except (IOError, SerialException) as e:
+            log.getChild('io').warning(f"Can't communicate with focus slider! {e}")
+            raise IOError(f"Can't communicate with focus slider! {e}")
 
-                time.sleep(interval)
+    @property
+    def params(self):
+        try:
+            home_params = self.homeparams_
+            jog_params = self.jogparams
+            move_params = self.genmoveparams
+            vel_params = self.velparams
+        except Exception as e:
+            raise Exception(f"Error querying params for focus! {e}")
 
-        self._monitor_thread = threading.Thread(target=f, name='Monitor Thread')
-        self._monitor_thread.daemon = True
-        self._monitor_thread.start()
+        return {'home': home_params,
+                'jog': jog_params,
+                'move': move_params,
+                'velocity': vel_params}
 
 
 class FilterWheel(USBFilterWheel):
@@ -778,7 +1868,7 @@ class FilterWheel(USBFilterWheel):
             raise Exception(f"Could not communicate with the filter wheel! {e}")
 
 
-class HeatswitchMotor:
+class HeatswitchMotor(MonitorMixin):
     TIMEOUT = 4194303 * 1.25 / 0.5e3  # Default timeout value is the number of steps + 25% divided by half the slowest speed we run at
     MOTOR_POS_KEY = "status:device:heatswitch:motor-position"  # Integer between 0 and 4194303
     FULL_CLOSE_POSITION = 4194303  # Halfway point for motor position, physical hard stop with clamps closed on heat sinks
@@ -1028,60 +2118,15 @@ class HeatswitchMotor:
         """
         self.hs.stop()
 
-    def monitor(self, interval: float, monitor_func: (callable, tuple), value_callback: (callable, tuple) = None):
-        """
-        Given a monitoring function (or is of the same) and either one or the same number of optional callback
-        functions call the monitors every interval. If one callback it will get all the values in the order of the
-        monitor funcs, if a list of the same number as of monitorables each will get a single value.
-
-        Monitor functions may not return None.
-
-        When there is a 1-1 correspondence the callback is not called in the event of a monitoring error.
-        If a single callback is present for multiple monitor functions values that had errors will be sent as None.
-        Function must accept as many arguments as monitor functions.
-        """
-        if not isinstance(monitor_func, (list, tuple)):
-            monitor_func = (monitor_func,)
-        if value_callback is not None and not isinstance(value_callback, (list, tuple)):
-            value_callback = (value_callback,)
-        if not (value_callback is None or len(monitor_func) == len(value_callback) or len(value_callback) == 1):
-            raise ValueError('When specified, the number of callbacks must be one or the number of monitor functions')
-
-        def f():
-            while True:
-                vals = []
-                for func in monitor_func:
-                    try:
-                        vals.append(func())
-                    except IOError as e:
-                        log.getChild('io').error(f"Failed to poll {func}: {e}")
-                        vals.append(None)
-
-                if value_callback is not None:
-                    if len(value_callback) > 1 or len(monitor_func) == 1:
-                        for v, cb in zip(vals, value_callback):
-                            try:
-                                cb(v)
-                            except Exception as e:
-                                log.error(f"Callback {cb} error. arg={v}.", exc_info=True)
-                    else:
-                        cb = value_callback[0]
-                        try:
-                            cb(*vals)
-                        except Exception as e:
-                            log.error(f"Callback {cb} error. args={vals}.", exc_info=True)
-
-                time.sleep(interval)
-
-        self._monitor_thread = threading.Thread(target=f, name='Monitor Thread')
-        self._monitor_thread.daemon = True
-        self._monitor_thread.start()
-
-
-class LakeShoreDevice(SerialDevice):
-    def __init__(self, name, port, baudrate=9600, timeout=0.1, connect=True, valid_models=None,
-                 parity=serial.PARITY_ODD, bytesize=serial.SEVENBITS, initializer=None):
 
+class AsyncLakeShoreDevice(AsyncSerialDevice):
+    """
+    The asyncio transport of the Lake Shore 240 and 625 (see LakeShoreDevice): upper case commands, checking the
+    *IDN? against valid_models on connection. The optional initializer is called (and awaited if it returns an
+    awaitable) after _lsspecificconnect() until it has once completed without exception.
+    """
+    def __init__(self, name, port, baudrate=9600, timeout=0.1, valid_models=None, parity=serial.PARITY_ODD,
+                 bytesize=serial.SEVENBITS, initializer=None):
         super().__init__(port, baudrate, timeout, name=name, parity=parity, bytesize=bytesize)
 
         if isinstance(valid_models, tuple):
@@ -1091,45 +2136,75 @@ class LakeShoreDevice(SerialDevice):
 
         self.sn = None
         self.firmware = None
-        self.terminator = '\n'
+        self.model = None
         self.initializer = initializer
         self._initialized = False
-        self.initialized_at_last_connect = False
-
-        if connect:
-            self.connect(raise_errors=False)
 
     def format_msg(self, msg:str):
         """
-        Overrides agent.SerialDevice format_message() function. Commands to the LakeShore are all upper-case.
+        Commands to the LakeShore are all upper-case.
         *NOTE: By choice, using .upper(), if we manually store a name of a curve/module, it will be in all caps.
         """
         return super().format_msg(msg.strip().upper())
 
-    def _lsspecificconnect(self):
+    async def _lsspecificconnect(self):
         pass
 
-    @property
-    def device_info(self):
-        self.connect()
-        return dict(model=self.name, firmware=self.firmware, sn=self.sn)
-
-    def _postconnect(self):
-
-        id_msg = self.query("*IDN?")
+    async def _postconnect(self):
+        id_msg = await self.query("*IDN?", connect=False)
         try:
-            manufacturer, model, self.sn, self.firmware = id_msg.split(",")
+            manufacturer, self.model, self.sn, self.firmware = id_msg.split(",")
         except ValueError:
             log.getChild('io').debug(f"Unable to parse IDN response: '{id_msg}'")
-            manufacturer, model, self.sn, self.firmware = [None]*4
+            manufacturer, self.model, self.sn, self.firmware = [None]*4
 
-        if not (manufacturer == "LSCI") or not (model in self.valid_models):
-            msg = f"Unsupported device: {manufacturer}/{model} (idn response = '{id_msg}')"
+        if not (manufacturer == "LSCI") or not (self.model in self.valid_models):
+            msg = f"Unsupported device: {manufacturer}/{self.model} (idn response = '{id_msg}')"
             log.getChild('io').critical(msg)
             raise IOError(msg)
 
+        await self._lsspecificconnect()
+
+        if self.initializer and not self._initialized:
+            result = self.initializer(self)
+            if inspect.isawaitable(result):
+                await result
+            self._initialized = True
+
+
+class LakeShoreDevice(AsyncBackedSerialDevice):
+    """
+    A Lake Shore 240 or 625, a thin synchronous wrapper around its AsyncLakeShoreDevice transport which checks its
+    identity on connection.
+    """
+    sn = _transport_attribute('sn')
+    firmware = _transport_attribute('firmware')
+    valid_models = _transport_attribute('valid_models')
+
+    def __init__(self, name, port, baudrate=9600, timeout=0.1, connect=True, valid_models=None,
+                 parity=serial.PARITY_ODD, bytesize=serial.SEVENBITS, initializer=None):
+
+        super().__init__(AsyncLakeShoreDevice(name, port, baudrate, timeout, valid_models=valid_models,
+                                              parity=parity, bytesize=bytesize))
+
+        self.initializer = initializer
+        self._initialized = False
+        self.initialized_at_last_connect = False
+
+        if connect:
+            self.connect(raise_errors=False)
+
+    def _lsspecificconnect(self):
+        pass
+
+    @property
+    def device_info(self):
+        self.connect()
+        return dict(model=self.name, firmware=self.firmware, sn=self.sn)
+
+    def _postconnect(self):
         if self.name[:-3] == '240':
-            self.name += f"-{model[-2:]}"
+            self.name += f"-{self.aio.model[-2:]}"
 
         self._lsspecificconnect()
 
@@ -1168,7 +2243,7 @@ class LakeShoreDevice(SerialDevice):
         return ret
 
 
-class LakeShoreMixin:
+class LakeShoreMixin(QueuedIOMixin, MonitorMixin):
     """
     Mixin class for functionality that is shared between the MKIDControl wrappers for LakeShore336 and LakeShore372
     devices. Currently, LakeShore has a python package which can be used for communicating with them. We are writing an
@@ -1176,6 +2251,46 @@ class LakeShoreMixin:
     querying, and parsing of desired setting changes.
     """
 
+    @property
+    def metrics(self):
+        """ The device's DeviceMetrics, byte counts are those of the messages less the package's error checks """
+        return device_metrics(self.__dict__.get('name', type(self).__name__))
+
+    def query(self, *queries, **kwargs):
+        """ The lakeshore package's query, through the device's I/O queue """
+        return self.io_call(self._metered, super().query, queries, throttle=self._io_cost(queries, **kwargs), **kwargs)
+
+    def command(self, *commands, **kwargs):
+        """ The lakeshore package's command, through the device's I/O queue """
+        return self.io_call(self._metered, super().command, commands, throttle=self._io_cost(commands, **kwargs),
+                            **kwargs)
+
+    @staticmethod
+    def _io_cost(messages, check_errors=True, **kwargs):
+        """
+        The number of operations (against IO_RATE_LIMIT) in messages, which the package sends as one with the '*ESR?'
+        of its error check. Each message may be a chain of several joined by ';'
+        """
+        return sum(m.count(';') + 1 for m in messages) + (1 if check_errors else 0)
+
+    def _metered(self, func, messages, **kwargs):
+        """ func(*messages, **kwargs), recorded in self.metrics as one query """
+        metrics = self.metrics
+        metrics.wrote(messages, sum(len(m) + 1 for m in messages))
+        start = time.perf_counter()
+        try:
+            response = func(*messages, **kwargs)
+        except InstrumentException as e:
+            metrics.read(0, timeout='timed out' in str(e))
+            metrics.queried(messages, error=True)
+            raise
+        except Exception:
+            metrics.queried(messages, error=True)
+            raise
+        metrics.read(len(response) if isinstance(response, str) else 0)
+        metrics.queried(messages, time.perf_counter() - start)
+        return response
+
     # TODO: Determine protocol for disconnection/connection/reconnection upon erroring out, querying the device, etc.
     def disconnect(self):
         try:
@@ -1231,13 +2346,7 @@ class LakeShoreMixin:
         temp_vals = []
         try:
             for channel in self.enabled_input_channels:
-                temp_rdg = float(self.get_kelvin_reading(channel))
-                log.info(f"Measured a temperature of {temp_rdg} K from channel {channel}")
-                if temp_rdg == 0:
-                    log.debug(f"Temperature from channel {channel} was read to be 0. This usually means that temperature"
-                              f" is above the calibration limit. Setting to 40K (RX-102A max calibrated temp).")
-                    temp_rdg = 40.0
-                temp_vals.append(temp_rdg)
+                temp_vals.append(self._calibrated_temp(channel, float(self.get_kelvin_reading(channel))))
         except Exception as e:
             self.disconnect()
             raise IOError(e)
@@ -1298,6 +2407,30 @@ class LakeShoreMixin:
 
         return readings
 
+    @staticmethod
+    def _calibrated_temp(channel, temp_rdg):
+        log.info(f"Measured a temperature of {temp_rdg} K from channel {channel}")
+        if temp_rdg == 0:
+            log.debug(f"Temperature from channel {channel} was read to be 0. This usually means that temperature"
+                      f" is above the calibration limit. Setting to 40K (RX-102A max calibrated temp).")
+            temp_rdg = 40.0
+        return temp_rdg
+
+    def chained_query(self, *queries, check_errors=True):
+        """
+        Send the queries chained with ';' as a single serial transaction and return the list of their responses,
+        without the package's '*ESR?' error check if not check_errors.
+        Raises an IOError if there is a problem communicating with the opened serial port
+        """
+        try:
+            responses = self.query(';'.join(queries), check_errors=check_errors).split(';')
+        except Exception as e:
+            self.disconnect()
+            raise IOError(e)
+        if len(responses) != len(queries):
+            raise IOError(f"Expected {len(queries)} responses to '{';'.join(queries)}', got '{';'.join(responses)}'")
+        return responses
+
     def query_single_setting(self, schema_key, command_code):
         _, inst, c, key = schema_key.split(":")
         key = key.replace("-", "_")
@@ -1463,61 +2596,12 @@ class LakeShoreMixin:
 
         self.set_curve(curve_num, curve_data)
 
-    def monitor(self, interval: float, monitor_func: (callable, tuple), value_callback: (callable, tuple) = None):
-        """
-        Given a monitoring function (or is of the same) and either one or the same number of optional callback
-        functions call the monitors every interval. If one callback it will get all the values in the order of the
-        monitor funcs, if a list of the same number as of monitorables each will get a single value.
-
-        Monitor functions may not return None.
-
-        When there is a 1-1 correspondence the callback is not called in the event of a monitoring error.
-        If a single callback is present for multiple monitor functions values that had errors will be sent as None.
-        Function must accept as many arguments as monitor functions.
-        """
-        if not isinstance(monitor_func, (list, tuple)):
-            monitor_func = (monitor_func,)
-        if value_callback is not None and not isinstance(value_callback, (list, tuple)):
-            value_callback = (value_callback,)
-        if not (value_callback is None or len(monitor_func) == len(value_callback) or len(value_callback) == 1):
-            raise ValueError('When specified, the number of callbacks must be one or the number of monitor functions')
-
-        def f():
-            while True:
-                vals = []
-                for func in monitor_func:
-                    try:
-                        vals.append(func())
-                    except IOError as e:
-                        log.getChild('io').error(f"Failed to poll {func}: {e}")
-                        vals.append(None)
-
-                if value_callback is not None:
-                    if len(value_callback) > 1 or len(monitor_func) == 1:
-                        for v, cb in zip(vals, value_callback):
-                            try:
-                                cb(v)
-                            except Exception as e:
-                                log.error(f"Callback {cb} error. arg={v}.", exc_info=True)
-                    else:
-                        cb = value_callback[0]
-                        try:
-                            cb(*vals)
-                        except Exception as e:
-                            log.error(f"Callback {cb} error. args={vals}.", exc_info=True)
-
-                time.sleep(interval)
-
-        self._monitor_thread = threading.Thread(target=f, name='Monitor Thread')
-        self._monitor_thread.daemon = True
-        self._monitor_thread.start()
-
 
 class LakeShore240(LakeShoreDevice):
     def __init__(self, name, port, baudrate=115200, timeout=0.1, connect=True, valid_models=None, parity=serial.PARITY_NONE, bytesize=serial.EIGHTBITS):
         super().__init__(name, port, baudrate, timeout, connect=connect, valid_models=valid_models, parity=parity, bytesize=bytesize)
 
-        self._monitor_thread = None  # Maybe not even necessary since this only queries
+        self._monitor_job = None  # Maybe not even necessary since this only queries
         self.last_he_temp = None
         self.last_ln2_temp = None
 
@@ -1538,19 +2622,18 @@ class LakeShore240(LakeShoreDevice):
         self.enabled = tuple(enabled)
 
     def read_temperatures(self):
-        """Queries the temperature of all enabled channels on the LakeShore 240. LakeShore reports values of temperature
-        in Kelvin. May raise IOError in the case of serial communication not working."""
-        readings = []
+        """Queries the temperature of all enabled channels on the LakeShore 240 with a single KRDG? 0. LakeShore reports
+        values of temperature in Kelvin. May raise IOError in the case of serial communication not working."""
         tanks = ['ln2', 'lhe']
-        for channel in self.enabled:
-            try:
-                readings.append(float(self.query(f"KRDG? {channel}")))
-            except IOError as e:
-                log.getChild('io').error(f"Serial Error: {e}")
-                raise IOError(f"Serial Error: {e}")
-            except ValueError as e:
-                log.error(f"Parsing error: {e}")
-                raise ValueError(f"Parsing error: {e}")
+        try:
+            all_readings = self.query("KRDG? 0").split(',')
+            readings = [float(all_readings[channel - 1]) for channel in self.enabled]
+        except IOError as e:
+            log.getChild('io').error(f"Serial Error: {e}")
+            raise IOError(f"Serial Error: {e}")
+        except (ValueError, IndexError) as e:
+            log.error(f"Parsing error: {e}")
+            raise ValueError(f"Parsing error: {e}")
         temps = {tanks[i]: readings[i] for i in range(len(self.enabled))}
         return temps
 
@@ -1567,6 +2650,8 @@ class LakeShore240(LakeShoreDevice):
 
 
 class LakeShore336(LakeShoreMixin, Model336):
+    ALL_CHANNEL_ORDER = ('A', 'B', 'C', 'D', 'D2', 'D3', 'D4', 'D5')  # Order of the readings of e.g. KRDG? 0
+
     def __init__(self, name, port=None, timeout=0.1, enabled_channels=(), initializer=None):
         """
         Initialize the LakeShore336 unit. Requires a name, typically something like 'LakeShore336' or '336'.
@@ -1586,6 +2671,24 @@ class LakeShore336(LakeShoreMixin, Model336):
         self.name = name
         self._postconnect()
 
+    def read_all(self):
+        """
+        Returns {'temp': [K, ...], 'sensor': [sensor units, ...]} for the enabled input channels, read from the
+        all-channel forms KRDG? 0 and SRDG? 0 in one transaction
+        """
+        temps, sensors = self.chained_query('KRDG? 0', 'SRDG? 0')
+        try:
+            temps = [float(x) for x in temps.split(',')]
+            sensors = [float(x) for x in sensors.split(',')]
+            # With the 3062 scanner card installed input D reads as D1-D5
+            index = [self.ALL_CHANNEL_ORDER.index('D' if c == 'D1' else c) for c in self.enabled_input_channels]
+            record = {'temp': [self._calibrated_temp(c, temps[i]) for c, i in zip(self.enabled_input_channels, index)],
+                      'sensor': [sensors[i] for i in index]}
+        except (ValueError, IndexError) as e:
+            raise IOError(f"Unable to parse readings '{temps}', '{sensors}': {e}")
+        log.info(f"Read {record} from channels {self.enabled_input_channels}")
+        return record
+
     def change_curve(self, channel, command_code, curve_num=None):
         """
         Takes in an input channel and the relevant command code from the LAKESHORE_COMMANDS dict to query what the
@@ -1682,20 +2785,45 @@ class LakeShore336(LakeShoreMixin, Model336):
 
 
 class LakeShore372(LakeShoreMixin, Model372):
-    def __init__(self, name, baudrate=57600, port=None, timeout=0.1, enabled_input_channels=(), initializer=None):
+    IO_RATE_LIMIT = 20  # From the manual -> Do not query more than 20 times per second
+
+    def __init__(self, name, baudrate=57600, port=None, timeout=0.1, enabled_input_channels=(), initializer=None,
+                 connection=None):
 
         self.device_serial = None
         self.enabled_input_channels = enabled_input_channels
         self.initializer = initializer
         self._initialized = False
 
-        if port is None:
+        if connection is not None:
+            # An already open serial port that the lakeshore package would not find by its USB VID/PID, e.g. to a
+            # simulator (see mkidcontrol.simulators)
+            super().__init__(baud_rate=baudrate, timeout=timeout, connection=connection)
+        elif port is None:
             super().__init__(baud_rate=baudrate, timeout=timeout)
         else:
             super().__init__(baud_rate=baudrate, com_port=port, timeout=timeout)
         self.name = name
         self._postconnect()
 
+    def read_all(self):
+        """
+        Returns {'temp': [K, ...], 'sensor': [Ohm, ...], 'excitation_power': [W, ...], 'output_voltage': %} for the
+        enabled input channels with one chained query
+        """
+        queries = [f"{q} {c}" for c in self.enabled_input_channels for q in ('KRDG?', 'RDGR?', 'RDGPWR?')] + ['HTR? 0']
+        responses = self.chained_query(*queries)
+        try:
+            values = [float(x) for x in responses]
+        except ValueError as e:
+            raise IOError(f"Unable to parse readings '{';'.join(responses)}': {e}")
+        record = {'temp': [self._calibrated_temp(c, t) for c, t in zip(self.enabled_input_channels, values[0:-1:3])],
+                  'sensor': values[1:-1:3],
+                  'excitation_power': values[2:-1:3],
+                  'output_voltage': values[-1]}
+        log.info(f"Read {record} from channels {self.enabled_input_channels}")
+        return record
+
     def apply_schema_settings(self, settings_to_load):
         """
         Configure the sim device with a dict of redis settings via SimCommand translation
@@ -1928,6 +3056,118 @@ class LakeShore372(LakeShoreMixin, Model372):
                     raise e
 
 
+class LakeShore372ScanAcquisition:
+    """
+    Samples a LakeShore 372 according to the state of its scanner, so that each reading stored is a new conversion.
+
+    The measurement inputs (1-16) are multiplexed by the scanner: only the input it is on is being measured, the
+    readings of the others are held at their last values. The control input ('A') is always measured. Each poll() is
+    a single chained query of SCAN?, the heater output and the readings of the control input and the input the scanner
+    was on at the last poll, so the final reading of an input the scanner has just left is read too. Readings of an
+    input still within its pause (i.e. settle) time are skipped. A reading is a new conversion if its resistance
+    differs from the last one reported for the input; an unchanged one is the same conversion held (e.g. polled again
+    before the 372 converted, or after the scanner left) and is skipped, unless the input is being measured and the
+    last report is REPEAT_INTERVAL old, as the input has then converted again to the same value (e.g. at a range
+    limit). Readings whose status is only T.OVER/T.UNDER (outside the calibration curve) are reported as the other
+    reads handle them (see _calibrated_temp), other statuses mark invalid readings, which are skipped. Readings are
+    timestamped with the middle of the transaction that read them, so within a poll interval of their conversion.
+
+    A poll of n inputs is 2 + 4n queries, sent without the package's '*ESR?' check (every response is parsed anyway),
+    so with the control and one scanned input polling every 0.5 s would take all of the 372's 20 operations/s. Poll at
+    least a few times per (pause + dwell) of the scanned inputs, see refresh_scanner_settings().
+    """
+    CONTROL_INPUT = 'A'
+    TEMPERATURE_RANGE_STATUS = 64 | 128  # RDGST? bits T.OVER and T.UNDER, the resistance is fine but not calibrated
+    REPEAT_INTERVAL = 1.0  # s, longer than a measured input goes between conversions
+
+    def __init__(self, lakeshore, channels=None):
+        self.lakeshore = lakeshore
+        self.channels = tuple(channels if channels is not None else lakeshore.enabled_input_channels)
+        self.active = None  # The scanned input at the last poll
+        self.autoscan = False
+        self.timing = {}  # input: (dwell s, pause s) from INSET?
+        self._since = {}  # input: time.time() the scanner was first seen on it
+        self._last = {}  # input: (the RDGR? response, time) of the last reported reading
+        self.stats = {'polls': 0, 'samples': 0, 'unsettled': 0, 'held': 0, 'bad_status': 0}
+
+    @property
+    def scanned(self):
+        return tuple(c for c in self.channels if c != self.CONTROL_INPUT)
+
+    def refresh_scanner_settings(self):
+        """
+        Read the scanner state (SCAN?) and the dwell and pause times of the scanned inputs (INSET?). Call again
+        whenever the input settings are changed. Returns the shortest pause + dwell of the scanned inputs in seconds
+        """
+        responses = self.lakeshore.chained_query('SCAN?', *(f"INSET? {c}" for c in self.scanned))
+        try:
+            self._update_scan(responses[0], time.time())
+            for c, inset in zip(self.scanned, responses[1:]):
+                _, dwell, pause, *_ = inset.split(',')
+                self.timing[c] = (float(dwell), float(pause))
+        except ValueError as e:
+            raise IOError(f"Unable to parse scanner settings '{';'.join(responses)}': {e}")
+        log.info(f"LakeShore 372 scanner on input {self.active} (autoscan {self.autoscan}), "
+                 f"(dwell, pause) {self.timing}")
+        return min((dwell + pause for dwell, pause in self.timing.values()), default=None)
+
+    def _update_scan(self, response, now):
+        channel, autoscan = response.split(',')
+        channel = str(int(channel))
+        if channel != self.active:
+            self._since[channel] = now
+        self.active = channel
+        self.autoscan = autoscan.strip() == '1'
+
+    def _settled(self, channel, now):
+        if channel == self.CONTROL_INPUT:
+            return True
+        _, pause = self.timing.get(channel, (0.0, 0.0))
+        return now - self._since.get(channel, now) >= pause
+
+    def poll(self):
+        """
+        Poll the scanner and read the inputs with new conversions in one transaction. Returns a tuple of
+        (list of (timestamp s, input, {'temp': K, 'sensor': Ohm, 'excitation_power': W}), heater output %)
+        """
+        read = [c for c in self.channels if c == self.CONTROL_INPUT or c == self.active]
+        queries = ['SCAN?', 'HTR? 0'] + [f"{q} {c}" for c in read for q in ('KRDG?', 'RDGR?', 'RDGPWR?', 'RDGST?')]
+        start = time.time()
+        responses = self.lakeshore.chained_query(*queries, check_errors=False)
+        now = (start + time.time()) / 2
+        self.stats['polls'] += 1
+
+        previous = self.active
+        samples = []
+        try:
+            self._update_scan(responses[0], now)
+            output_voltage = float(responses[1])
+            for i, c in enumerate(read):
+                kelvin, resistance, power, status = responses[2 + 4 * i: 6 + 4 * i]
+                if int(status) & ~self.TEMPERATURE_RANGE_STATUS:
+                    self.stats['bad_status'] += 1
+                    log.debug(f"Reading status of input {c} is {status}, skipping")
+                    continue
+                if not self._settled(c, now):
+                    self.stats['unsettled'] += 1
+                    continue
+                measuring = c == self.CONTROL_INPUT or c == self.active
+                last_resistance, reported = self._last.get(c, (None, None))
+                if resistance == last_resistance and not (measuring and now - reported >= self.REPEAT_INTERVAL):
+                    self.stats['held'] += 1
+                    continue
+                self._last[c] = (resistance, now)
+                samples.append((now, c, {'temp': self.lakeshore._calibrated_temp(c, float(kelvin)),
+                                         'sensor': float(resistance), 'excitation_power': float(power)}))
+        except ValueError as e:
+            raise IOError(f"Unable to parse readings '{';'.join(responses)}': {e}")
+
+        if previous != self.active:
+            log.debug(f"LakeShore 372 scanner moved from input {previous} to {self.active}")
+        self.stats['samples'] += len(samples)
+        return samples, output_voltage
+
+
 class LakeShore625(LakeShoreDevice):
     MAX_CURRENT = 9.4
 
@@ -2017,29 +3257,33 @@ class LakeShore625(LakeShoreDevice):
         """ Set the magnet state, state may not be set of Off directly.
         If transistioning to manual ensure that the manual current doesn't hiccup
         """
-        with self._rlock:
-            mode = int(self.mode)
-            log.debug(f"Setting Lake Shore 625 mode from {mode} to {value}")
-            if mode == value:
-                return
-            if value == MagnetState.SUM:
-                self.send("XPGM 2")
-                self.zero_current()
-            elif value == MagnetState.MANUAL:
-                self.send("XPGM 0")
-                self.zero_current()
-            elif value == MagnetState.PID:
-                self.send("XPGM 1")
-            else:
-                log.warning(f"Mode {mode} is invalid for the Lake Shore 625. Allowed values are 0, 1, 2")
+        # As one item of the I/O queue so nothing else is sent in between
+        self.io_call(self._set_mode, value, throttle=False)
+
+    def _set_mode(self, value: int):
+        mode = int(self.mode)
+        log.debug(f"Setting Lake Shore 625 mode from {mode} to {value}")
+        if mode == value:
+            return
+        if value == MagnetState.SUM:
+            self.send("XPGM 2")
+            self.zero_current()
+        elif value == MagnetState.MANUAL:
+            self.send("XPGM 0")
+            self.zero_current()
+        elif value == MagnetState.PID:
+            self.send("XPGM 1")
+        else:
+            log.warning(f"Mode {mode} is invalid for the Lake Shore 625. Allowed values are 0, 1, 2")
 
     def kill_current(self):
         """
         Commands the lakeshore 625 to have a very high ramp rate, then sets the current to 0A
         """
-        self.send("RATE 10")  # Let the current drop very quickly
-        self.send("SETI 0.000")  # Set current immediately to 0
-        self.send("RATE 0.005")  # Set current change rate (dI/dt) back to the default value of 0.005 A/s
+        with self.io_priority(IOPriority.SAFETY):
+            self.send("RATE 10")  # Let the current drop very quickly
+            self.send("SETI 0.000")  # Set current immediately to 0
+            self.send("RATE 0.005")  # Set current change rate (dI/dt) back to the default value of 0.005 A/s
 
     def zero_current(self):
         """
@@ -2048,7 +3292,8 @@ class LakeShore625(LakeShoreDevice):
         self.send("SETI 0.000")
 
     def stop_ramp(self):
-        self.send("STOP")
+        with self.io_priority(IOPriority.SAFETY):
+            self.send("STOP")
 
 
 class SIM960(SimDevice):
@@ -2057,16 +3302,18 @@ class SIM960(SimDevice):
     MAX_CURRENT = 10.0
     OFF_SLOPE = 0.5
 
-    def __init__(self, port, baudrate=9600, timeout=0.1, connect=True, initializer=None):
+    def __init__(self, port, baudrate=9600, timeout=0.1, connect=True, initializer=None, clock=time.time):
         """
         Initializes SIM960 agent. First hits the superclass (SerialDevice) init function. Then sets class variables which
         will be used in normal operation. If connect mainframe is True, attempts to connect to the SIM960 via the SIM900
         in mainframe mode. Raise IOError if an invalid slot or exit string is given (or if no exit string is given).
+        clock is the time used to limit the rate of change of the manual current.
         """
         self.polarity = 'negative'
         self.last_input_voltage = None
         self.last_output_voltage = None
-        self._last_manual_change = time.time() - 1  # This requires that in the case the program fails that systemd does
+        self.clock = clock
+        self._last_manual_change = clock() - 1  # This requires that in the case the program fails that systemd does
         # not try to restart the sim960Agent program more frequently than once per second (i.e. if sim960Agent crashes,
         # hold off on trying to start it again for at least 1s)
         super().__init__('SIM960', port, baudrate, timeout, connect=connect, initializer=initializer)
@@ -2155,17 +3402,18 @@ class SIM960(SimDevice):
         if not self._initialized:
             raise ValueError('Sim is not initialized')
         x = min(max(x, 0), self.MAX_CURRENT)
-        delta = abs((self.setpoint() - x)/(time.time()-self._last_manual_change))
+        delta = abs((self.setpoint() - x)/(self.clock()-self._last_manual_change))
         if delta > self.MAX_CURRENT_SLOPE:
             raise ValueError('Requested current delta unsafe')
         self.mode = MagnetState.MANUAL
         self.send(f'MOUT {self._out_volt_2_current(x, inverse=True) - 0.002:.4f}')  # Response, there's mV accuracy, so at least 3 decimal places
-        self._last_manual_change = time.time()
+        self._last_manual_change = self.clock()
 
     def kill_current(self):
         """Immediately kill the current"""
-        self.mode=MagnetState.MANUAL
-        self.send(f'MOUT {self._out_volt_2_current(0, inverse=True) - 0.002:.4f}')
+        with self.io_priority(IOPriority.SAFETY):
+            self.mode=MagnetState.MANUAL
+            self.send(f'MOUT {self._out_volt_2_current(0, inverse=True) - 0.002:.4f}')
 
 
     @property
@@ -2178,16 +3426,19 @@ class SIM960(SimDevice):
         """ Set the magnet state, state may not be set of Off directly.
         If transistioning to manual ensure that the manual current doesn't hiccup
         """
-        with self._rlock:
-            mode = self.mode
-            if mode == value:
-                return
-            if value == MagnetState.MANUAL:
-                self.send(f'MOUT {self._out_volt_2_current(self.setpoint(), inverse=True):.3f}')
-                self.send("AMAN 0")
-                #NB no need to set the _lat_manual_change time as we arent actually changing the current
-            else:
-                self.send("AMAN 1")
+        # As one item of the I/O queue so nothing else is sent in between
+        self.io_call(self._set_mode, value, throttle=False)
+
+    def _set_mode(self, value: MagnetState):
+        mode = self.mode
+        if mode == value:
+            return
+        if value == MagnetState.MANUAL:
+            self.send(f'MOUT {self._out_volt_2_current(self.setpoint(), inverse=True):.3f}')
+            self.send("AMAN 0")
+            #NB no need to set the _lat_manual_change time as we arent actually changing the current
+        else:
+            self.send("AMAN 1")
 
 
 class SIM921OutputMode:
@@ -2202,7 +3453,7 @@ class SIM921(SimDevice):
         self.scale_units = 'resistance'
         self.last_voltage = None
         self.last_monitored_values = None
-        self._monitor_thread = None
+        self._monitor_job = None
         self.last_voltage_read = None
         self.last_temp_read = None
         self.last_resistance_read = None
@@ -2332,19 +3583,42 @@ class SIM921(SimDevice):
         log.info(f"Successfully loaded curve {curve_num} - '{curve_name}'!")
 
 
-class Currentduino(SerialDevice):
+class AsyncArduino(AsyncSerialDevice):
+    """
+    The asyncio transport of the PICTURE-C/XKID arduinos, which take single lower case character commands without a
+    termination character and answer each with one line. Waits boot_time seconds after opening the port for the
+    arduino to reset and start up, or the first queries return nonsense (or nothing).
+    """
+    def __init__(self, name, port, baudrate=115200, timeout=0.1, boot_time=2.0):
+        super().__init__(port, baudrate, timeout, name=name, terminator='')
+        self.boot_time = boot_time
+
+    async def _postconnect(self):
+        await asyncio.sleep(self.boot_time)
+
+    def format_msg(self, msg: str):
+        return f"{msg.strip().lower()}{self.terminator}".encode("utf-8")
+
+
+class AsyncLaserflipperduino(AsyncArduino):
+    """ The laserflipperduino's commands are (pin, value) byte pairs rather than characters """
+    def format_msg(self, msg):
+        """ msg is expected to be either a tuple, array, or bytearray of length 2 """
+        return bytearray(msg)
+
+
+class Currentduino(AsyncBackedSerialDevice):
     VALID_FIRMWARES = (0.0, 0.1, 0.2)
     R1 = 11760  # Values for R1 resistor in magnet current measuring voltage divider
     R2 = 11710  # Values for R2 resistor in magnet current measuring voltage divider
 
     def __init__(self, port, baudrate=115200, timeout=0.1, connect=True):
-        super().__init__(port, baudrate, timeout, name='currentduino')
+        super().__init__(AsyncArduino('currentduino', port, baudrate, timeout, boot_time=2))
         if connect:
             self.connect(raise_errors=False)
         self.heat_switch_position = None
-        self._monitor_thread = None
+        self._monitor_job = None
         self.last_current = None
-        self.terminator = ''
 
     def read_current(self):
         """
@@ -2363,20 +3637,6 @@ class Currentduino(SerialDevice):
         log.info(f"Current value is {current} A")
         return current
 
-    def _postconnect(self):
-        """
-        Overwrites SerialDevice _postconnect function. The default 2 * timeout is not sufficient to let the arduino to
-        set up, so a slightly longer pause is implemented here
-        """
-        time.sleep(2)
-
-    def format_msg(self, msg: str):
-        """
-        Overwrites function from SerialDevice superclass. Follows the communication model we made where the arduinos in
-        PICTURE-C do not require termination characters.
-        """
-        return f"{msg.strip().lower()}{self.terminator}".encode()
-
     def move_heat_switch(self, pos):
         """
         Takes a position (open | close) and first checks to make sure that it is valid. If it is, send the command to
@@ -2440,57 +3700,37 @@ class Currentduino(SerialDevice):
             log.getChild('io').error(f"Bad firmware format: '{response}'")
             raise IOError(f'Bad firmware response: "{response}"')
 
-    def monitor_current(self, interval, value_callback=None):
+    def monitor_current(self, interval, value_callback=None, phase=0.0):
         """
-        Create a function to continuously query the current as measured by the arduino. Log any IOErrors that occur.
+        Continuously query the current as measured by the arduino on the poll_scheduler. Log any IOErrors that occur.
         If a value_callback is given (e.g. for storing values to redis), call it and pass over any exceptions it
         generates. Interval determines the time between queries of current.
         """
         def f():
-            while True:
-                current = None
-                try:
-                    self.last_current = self.read_current()
-                    current = self.last_current
-                except (IOError, ValueError) as e:
-                    log.getChild('io').error(f"Unable to poll for current: {e}")
-
-                if value_callback is not None and current is not None:
-                    try:
-                        value_callback(self.last_current)
-                    except Exception as e:
-                        log.error(f"Exception during value callback: {e}")
-                        pass
+            current = None
+            try:
+                self.last_current = self.read_current()
+                current = self.last_current
+            except (IOError, ValueError) as e:
+                log.getChild('io').error(f"Unable to poll for current: {e}")
 
-                time.sleep(interval)
+            if value_callback is not None and current is not None:
+                try:
+                    value_callback(self.last_current)
+                except Exception as e:
+                    log.error(f"Exception during value callback: {e}")
+                    pass
 
-        self._monitor_thread = threading.Thread(target=f, name='Current Monitoring Thread')
-        self._monitor_thread.daemon = True
-        self._monitor_thread.start()
+        return self._schedule_monitor(f, interval, phase=phase, name=f"{self.name} current monitor")
 
 
-class Hemtduino(SerialDevice):
+class Hemtduino(AsyncBackedSerialDevice):
     VALID_FIRMWARES = (0.0, 0.1)
 
     def __init__(self, port, baudrate=115200, timeout=0.1, connect=True):
-        super().__init__(port, baudrate, timeout, name='hemtduino')
+        super().__init__(AsyncArduino('hemtduino', port, baudrate, timeout, boot_time=1))
         if connect:
             self.connect(raise_errors=False)
-        self.terminator = ''
-
-    def _postconnect(self):
-        """
-        Overwrites serialDevice _postconnect function. Sleeps for an appropriate amount of time to let the arduino get
-        booted up properly so the first queries don't return nonsense (or nothing)
-        """
-        time.sleep(1)
-
-    def format_msg(self, msg:str):
-        """
-        Overwrites the format_msg function from SerialDevice. Returns a lowercase string with the hemtduino terminator
-        (which is '' in the contract with the hemtduino).
-        """
-        return f"{msg.strip().lower()}{self.terminator}".encode("utf-8")
 
     def firmware_ok(self):
         """
@@ -2546,11 +3786,11 @@ class Hemtduino(SerialDevice):
         except Exception as e:
             raise ValueError(f"Error parsing response data: {response}. Exception {e}")
 
-class Laserflipperduino(SerialDevice):
+class Laserflipperduino(AsyncBackedSerialDevice):
     VALID_FIRMWARES = (0.0, 0.1)
 
     def __init__(self, port, baudrate=115200, timeout=1, connect=True, lasernames=None):
-        super().__init__(port, baudrate, timeout, name='laserflipperduino')
+        super().__init__(AsyncLaserflipperduino('laserflipperduino', port, baudrate, timeout, boot_time=2))
         if connect:
             self.connect(raise_errors=True)
         self.status = {0: 0.0,
@@ -2559,41 +3799,8 @@ class Laserflipperduino(SerialDevice):
                        3: 0.0,
                        4: 0.0,
                        5: 0.0}
-        self.terminator = ''
         self.names = lasernames
 
-    def _postconnect(self):
-        """
-        Overwrites serialDevice _postconnect function. Sleeps for an appropriate amount of time to let the arduino get
-        booted up properly so the first queries don't return nonsense (or nothing)
-        """
-        time.sleep(2)
-
-    def format_msg(self, msg):
-        """
-        Overwrites function from SerialDevice superclass.
-        msg is expected to be either a tuple, array, or bytearray of length 2
-        """
-        return bytearray(msg)
-
-    def send(self, msg: (bytearray, tuple), connect=True):
-        """
-        Send a message to a serial port. If connect is True, try to connect to the serial port before sending the
-        message. Formats message according to the class's format_msg function before attempting to write to serial port.
-        If IOError or SerialException occurs, first disconnect from the serial port, then log and raise the error.
-        """
-        with self._rlock:
-            if connect:
-                self.connect()
-            try:
-                msg = self.format_msg(msg)
-                log.getChild('io').debug(f"Sending '{msg}'")
-                self.ser.write(msg)
-            except (serial.SerialException, IOError) as e:
-                self.disconnect()
-                log.getChild('io').error(f"...failed: {e}")
-                raise e
-
     @property
     def firmware(self):
         """ Return the firmware string or raise IOError """
@@ -2698,7 +3905,7 @@ class Conex(SerialDevice):
         self.v_upper_limit = np.inf
 
         self.initializer = initializer
-        self._monitor_thread = None
+        self._monitor_job = None
         self._initialized = False
         self.initialized_at_last_connect = False
 
@@ -2807,14 +4014,16 @@ class Conex(SerialDevice):
         :param timeout: error out if it takes too long for move to complete. Ignored if not blocking. Requires
          significant time even though the moves themselves are fast
         """
-        with self._rlock:
-            if not self.in_bounds(position=pos):
-                raise ValueError('Target position outside of limits. Aborted move')
+        if not self.in_bounds(position=pos):
+            raise ValueError('Target position outside of limits. Aborted move')
+
+        def start_move():
             self.send(f"PAU{pos[1]}")
             self.ser.flush()  # wait until the write command finishes sending
             self.send(f"PAV{pos[0]}")  # Conex can move both axes at once
             if blocking:
                 self.ser.flush()
+        self.io_call(start_move, throttle=False)  # As one item of the I/O queue so both axes start together
         if blocking:
             t = time.time()
             while not self.ready():
@@ -2916,20 +4125,14 @@ class Conex(SerialDevice):
 
         Checks to ensure the command is received with the proper syntax, removes qualifiers, and returns the query response
         """
-        with self._rlock:
-            try:
-                self.send(cmd, **kwargs)
-                time.sleep(.1)
-                received = self.receive()
-                cmd = cmd.rstrip("?")
-                if (received[:1] == str(self.ctrlN)) or (received[:2] == str(self.ctrlN)):
-                    received = received.lstrip(str(self.ctrlN))
-                else:
-                    raise IOError(f"Received inaccurate message from Conex!")
-                if (received[:2] == cmd) or (received[:3] == cmd):
-                    received = received.lstrip(cmd)
-                else:
-                    raise IOError(f"Received inaccurate message from Conex!")
-                return received
-            except Exception as e:
-                raise IOError(e)
\ No newline at end of file
+        received = super().query(cmd, **kwargs)
+        cmd = cmd.rstrip("?")
+        if (received[:1] == str(self.ctrlN)) or (received[:2] == str(self.ctrlN)):
+            received = received.lstrip(str(self.ctrlN))
+        else:
+            raise IOError(f"Received inaccurate message from Conex!")
+        if (received[:2] == cmd) or (received[:3] == cmd):
+            received = received.lstrip(cmd)
+        else:
+            raise IOError(f"Received inaccurate message from Conex!")
+        return received
\ No newline at end of file
@@ -0,0 +1,904 @@
+"""
+An in-memory, in-process stand-in for a redis-server with the RedisTimeSeries module, so that agents, the magnet
+state machine and the flask app can be exercised (and benchmarked) without a live redis.
+
+The stand-in works at the level of the redis-py connection: MemoryConnection replaces the socket connection of a
+ConnectionPool and hands each command to a MemoryServer, so the real redis-py (and redistimeseries) client code,
+pipelines, transactions, pubsub and response parsing are all used unchanged. Every client created for the same
+host and port in a process shares one MemoryServer, so e.g. agent threads and a flask app running in the same process
+talk to each other as they would through redis. Separate processes do not share anything.
+
+Select it with mkidredis.setup_redis(backend='memory') or by setting the environment variable
+MKIDCONTROL_REDIS_BACKEND=memory.
+
+Implemented are the commands MKIDRedis uses, with the semantics of redis 5/RedisTimeSeries 1.4:
+    strings: GET SET MGET DEL EXISTS KEYS TYPE EXPIRE PEXPIRE TTL FLUSHDB FLUSHALL
+    hashes: HSET HGET HGETALL HDEL
+    lists: LPUSH RPUSH LPOP RPOP LRANGE LLEN BLPOP
+    pubsub: PUBLISH SUBSCRIBE UNSUBSCRIBE PSUBSCRIBE PUNSUBSCRIBE, and keyspace notifications
+    streams: XADD XLEN XRANGE XGROUP CREATE XREADGROUP XACK XPENDING
+    timeseries: TS.CREATE TS.ALTER TS.ADD TS.MADD TS.GET TS.RANGE TS.MRANGE TS.INFO TS.CREATERULE
+    server: PING ECHO SELECT CONFIG GET/SET MULTI EXEC DISCARD
+"""
+
+import bisect
+import fnmatch
+import statistics
+import threading
+import time
+import weakref
+from collections import OrderedDict, defaultdict, deque
+
+from redis import ConnectionPool
+from redis.connection import Connection
+from redis.exceptions import ResponseError
+
+BACKEND_ENV = 'MKIDCONTROL_REDIS_BACKEND'
+
+OK = b'OK'
+WRONGTYPE = 'WRONGTYPE Operation against a key holding the wrong kind of value'
+MAX_TIMESTAMP = 2 ** 63 - 1
+
+
+class MultiReply(list):
+    """ Several replies to a single command (e.g. SUBSCRIBE to several channels) """
+
+
+def memory_connection_pool(host='localhost', port=6379, db=0, **kwargs):
+    """ A redis-py ConnectionPool whose connections talk to the MemoryServer for host and port """
+    return ConnectionPool(connection_class=MemoryConnection, host=host, port=port, db=db, **kwargs)
+
+
+class MemoryConnection(Connection):
+    """ A redis-py Connection to a MemoryServer instead of a socket """
+    description_format = "MemoryConnection<host=%(host)s,port=%(port)s,db=%(db)s>"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._server = None
+        self._replies = deque()
+        self._reply_ready = threading.Condition()
+        self.queued = None  # Commands of an open MULTI
+        self.channels = set()
+        self.patterns = set()
+
+    def connect(self):
+        if self._sock:
+            return
+        self._server = MemoryServer.get(self.host, self.port)
+        self._sock = self._server
+        for callback in tuple(self._connect_callbacks):
+            if isinstance(callback, weakref.ref):
+                callback = callback()
+            if callback is not None:
+                callback(self)
+
+    def disconnect(self, *args):
+        if self._server is not None:
+            self._server.drop(self)
+        self._server = None
+        self._sock = None
+        self.queued = None
+        with self._reply_ready:
+            self._replies.clear()
+
+    def pack_command(self, *args):
+        if isinstance(args[0], str):
+            args = tuple(args[0].split()) + args[1:]
+        return [tuple(self.encoder.encode(a) for a in args)]
+
+    def pack_commands(self, commands):
+        return [packed for args in commands for packed in self.pack_command(*args)]
+
+    def send_packed_command(self, command, check_health=True):
+        if not self._sock:
+            self.connect()
+        for args in command:
+            reply = self._server.execute(self, list(args))
+            if isinstance(reply, MultiReply):
+                for r in reply:
+                    self.push(r)
+            else:
+                self.push(reply)
+
+    def push(self, reply):
+        """ Queue a reply (or pubsub message) to be read """
+        with self._reply_ready:
+            self._replies.append(reply)
+            self._reply_ready.notify_all()
+
+    def can_read(self, timeout=0):
+        if not self._sock:
+            self.connect()
+        with self._reply_ready:
+            return self._reply_ready.wait_for(lambda: self._replies, timeout)
+
+    def read_response(self, *args, **kwargs):
+        with self._reply_ready:
+            self._reply_ready.wait_for(lambda: self._replies)
+            reply = self._replies.popleft()
+        if isinstance(reply, ResponseError):
+            raise reply
+        if self.encoder.decode_responses:
+            reply = _decode(reply, self.encoder)
+        return reply
+
+
+def _decode(reply, encoder):
+    if isinstance(reply, bytes):
+        return encoder.decode(reply)
+    if isinstance(reply, list):
+        return [_decode(r, encoder) for r in reply]
+    return reply
+
+
+class MemoryServer:
+    """ The data and pubsub state shared by all MemoryConnections to one (host, port) """
+    _servers = {}
+    _servers_lock = threading.Lock()
+
+    @classmethod
+    def get(cls, host='localhost', port=6379):
+        with cls._servers_lock:
+            try:
+                return cls._servers[(host, port)]
+            except KeyError:
+                cls._servers[(host, port)] = server = cls()
+                return server
+
+    def __init__(self):
+        self._lock = threading.Condition(threading.RLock())  # Notified after every command, for blocking commands
+        self._data = defaultdict(dict)  # db: {key: bytes | list | dict | TimeSeries | Stream}
+        self._expires = defaultdict(dict)  # db: {key: time.time() of expiry}
+        self._channels = defaultdict(set)  # channel: connections
+        self._patterns = defaultdict(set)  # pattern: connections
+        self.config = {'notify-keyspace-events': ''}
+
+    def execute(self, conn, args):
+        """ Execute a command (list of bytes) for conn, returning the reply """
+        name = args[0].decode().upper()
+        with self._lock:
+            if conn.queued is not None and name not in ('EXEC', 'DISCARD', 'MULTI'):
+                conn.queued.append(args)
+                return b'QUEUED'
+            handler = getattr(self, f"_cmd_{name.lower().replace('.', '_')}", None)
+            if handler is None:
+                return ResponseError(f"ERR unknown command '{name}'")
+            try:
+                reply = handler(conn, *args[1:])
+            except ResponseError as e:
+                reply = e
+            except (TypeError, IndexError):
+                reply = ResponseError(f"ERR wrong number of arguments for '{name.lower()}' command")
+            except ValueError:
+                reply = ResponseError("ERR syntax error")
+            self._lock.notify_all()
+            return reply
+
+    def drop(self, conn):
+        """ Forget a disconnected connection """
+        with self._lock:
+            for c in conn.channels:
+                self._channels[c].discard(conn)
+            for p in conn.patterns:
+                self._patterns[p].discard(conn)
+            conn.channels.clear()
+            conn.patterns.clear()
+
+    # Keyspace
+    def _db(self, conn):
+        return self._data[conn.db]
+
+    def _lookup(self, conn, key, kind=None):
+        """ Return the live value at key (None if missing), raising WRONGTYPE if it isn't of kind """
+        expiry = self._expires[conn.db].get(key)
+        if expiry is not None and time.time() >= expiry:
+            self._delete(conn, key)
+            self._notify(conn, 'x', 'expired', key)
+        value = self._data[conn.db].get(key)
+        if value is not None and kind is not None and not isinstance(value, kind):
+            raise ResponseError(WRONGTYPE)
+        return value
+
+    def _delete(self, conn, key):
+        self._expires[conn.db].pop(key, None)
+        return self._data[conn.db].pop(key, None) is not None
+
+    def _notify(self, conn, kind, event, key):
+        """ Publish a keyspace notification if they are enabled for events of kind (see redis.conf) """
+        flags = self.config['notify-keyspace-events']
+        if 'A' in flags:
+            flags += 'g$lshzxe'
+        if kind not in flags:
+            return
+        key = key.decode() if isinstance(key, bytes) else key
+        if 'K' in flags:
+            self._publish(f'__keyspace@{conn.db}__:{key}'.encode(), event.encode())
+        if 'E' in flags:
+            self._publish(f'__keyevent@{conn.db}__:{event}'.encode(), key.encode())
+
+    # Connection and server
+    def _cmd_ping(self, conn, message=None):
+        if conn.channels or conn.patterns:
+            return [b'pong', message or b'']
+        return message if message is not None else b'PONG'
+
+    def _cmd_echo(self, conn, message):
+        return message
+
+    def _cmd_select(self, conn, db):
+        conn.db = int(db)
+        return OK
+
+    def _cmd_config(self, conn, sub, *args):
+        sub = sub.decode().upper()
+        if sub == 'GET':
+            pattern = args[0].decode()
+            return [x for k, v in self.config.items() if fnmatch.fnmatchcase(k, pattern) for x in (k.encode(),
+                                                                                                 v.encode())]
+        if sub == 'SET':
+            self.config[args[0].decode()] = args[1].decode()
+            return OK
+        raise ResponseError(f"ERR Unknown subcommand or wrong number of arguments for '{sub}'")
+
+    def _cmd_multi(self, conn):
+        if conn.queued is not None:
+            raise ResponseError('ERR MULTI calls can not be nested')
+        conn.queued = []
+        return OK
+
+    def _cmd_exec(self, conn):
+        if conn.queued is None:
+            raise ResponseError('ERR EXEC without MULTI')
+        queued, conn.queued = conn.queued, None
+        return [self.execute(conn, args) for args in queued]
+
+    def _cmd_discard(self, conn):
+        if conn.queued is None:
+            raise ResponseError('ERR DISCARD without MULTI')
+        conn.queued = None
+        return OK
+
+    def _cmd_flushdb(self, conn, *args):
+        self._data[conn.db].clear()
+        self._expires[conn.db].clear()
+        return OK
+
+    def _cmd_flushall(self, conn, *args):
+        self._data.clear()
+        self._expires.clear()
+        return OK
+
+    # Generic
+    def _cmd_del(self, conn, *keys):
+        n = 0
+        for k in keys:
+            if self._lookup(conn, k) is not None:
+                self._delete(conn, k)
+                self._notify(conn, 'g', 'del', k)
+                n += 1
+        return n
+
+    def _cmd_exists(self, conn, *keys):
+        return sum(self._lookup(conn, k) is not None for k in keys)
+
+    def _cmd_keys(self, conn, pattern):
+        pattern = pattern.decode()
+        return [k for k in list(self._db(conn)) if self._lookup(conn, k) is not None and
+                fnmatch.fnmatchcase(k.decode(), pattern)]
+
+    def _cmd_type(self, conn, key):
+        value = self._lookup(conn, key)
+        return {bytes: b'string', list: b'list', dict: b'hash', TimeSeries: b'TSDB-TYPE',
+                Stream: b'stream'}.get(type(value), b'none')
+
+    def _cmd_expire(self, conn, key, seconds):
+        return self._cmd_pexpire(conn, key, int(seconds) * 1000)
+
+    def _cmd_pexpire(self, conn, key, ms):
+        if self._lookup(conn, key) is None:
+            return 0
+        self._expires[conn.db][key] = time.time() + int(ms) / 1000
+        self._notify(conn, 'g', 'expire', key)
+        return 1
+
+    def _cmd_ttl(self, conn, key):
+        if self._lookup(conn, key) is None:
+            return -2
+        expiry = self._expires[conn.db].get(key)
+        return -1 if expiry is None else int(round(expiry - time.time()))
+
+    # Strings
+    def _cmd_get(self, conn, key):
+        return self._lookup(conn, key, bytes)
+
+    def _cmd_mget(self, conn, *keys):
+        values = [self._lookup(conn, k) for k in keys]
+        return [v if isinstance(v, bytes) else None for v in values]
+
+    def _cmd_set(self, conn, key, value, *options):
+        options = [o.decode().upper() if i == 0 or options[i - 1].decode().upper() not in ('EX', 'PX') else o
+                   for i, o in enumerate(options)]
+        exists = self._lookup(conn, key) is not None
+        if ('NX' in options and exists) or ('XX' in options and not exists):
+            return None
+        expiry = self._expires[conn.db].get(key) if 'KEEPTTL' in options else None
+        if 'EX' in options:
+            expiry = time.time() + int(options[options.index('EX') + 1])
+        elif 'PX' in options:
+            expiry = time.time() + int(options[options.index('PX') + 1]) / 1000
+        self._delete(conn, key)
+        self._db(conn)[key] = value
+        if expiry is not None:
+            self._expires[conn.db][key] = expiry
+        self._notify(conn, '$', 'set', key)
+        return OK
+
+    # Hashes
+    def _cmd_hset(self, conn, key, *pairs):
+        if not pairs or len(pairs) % 2:
+            raise TypeError
+        h = self._lookup(conn, key, dict)
+        if h is None:
+            h = self._db(conn)[key] = {}
+        n = sum(f not in h for f in pairs[::2])
+        h.update(zip(pairs[::2], pairs[1::2]))
+        self._notify(conn, 'h', 'hset', key)
+        return n
+
+    def _cmd_hget(self, conn, key, field):
+        return (self._lookup(conn, key, dict) or {}).get(field)
+
+    def _cmd_hgetall(self, conn, key):
+        return [x for kv in (self._lookup(conn, key, dict) or {}).items() for x in kv]
+
+    def _cmd_hdel(self, conn, key, *fields):
+        h = self._lookup(conn, key, dict) or {}
+        n = sum(h.pop(f, None) is not None for f in fields)
+        if not h:
+            self._delete(conn, key)
+        return n
+
+    # Lists
+    def _push(self, conn, key, values, left):
+        lst = self._lookup(conn, key, list)
+        if lst is None:
+            lst = self._db(conn)[key] = []
+        for v in values:
+            if left:
+                lst.insert(0, v)
+            else:
+                lst.append(v)
+        self._notify(conn, 'l', 'lpush' if left else 'rpush', key)
+        return len(lst)
+
+    def _cmd_lpush(self, conn, key, *values):
+        return self._push(conn, key, values, left=True)
+
+    def _cmd_rpush(self, conn, key, *values):
+        return self._push(conn, key, values, left=False)
+
+    def _pop(self, conn, key, left):
+        lst = self._lookup(conn, key, list)
+        if not lst:
+            return None
+        value = lst.pop(0 if left else -1)
+        if not lst:
+            self._delete(conn, key)
+        return value
+
+    def _cmd_lpop(self, conn, key):
+        return self._pop(conn, key, left=True)
+
+    def _cmd_rpop(self, conn, key):
+        return self._pop(conn, key, left=False)
+
+    def _cmd_llen(self, conn, key):
+        return len(self._lookup(conn, key, list) or ())
+
+    def _cmd_lrange(self, conn, key, start, stop):
+        lst = self._lookup(conn, key, list) or []
+        start, stop = int(start), int(stop)
+        stop = len(lst) if stop == -1 else (stop + 1 if stop >= 0 else stop + 1)
+        return lst[start:stop]
+
+    def _cmd_blpop(self, conn, *args):
+        keys, timeout = args[:-1], float(args[-1])
+        if not keys:
+            raise TypeError
+        deadline = None if timeout == 0 else time.monotonic() + timeout
+        while True:
+            for k in keys:
+                value = self._pop(conn, k, left=True)
+                if value is not None:
+                    return [k, value]
+            if conn.queued is not None or (deadline is not None and time.monotonic() >= deadline):
+                return None
+            self._lock.wait(None if deadline is None else deadline - time.monotonic())
+
+    # Pubsub
+    def _publish(self, channel, message):
+        receivers = 0
+        for conn in tuple(self._channels.get(channel, ())):
+            conn.push([b'message', channel, message])
+            receivers += 1
+        for pattern, conns in tuple(self._patterns.items()):
+            if conns and fnmatch.fnmatchcase(channel.decode(), pattern.decode()):
+                for conn in tuple(conns):
+                    conn.push([b'pmessage', pattern, channel, message])
+                    receivers += 1
+        return receivers
+
+    def _cmd_publish(self, conn, channel, message):
+        return self._publish(channel, message)
+
+    def _subscribe(self, conn, names, pattern, subscribe):
+        subscriptions = self._patterns if pattern else self._channels
+        mine = conn.patterns if pattern else conn.channels
+        kind = ('p' if pattern else '') + ('subscribe' if subscribe else 'unsubscribe')
+        if not subscribe and not names:
+            names = tuple(mine)
+        replies = MultiReply()
+        for name in names:
+            if subscribe:
+                subscriptions[name].add(conn)
+                mine.add(name)
+            else:
+                subscriptions[name].discard(conn)
+                mine.discard(name)
+            replies.append([kind.encode(), name, len(conn.channels) + len(conn.patterns)])
+        if not replies and not subscribe:
+            replies.append([kind.encode(), None, len(conn.channels) + len(conn.patterns)])
+        return replies
+
+    def _cmd_subscribe(self, conn, *channels):
+        return self._subscribe(conn, channels, pattern=False, subscribe=True)
+
+    def _cmd_unsubscribe(self, conn, *channels):
+        return self._subscribe(conn, channels, pattern=False, subscribe=False)
+
+    def _cmd_psubscribe(self, conn, *patterns):
+        return self._subscribe(conn, patterns, pattern=True, subscribe=True)
+
+    def _cmd_punsubscribe(self, conn, *patterns):
+        return self._subscribe(conn, patterns, pattern=True, subscribe=False)
+
+    # Streams
+    def _cmd_xadd(self, conn, key, *args):
+        args = list(args)
+        maxlen = None
+        if args[0].upper() == b'MAXLEN':
+            args.pop(0)
+            if args[0] in (b'~', b'='):
+                args.pop(0)
+            maxlen = int(args.pop(0))
+        id, fields = args[0], args[1:]
+        if not fields or len(fields) % 2:
+            raise TypeError
+        stream = self._lookup(conn, key, Stream)
+        if stream is None:
+            stream = self._db(conn)[key] = Stream()
+        id = stream.add(id, fields)
+        if maxlen is not None:
+            stream.trim(maxlen)
+        self._notify(conn, 't', 'xadd', key)
+        return stream_id(id)
+
+    def _cmd_xlen(self, conn, key):
+        stream = self._lookup(conn, key, Stream)
+        return 0 if stream is None else len(stream.entries)
+
+    def _cmd_xrange(self, conn, key, start, end, *args):
+        stream = self._lookup(conn, key, Stream)
+        if stream is None:
+            return []
+        count = int(args[1]) if args else None
+        lo, hi = parse_stream_id(start, 0), parse_stream_id(end, MAX_TIMESTAMP)
+        entries = [[stream_id(i), f] for i, f in stream.entries.items() if lo <= i <= hi]
+        return entries[:count] if count is not None else entries
+
+    def _cmd_xgroup(self, conn, sub, key, group, *args):
+        sub = sub.decode().upper()
+        if sub != 'CREATE':
+            raise ResponseError(f"ERR Unknown XGROUP subcommand '{sub}'")
+        stream = self._lookup(conn, key, Stream)
+        if stream is None:
+            if b'MKSTREAM' not in (a.upper() for a in args[1:]):
+                raise ResponseError('ERR The XGROUP subcommand requires the key to exist. Note that for CREATE you '
+                                    'may want to use the MKSTREAM option to create an empty stream automatically.')
+            stream = self._db(conn)[key] = Stream()
+        if group in stream.groups:
+            raise ResponseError('BUSYGROUP Consumer Group name already exists')
+        start = stream.last_id if args[0] == b'$' else parse_stream_id(args[0], 0)
+        stream.groups[group] = ConsumerGroup(start)
+        return OK
+
+    def _cmd_xreadgroup(self, conn, *args):
+        args = list(args)
+        if args.pop(0).upper() != b'GROUP':
+            raise ValueError
+        group, consumer = args.pop(0), args.pop(0)
+        count, block = None, None
+        while args[0].upper() != b'STREAMS':
+            option = args.pop(0).upper()
+            if option == b'COUNT':
+                count = int(args.pop(0))
+            elif option == b'BLOCK':
+                block = int(args.pop(0))
+            elif option != b'NOACK':
+                raise ValueError
+        args.pop(0)
+        if not args or len(args) % 2:
+            raise ValueError
+        keys, ids = args[:len(args) // 2], args[len(args) // 2:]
+        groups = []
+        for k in keys:
+            stream = self._lookup(conn, k, Stream)
+            if stream is None or group not in stream.groups:
+                raise ResponseError(f"NOGROUP No such key '{k.decode()}' or consumer group '{group.decode()}' in "
+                                    f"XREADGROUP with GROUP option")
+            groups.append(stream)
+
+        deadline = None if not block else time.monotonic() + block / 1000
+        while True:
+            reply = []
+            for k, stream, id in zip(keys, groups, ids):
+                g = stream.groups[group]
+                if id == b'>':
+                    entries = g.deliver_new(stream, consumer, count)
+                    if entries:
+                        reply.append([k, entries])
+                else:
+                    reply.append([k, g.deliver_pending(stream, consumer, parse_stream_id(id, 0), count)])
+            if reply or block is None or conn.queued is not None:
+                return reply or None
+            if deadline is not None and time.monotonic() >= deadline:
+                return None
+            self._lock.wait(None if deadline is None else deadline - time.monotonic())
+
+    def _cmd_xack(self, conn, key, group, *ids):
+        stream = self._lookup(conn, key, Stream)
+        if stream is None or group not in stream.groups:
+            return 0
+        pending = stream.groups[group].pending
+        return sum(pending.pop(parse_stream_id(i, 0), None) is not None for i in ids)
+
+    def _cmd_xpending(self, conn, key, group, *args):
+        stream = self._lookup(conn, key, Stream)
+        if stream is None or group not in stream.groups:
+            raise ResponseError(f"NOGROUP No such key '{key.decode()}' or consumer group '{group.decode()}'")
+        pending = stream.groups[group].pending
+        if not args:
+            if not pending:
+                return [0, None, None, None]
+            consumers = defaultdict(int)
+            for c, _, _ in pending.values():
+                consumers[c] += 1
+            ids = sorted(pending)
+            return [len(pending), stream_id(ids[0]), stream_id(ids[-1]),
+                    [[c, str(n).encode()] for c, n in consumers.items()]]
+        lo, hi, count = parse_stream_id(args[0], 0), parse_stream_id(args[1], MAX_TIMESTAMP), int(args[2])
+        consumer = args[3] if len(args) > 3 else None
+        now = time.monotonic()
+        reply = [[stream_id(i), c, int((now - t) * 1000), n] for i, (c, t, n) in sorted(pending.items())
+                 if lo <= i <= hi and (consumer is None or c == consumer)]
+        return reply[:count]
+
+    # Timeseries
+    def _ts(self, conn, key):
+        ts = self._lookup(conn, key)
+        if ts is None:
+            raise ResponseError('ERR TSDB: the key does not exist')
+        if not isinstance(ts, TimeSeries):
+            raise ResponseError(WRONGTYPE)
+        return ts
+
+    def _cmd_ts_create(self, conn, key, *args):
+        if self._lookup(conn, key) is not None:
+            raise ResponseError('ERR TSDB: key already exists')
+        self._db(conn)[key] = TimeSeries(**parse_ts_options(args))
+        self._notify(conn, 'g', 'ts.create', key)
+        return OK
+
+    def _cmd_ts_alter(self, conn, key, *args):
+        ts = self._ts(conn, key)
+        options = parse_ts_options(args)
+        for k in ('retention', 'duplicate_policy', 'labels'):
+            if k in options:
+                setattr(ts, k, options[k])
+        return OK
+
+    def _ts_add(self, conn, key, timestamp, value, duplicate_policy=None):
+        ts = self._ts(conn, key)
+        timestamp = int(time.time() * 1000) if timestamp == b'*' else int(timestamp)
+        emitted = ts.add(timestamp, float(value), duplicate_policy)
+        for dest, t, v in emitted:
+            dest_ts = self._lookup(conn, dest, TimeSeries)
+            if dest_ts is not None:
+                dest_ts.add(t, v, 'last')
+        self._notify(conn, 'g', 'ts.add', key)
+        return timestamp
+
+    def _cmd_ts_add(self, conn, key, timestamp, value, *args):
+        options = parse_ts_options(args)
+        if self._lookup(conn, key) is None:
+            self._db(conn)[key] = TimeSeries(**{k: v for k, v in options.items() if k != 'on_duplicate'})
+        return self._ts_add(conn, key, timestamp, value, options.get('on_duplicate'))
+
+    def _cmd_ts_madd(self, conn, *args):
+        if not args or len(args) % 3:
+            raise TypeError
+        reply = []
+        for key, timestamp, value in zip(args[::3], args[1::3], args[2::3]):
+            try:
+                reply.append(self._ts_add(conn, key, timestamp, value))
+            except (ResponseError, ValueError) as e:
+                reply.append(e if isinstance(e, ResponseError) else ResponseError('ERR TSDB: invalid value'))
+        return reply
+
+    def _cmd_ts_get(self, conn, key):
+        ts = self._ts(conn, key)
+        if not ts.t:
+            return []
+        return [ts.t[-1], format_value(ts.v[-1])]
+
+    def _cmd_ts_range(self, conn, key, start, end, *args):
+        options = parse_range_options(args)
+        return [[t, format_value(v)] for t, v in self._ts(conn, key).range(start, end, **options)]
+
+    def _cmd_ts_mrange(self, conn, start, end, *args):
+        args = list(args)
+        if b'FILTER' not in (a.upper() for a in args):
+            raise ResponseError('ERR TSDB: missing FILTER argument')
+        i = [a.upper() for a in args].index(b'FILTER')
+        filters, args = [f.decode() for f in args[i + 1:]], args[:i]
+        with_labels = any(a.upper() == b'WITHLABELS' for a in args)
+        options = parse_range_options([a for a in args if a.upper() != b'WITHLABELS'])
+        reply = []
+        for key in sorted(self._db(conn)):
+            ts = self._lookup(conn, key)
+            if isinstance(ts, TimeSeries) and ts.matches(filters):
+                labels = [[k.encode(), v.encode()] for k, v in ts.labels.items()] if with_labels else []
+                reply.append([key, labels, [[t, format_value(v)] for t, v in ts.range(start, end, **options)]])
+        return reply
+
+    def _cmd_ts_info(self, conn, key):
+        ts = self._ts(conn, key)
+        return [b'totalSamples', len(ts.t), b'memoryUsage', 16 * len(ts.t) + 200,
+                b'firstTimestamp', ts.t[0] if ts.t else 0, b'lastTimestamp', ts.t[-1] if ts.t else 0,
+                b'retentionTime', ts.retention, b'chunkCount', len(ts.t) // 256 + 1,
+                b'maxSamplesPerChunk', 256, b'chunkSize', 4096,
+                b'duplicatePolicy', ts.duplicate_policy.encode() if ts.duplicate_policy else None,
+                b'labels', [[k.encode(), v.encode()] for k, v in ts.labels.items()],
+                b'sourceKey', ts.source_key,
+                b'rules', [[r.dest, r.bucket, r.aggregation.upper().encode()] for r in ts.rules]]
+
+    def _cmd_ts_createrule(self, conn, source, dest, aggregation, agg_type, bucket):
+        if aggregation.upper() != b'AGGREGATION':
+            raise ValueError
+        src, dest_ts = self._ts(conn, source), self._ts(conn, dest)
+        if dest_ts.source_key is not None or any(r.dest == dest for r in src.rules):
+            raise ResponseError('ERR TSDB: the destination key already has a rule')
+        src.rules.append(CompactionRule(dest, agg_type.decode().lower(), int(bucket)))
+        dest_ts.source_key = source
+        return OK
+
+
+def format_value(v):
+    return repr(float(v)).encode()
+
+
+def parse_ts_options(args):
+    """ Parse the RETENTION/LABELS/DUPLICATE_POLICY/... options of TS.CREATE/TS.ALTER/TS.ADD """
+    options = {}
+    args = list(args)
+    while args:
+        option = args.pop(0).upper()
+        if option == b'RETENTION':
+            options['retention'] = int(args.pop(0))
+        elif option == b'CHUNK_SIZE':
+            args.pop(0)
+        elif option == b'UNCOMPRESSED':
+            pass
+        elif option == b'DUPLICATE_POLICY':
+            options['duplicate_policy'] = args.pop(0).decode().lower()
+        elif option == b'ON_DUPLICATE':
+            options['on_duplicate'] = args.pop(0).decode().lower()
+        elif option == b'LABELS':
+            if len(args) % 2:
+                raise ValueError
+            options['labels'] = {k.decode(): v.decode() for k, v in zip(args[::2], args[1::2])}
+            args = []
+        else:
+            raise ValueError
+    return options
+
+
+def parse_range_options(args):
+    """ Parse the COUNT/AGGREGATION options of TS.RANGE/TS.MRANGE """
+    options = {}
+    args = list(args)
+    while args:
+        option = args.pop(0).upper()
+        if option == b'COUNT':
+            options['count'] = int(args.pop(0))
+        elif option == b'AGGREGATION':
+            options['aggregation'] = args.pop(0).decode().lower()
+            options['bucket'] = int(args.pop(0))
+        elif option == b'ALIGN':
+            args.pop(0)
+        else:
+            raise ValueError
+    return options
+
+
+def aggregate(aggregation, values):
+    if aggregation == 'avg':
+        return sum(values) / len(values)
+    if aggregation == 'sum':
+        return sum(values)
+    if aggregation == 'min':
+        return min(values)
+    if aggregation == 'max':
+        return max(values)
+    if aggregation == 'range':
+        return max(values) - min(values)
+    if aggregation == 'count':
+        return len(values)
+    if aggregation == 'first':
+        return values[0]
+    if aggregation == 'last':
+        return values[-1]
+    if aggregation == 'std.p':
+        return statistics.pstdev(values)
+    if aggregation == 'std.s':
+        return statistics.stdev(values) if len(values) > 1 else 0.0
+    if aggregation == 'var.p':
+        return statistics.pvariance(values)
+    if aggregation == 'var.s':
+        return statistics.variance(values) if len(values) > 1 else 0.0
+    raise ResponseError('ERR TSDB: Unknown aggregation type')
+
+
+class CompactionRule:
+    def __init__(self, dest, aggregation, bucket):
+        self.dest = dest
+        self.aggregation = aggregation
+        self.bucket = bucket
+        self.open_bucket = None  # Start of the bucket samples are being added to, emitted when it closes
+
+
+class TimeSeries:
+    """ A RedisTimeSeries key: samples sorted by timestamp, with retention, labels and compaction rules """
+    def __init__(self, retention=0, labels=None, duplicate_policy=None):
+        self.retention = retention
+        self.labels = labels or {}
+        self.duplicate_policy = duplicate_policy
+        self.rules = []
+        self.source_key = None
+        self.t = []
+        self.v = []
+
+    def add(self, t, v, duplicate_policy=None):
+        """ Add a sample, returning (dest key, bucket start, value) for any compaction buckets it closed """
+        if self.retention and self.t and t < self.t[-1] - self.retention:
+            raise ResponseError('ERR TSDB: Timestamp is older than retention')
+        i = bisect.bisect_left(self.t, t)
+        if i < len(self.t) and self.t[i] == t:
+            policy = duplicate_policy or self.duplicate_policy or 'block'
+            old = self.v[i]
+            if policy == 'block':
+                raise ResponseError('ERR TSDB: Error at upsert, update is not supported in BLOCK mode')
+            self.v[i] = {'first': old, 'last': v, 'min': min(old, v), 'max': max(old, v), 'sum': old + v}[policy]
+            return []
+        self.t.insert(i, t)
+        self.v.insert(i, v)
+
+        emitted = []
+        if i == len(self.t) - 1:
+            for rule in self.rules:
+                start = t - t % rule.bucket
+                if rule.open_bucket is not None and start > rule.open_bucket:
+                    lo = bisect.bisect_left(self.t, rule.open_bucket)
+                    hi = bisect.bisect_left(self.t, rule.open_bucket + rule.bucket)
+                    if hi > lo:
+                        emitted.append((rule.dest, rule.open_bucket, aggregate(rule.aggregation, self.v[lo:hi])))
+                rule.open_bucket = start
+        if self.retention:
+            cut = bisect.bisect_left(self.t, self.t[-1] - self.retention)
+            if cut:
+                del self.t[:cut]
+                del self.v[:cut]
+        return emitted
+
+    def range(self, start, end, count=None, aggregation=None, bucket=None):
+        start = 0 if start == b'-' else int(start)
+        end = MAX_TIMESTAMP if end == b'+' else int(end)
+        lo, hi = bisect.bisect_left(self.t, start), bisect.bisect_right(self.t, end)
+        samples = list(zip(self.t[lo:hi], self.v[lo:hi]))
+        if aggregation is not None:
+            buckets = OrderedDict()
+            for t, v in samples:
+                buckets.setdefault(t - t % bucket, []).append(v)
+            samples = [(t, aggregate(aggregation, vs)) for t, vs in buckets.items()]
+        return samples[:count] if count is not None else samples
+
+    def matches(self, filters):
+        """ Whether the series' labels match all of the TS.MRANGE filters (label=value, label!=value, ...) """
+        for f in filters:
+            negate = '!=' in f
+            label, value = f.split('!=' if negate else '=', 1)
+            values = value[1:-1].split(',') if value.startswith('(') else [value]
+            have = self.labels.get(label, '')
+            if (have in values) == negate:
+                return False
+        return True
+
+
+def parse_stream_id(id, default_seq):
+    """ Parse a stream ID (b'ms-seq', b'ms', b'-' or b'+') to a (ms, seq) tuple """
+    if id == b'-':
+        return 0, 0
+    if id == b'+':
+        return MAX_TIMESTAMP, MAX_TIMESTAMP
+    ms, _, seq = id.partition(b'-')
+    return int(ms), int(seq) if seq else default_seq
+
+
+def stream_id(id):
+    return f'{id[0]}-{id[1]}'.encode()
+
+
+class ConsumerGroup:
+    def __init__(self, last_delivered):
+        self.last_delivered = last_delivered
+        self.pending = {}  # id: [consumer, delivery time.monotonic(), delivery count]
+
+    def deliver_new(self, stream, consumer, count):
+        entries = []
+        for id, fields in stream.entries.items():
+            if id <= self.last_delivered:
+                continue
+            if count is not None and len(entries) >= count:
+                break
+            self.pending[id] = [consumer, time.monotonic(), 1]
+            self.last_delivered = id
+            entries.append([stream_id(id), fields])
+        return entries
+
+    def deliver_pending(self, stream, consumer, after, count):
+        entries = []
+        for id in sorted(self.pending):
+            c, _, n = self.pending[id]
+            if id <= after or c != consumer:
+                continue
+            if count is not None and len(entries) >= count:
+                break
+            self.pending[id] = [c, time.monotonic(), n + 1]
+            entries.append([stream_id(id), stream.entries.get(id)])
+        return entries
+
+
+class Stream:
+    def __init__(self):
+        self.entries = OrderedDict()  # (ms, seq): [field, value, ...]
+        self.last_id = (0, 0)
+        self.groups = {}  # name: ConsumerGroup
+
+    def add(self, id, fields):
+        if id == b'*':
+            ms = int(time.time() * 1000)
+            id = (ms, self.last_id[1] + 1) if ms <= self.last_id[0] else (ms, 0)
+            if ms < self.last_id[0]:
+                id = (self.last_id[0], self.last_id[1] + 1)
+        else:
+            id = parse_stream_id(id, 0)
+            if id <= self.last_id:
+                raise ResponseError('ERR The ID specified in XADD is equal or smaller than the target stream top item')
+        self.entries[id] = list(fields)
+        self.last_id = id
+        return id
+
+    def trim(self, maxlen):
+        while len(self.entries) > maxlen:
+            self.entries.popitem(last=False)
@@ -11,12 +11,497 @@ from redis import RedisError, ConnectionError, TimeoutError, AuthenticationError
     InvalidResponse, ResponseError, DataError, PubSubError, WatchError, \
     ReadOnlyError, ChildDeadlockedError, AuthenticationWrongNumberOfArgsError
 from redistimeseries.client import Client as _RTSClient
+import asyncio
+import functools
 import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 import json
+import numpy as np
+from mkidcontrol.tsarchive import TSArchive
+from mkidcontrol.memredis import BACKEND_ENV, memory_connection_pool
 # from .config import REDIS_DB
 
 REDIS_DB = 0
+TS_ARCHIVE_DIR_KEY = 'paths:ts-archive-dir'
+
+COMMAND_STREAM_KEY = 'command-stream:{}'  # Stream of commands for an agent, see send_command and listen_commands
+COMMAND_RESULT_KEY = 'command-result:{}:{}'  # Completion record of a command, by agent and command id
+COMMAND_STREAM_MAXLEN = 1000
+COMMAND_RESULT_TTL = 300  # s
+COMMAND_MAX_DELIVERIES = 3  # A command is abandoned if the agent dies handling it this many times
+PUBSUB_ERROR_BACKOFF = 1  # s, to wait after an unexpected error reading pubsub before trying again
+
+
+class PubSubListener:
+    """
+    A single consumer of a PubSubHub. Messages on any of the listener's channels are placed in a bounded queue by the
+    hub's reader thread and may be consumed with get() or by iterating over the listener. Channels may be added or
+    removed at any time with subscribe()/unsubscribe() and glob-style patterns with psubscribe()/punsubscribe().
+    close() (or leaving a with block) detaches the listener from the hub, which unsubscribes redis from any channel no
+    longer wanted by another listener.
+    """
+    def __init__(self, hub, maxsize=1000):
+        self._hub = hub
+        self.queue = queue.Queue(maxsize=maxsize)
+        self.channels = set()
+        self.patterns = set()
+        self.dropped = 0
+        self.closed = False
+
+    def subscribe(self, channels: (list, tuple, str)):
+        self._hub._subscribe(self, channels)
+
+    def unsubscribe(self, channels: (list, tuple, str)):
+        self._hub._unsubscribe(self, channels)
+
+    def psubscribe(self, patterns: (list, tuple, str)):
+        self._hub._subscribe(self, patterns, pattern=True)
+
+    def punsubscribe(self, patterns: (list, tuple, str)):
+        self._hub._unsubscribe(self, patterns, pattern=True)
+
+    def close(self):
+        if not self.closed:
+            self._hub._remove(self)
+            self.closed = True
+
+    def wake(self):
+        """
+        Have the consumer's pending (or next) get() return (None, 'wake') now. Safe to call from any thread, e.g. for a
+        loop blocked on the listener to react to something other than a message.
+        """
+        self._put((None, 'wake'))
+
+    def _put(self, item):
+        """ Called by the hub. If the queue is full the oldest message is discarded to make room. """
+        while True:
+            try:
+                self.queue.put_nowait(item)
+                return
+            except queue.Full:
+                try:
+                    self.queue.get_nowait()
+                    self.dropped += 1
+                    logging.getLogger(__name__).warning(f"Pubsub listener on {self.channels} is full, dropped a "
+                                                        f"message")
+                except queue.Empty:
+                    pass
+
+    def get(self, timeout=None):
+        """
+        Return the next (channel, data) pair received, both decoded strings. Raises queue.Empty if nothing arrives
+        within timeout and passes up any redis error encountered by the hub.
+        """
+        item = self.queue.get(timeout=timeout)
+        if isinstance(item, Exception):
+            self.closed = True
+            raise item
+        return item
+
+    def __iter__(self):
+        while True:
+            yield self.get()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class AsyncPubSubListener(PubSubListener):
+    """
+    A PubSubListener for an asyncio event loop: the hub's reader thread hands messages to a bounded asyncio.Queue on the
+    loop, consumed with get() or async for. Create it (with PubSubHub.listener(cls=AsyncPubSubListener)) on the loop.
+    """
+    def __init__(self, hub, maxsize=1000):
+        super().__init__(hub, maxsize=maxsize)
+        self._loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize=maxsize)
+
+    def _put(self, item):
+        """ Called by the hub from its thread """
+        try:
+            self._loop.call_soon_threadsafe(self._put_nowait, item)
+        except RuntimeError:  # The loop has been closed
+            pass
+
+    def _put_nowait(self, item):
+        """ If the queue is full the oldest message is discarded to make room """
+        while True:
+            try:
+                self.queue.put_nowait(item)
+                return
+            except asyncio.QueueFull:
+                self.queue.get_nowait()
+                self.dropped += 1
+                logging.getLogger(__name__).warning(f"Pubsub listener on {self.channels} is full, dropped a message")
+
+    async def get(self, timeout=None):
+        """
+        Return the next (channel, data) pair received, both decoded strings. Raises asyncio.TimeoutError if nothing
+        arrives within timeout and passes up any redis error encountered by the hub.
+        """
+        item = await asyncio.wait_for(self.queue.get(), timeout)
+        if isinstance(item, Exception):
+            self.closed = True
+            raise item
+        return item
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        return await self.get()
+
+
+class PubSubHub:
+    """
+    Multiplexes any number of pubsub listeners (see PubSubListener) onto a single redis pubsub connection that is read
+    by a single daemon thread. Redis is only subscribed to the union of the listeners' channels, so the number of redis
+    connections stays constant however many agent threads or browser tabs are listening.
+
+    Should the connection fail, the error is passed to every listener (raised from their get()) and the hub resets so
+    that the next subscription starts afresh.
+    """
+    def __init__(self, redis, maxsize=1000):
+        self.redis = redis
+        self.maxsize = maxsize
+        self._ps = None
+        self._thread = None
+        self._lock = threading.RLock()
+        self._listeners = set()
+        self._channels = {}  # channel: set of listeners
+        self._patterns = {}  # pattern: set of listeners
+
+    def listener(self, channels: (list, tuple, str) = tuple(), maxsize=None, cls=PubSubListener):
+        """ Create and return a new PubSubListener (or cls, e.g. AsyncPubSubListener), subscribed to channels """
+        listener = cls(self, maxsize=maxsize or self.maxsize)
+        with self._lock:
+            self._listeners.add(listener)
+        if channels:
+            listener.subscribe(channels)
+        return listener
+
+    @property
+    def n_listeners(self):
+        return len(self._listeners)
+
+    def _subscribe(self, listener, channels, pattern=False):
+        if isinstance(channels, str):
+            channels = [channels]
+        subscriptions = self._patterns if pattern else self._channels
+        with self._lock:
+            if self._ps is None:
+                self._ps = self.redis.pubsub(ignore_subscribe_messages=True)
+            new = [c for c in channels if c not in subscriptions]
+            for c in channels:
+                subscriptions.setdefault(c, set()).add(listener)
+                (listener.patterns if pattern else listener.channels).add(c)
+            if new:
+                logging.getLogger(__name__).info(f"Subscribing redis to {'patterns ' if pattern else ''}{new}")
+                try:
+                    if pattern:
+                        self._ps.psubscribe(*new)
+                    else:
+                        self._ps.subscribe(*new)
+                except RedisError as e:
+                    logging.getLogger(__name__).warning(f"Cannot subscribe to redis pubsub. Check to make sure redis "
+                                                        f"is running! {e}")
+                    self._reset(e)
+                    raise e
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='PubSub Hub Thread', daemon=True)
+                self._thread.start()
+
+    def _unsubscribe(self, listener, channels, pattern=False):
+        if isinstance(channels, str):
+            channels = [channels]
+        subscriptions = self._patterns if pattern else self._channels
+        with self._lock:
+            gone = []
+            for c in channels:
+                (listener.patterns if pattern else listener.channels).discard(c)
+                listeners = subscriptions.get(c)
+                if listeners is None:
+                    continue
+                listeners.discard(listener)
+                if not listeners:
+                    del subscriptions[c]
+                    gone.append(c)
+            if gone and self._ps is not None:
+                logging.getLogger(__name__).info(f"Unsubscribing redis from {'patterns ' if pattern else ''}{gone}")
+                try:
+                    if pattern:
+                        self._ps.punsubscribe(*gone)
+                    else:
+                        self._ps.unsubscribe(*gone)
+                except RedisError as e:
+                    self._reset(e)
+
+    def _remove(self, listener):
+        with self._lock:
+            self._unsubscribe(listener, list(listener.channels))
+            self._unsubscribe(listener, list(listener.patterns), pattern=True)
+            self._listeners.discard(listener)
+
+    def _reset(self, error):
+        """ Pass error to all listeners and drop the pubsub connection """
+        with self._lock:
+            for listener in self._listeners:
+                listener._put(error)
+                listener.channels.clear()
+                listener.patterns.clear()
+            self._listeners.clear()
+            self._channels.clear()
+            self._patterns.clear()
+            try:
+                self._ps.close()
+            except Exception:
+                pass
+            self._ps = None
+
+    def _run(self):
+        log = logging.getLogger(__name__)
+        while True:
+            with self._lock:
+                ps = self._ps
+                if ps is None or not (self._channels or self._patterns):
+                    self._thread = None
+                    return
+            try:
+                msg = ps.get_message(timeout=1.0)
+            except RedisError as e:
+                log.warning(f"Redis error in pubsub hub, notifying {len(self._listeners)} listeners: {e}")
+                self._reset(e)
+                return
+            except Exception as e:
+                with self._lock:
+                    if self._ps is not ps:  # The pubsub object was closed out from under us by a reset
+                        continue
+                log.warning(f"Error reading redis pubsub, retrying in {PUBSUB_ERROR_BACKOFF} s: {e}")
+                time.sleep(PUBSUB_ERROR_BACKOFF)
+                continue
+            if msg is None or msg['type'] not in ('message', 'pmessage'):
+                continue
+            log.debug(f"Pubsub received {msg}")
+            try:
+                key = msg['channel'].decode()
+                value = msg['data'].decode()
+                pattern = msg['pattern'].decode() if msg['type'] == 'pmessage' else None
+            except (UnicodeDecodeError, AttributeError) as e:
+                log.warning(f"Dropping undecodable pubsub message {msg}: {e}")
+                continue
+            with self._lock:
+                if pattern is not None:
+                    listeners = tuple(self._patterns.get(pattern, ()))
+                else:
+                    listeners = tuple(self._channels.get(key, ()))
+            for listener in listeners:
+                listener._put((key, value))
+
+
+def _enable_keyspace_notifications(redis, flags='Kg$x', purpose='cached keys will only expire by TTL'):
+    """
+    Make sure redis publishes keyspace notifications for string commands, generic commands (DEL, RENAME, ...) and
+    expirations (or the given flags). Existing notification flags are preserved. Returns False, warning that purpose,
+    if the server configuration could not be changed (e.g. CONFIG is disabled), in which case redis.conf must set
+    notify-keyspace-events.
+    """
+    try:
+        current = redis.config_get('notify-keyspace-events').get('notify-keyspace-events', '')
+        if not set(flags) - set(current):
+            return True
+        redis.config_set('notify-keyspace-events', ''.join(sorted(set(current + flags))))
+        return True
+    except RedisError as e:
+        logging.getLogger(__name__).warning(f"Unable to enable keyspace notifications, {purpose}: {e}")
+        return False
+
+
+class KeyCache:
+    """
+    A read-through cache of normal (non-timeseries) redis keys starting with one of a set of prefixes, intended for the
+    rarely-changing device-settings: keys that control loops reread every iteration.
+
+    Entries are invalidated by redis keyspace notifications received through a PubSubHub listener, by stores made via
+    the owning MKIDRedis, and in any case expire after ttl seconds. If the notification connection is lost the whole
+    cache is cleared until it is reestablished.
+    """
+    def __init__(self, prefixes, ttl=60.0):
+        self.prefixes = tuple(prefixes)
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.generation = 0  # Incremented on every invalidation, see put()
+        self._data = {}  # key: (value, expiry time)
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def cacheable(self, key):
+        return key.startswith(self.prefixes)
+
+    def get(self, key):
+        """ Return the cached value of key or None if it is not cached (or has expired) """
+        with self._lock:
+            try:
+                value, expiry = self._data[key]
+            except KeyError:
+                self.misses += 1
+                return None
+            if time.monotonic() > expiry:
+                del self._data[key]
+                self.misses += 1
+                return None
+            self.hits += 1
+            return value
+
+    def put(self, key, value, generation):
+        """
+        Cache value for key. generation must be the value of self.generation from before the value was fetched from
+        redis, if anything was invalidated since then the value may be stale and is not cached.
+        """
+        if value is None:
+            return
+        with self._lock:
+            if generation == self.generation:
+                self._data[key] = (value, time.monotonic() + self.ttl)
+
+    def invalidate(self, key=None):
+        """ Drop key (or everything if key is None) from the cache """
+        with self._lock:
+            self.generation += 1
+            self.invalidations += 1
+            if key is None:
+                self._data.clear()
+            else:
+                self._data.pop(key, None)
+
+    def stats(self):
+        n = self.hits + self.misses
+        return dict(hits=self.hits, misses=self.misses, invalidations=self.invalidations, size=len(self._data),
+                    hit_rate=self.hits / n if n else 0.0)
+
+    def watch(self, hub, db=REDIS_DB):
+        """ Start a daemon thread invalidating entries on keyspace notifications delivered by hub """
+        _enable_keyspace_notifications(hub.redis)
+        self._thread = threading.Thread(target=self._watch, args=(hub, db), name='Key Cache Thread', daemon=True)
+        self._thread.start()
+
+    def _watch(self, hub, db):
+        log = logging.getLogger(__name__)
+        channel_prefix = f'__keyspace@{db}__:'
+        patterns = [f'{channel_prefix}{p}*' for p in self.prefixes]
+        while True:
+            try:
+                with hub.listener() as listener:
+                    listener.psubscribe(patterns)
+                    # Anything could have changed while we weren't listening
+                    self.invalidate()
+                    for channel, event in listener:
+                        self.invalidate(channel[len(channel_prefix):])
+            except RedisError as e:
+                log.warning(f"Lost keyspace notifications, clearing key cache: {e}")
+                self.invalidate()
+                time.sleep(1)
+
+
+class StorePolicy:
+    """
+    Publishing policy for a key written with MKIDRedis.store/store_batch, used to skip writes that carry no news.
+    A new value is stored if it differs from the last value stored by this client by more than deadband (absolute) or
+    rel_deadband (relative to the last value), which for non-numeric values means if it differs at all, but no sooner
+    than min_interval seconds after the last write. A value that is suppressed by min_interval is not lost, the next
+    value written after the interval is compared against the last stored one. Regardless of change, a value is stored
+    if max_interval seconds (the heartbeat) have passed since the last write.
+    """
+    def __init__(self, deadband=0.0, rel_deadband=0.0, min_interval=0.0, max_interval=None):
+        self.deadband = deadband
+        self.rel_deadband = rel_deadband
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+
+    def __repr__(self):
+        return (f"StorePolicy(deadband={self.deadband}, rel_deadband={self.rel_deadband}, "
+                f"min_interval={self.min_interval}, max_interval={self.max_interval})")
+
+    def changed(self, last, value):
+        try:
+            last, value = float(last), float(value)
+        except (TypeError, ValueError):
+            return last != value
+        delta = abs(value - last)
+        return delta > self.deadband and delta > self.rel_deadband * abs(last)
+
+    def should_store(self, last, last_time, value, now):
+        """ Whether to store value at time now (s) given the last value stored and when """
+        elapsed = now - last_time
+        if self.max_interval is not None and elapsed >= self.max_interval:
+            return True
+        return elapsed >= self.min_interval and self.changed(last, value)
+
+
+class Command:
+    """
+    A command received by an agent from MKIDRedis.listen_commands, unpacks as (key, value).
+    Commands sent with send_command carry an id and are acknowledged by calling complete() (optionally with a result)
+    or fail() once handled, which posts the completion record the sender is waiting on. Commands that arrived over
+    plain pubsub have no id and completing them does nothing.
+    """
+    def __init__(self, key, value, id=None, agent=None, mkidredis=None):
+        self.key = key
+        self.value = value
+        self.id = id
+        self.agent = agent
+        self.completed = False
+        self._mkidredis = mkidredis
+
+    def __iter__(self):
+        return iter((self.key, self.value))
+
+    def __repr__(self):
+        return f"Command({self.key!r}, {self.value!r}, id={self.id!r})"
+
+    def complete(self, result=None):
+        self._finish(True, result=result)
+
+    def fail(self, error):
+        self._finish(False, error=str(error))
+
+    def _finish(self, ok, result=None, error=None):
+        if self.completed:
+            return
+        self.completed = True
+        if self.id is not None:
+            self._mkidredis._post_command_result(self, ok, result, error)
+
+
+class PendingCommand:
+    """ A command sent with MKIDRedis.send_command, wait() for the agent to complete it """
+    def __init__(self, mkidredis, agent, id, key, value):
+        self.agent = agent
+        self.id = id
+        self.key = key
+        self.value = value
+        self.record = None
+        self._mkidredis = mkidredis
+
+    def __repr__(self):
+        return f"PendingCommand({self.agent!r}, {self.key!r}, {self.value!r}, id={self.id!r})"
+
+    def wait(self, timeout=None):
+        """
+        Block until the agent completes the command and return its completion record, a dict with the id, key, value,
+        ok (bool), result and error. Returns None if the command is not completed within timeout seconds (None waits
+        forever, 0 only checks for a record already posted).
+        """
+        return self._mkidredis.wait_commands((self,), timeout=timeout)[0]
 
 
 class MKIDRedis:
@@ -28,29 +513,122 @@ class MKIDRedis:
     with a module to allow easy time series data storage, instead of creating homemade ways to do that same thing.
     Redistimeseries keys should be created with the MKIDRedis object. Unlike normal redis keys, they must be created
     explicitly and should be done at each program's start for clarity and ease.
+
+    backend may be 'redis' (the default) or 'memory' to use the in-process stand-in for redis in
+    mkidcontrol/memredis.py instead of a redis-server, e.g. for benchmarks. If None it is taken from the
+    MKIDCONTROL_REDIS_BACKEND environment variable.
     """
-    def __init__(self, host='localhost', port=6379, db=REDIS_DB, ts_keys=tuple()):
-        self.redis = _Redis(host, port, db, socket_keepalive=True)
+    def __init__(self, host='localhost', port=6379, db=REDIS_DB, ts_keys=tuple(), cache_prefixes=tuple(),
+                 cache_ttl=60.0, ts_compactions=None, archive_dir=None, store_policies=None, backend=None):
+        self.backend = backend or os.environ.get(BACKEND_ENV, 'redis')
+        if self.backend == 'memory':
+            self.redis = _Redis(connection_pool=memory_connection_pool(host, port, db, socket_keepalive=True))
+        elif self.backend == 'redis':
+            self.redis = _Redis(host, port, db, socket_keepalive=True)
+        else:
+            raise ValueError(f"Unknown redis backend '{self.backend}', must be 'redis' or 'memory'")
         self.redis_ts = None
         self._connect_ts()
 
         self.ts_keys = ts_keys
-        self.create_ts_keys(ts_keys)
+        self._ts_rules = {}  # key: compaction rules, see compaction_rules()
+        self.create_ts_keys(ts_keys, compactions=ts_compactions)
 
         self.ps = None  # Redis pubsub object. None until initialized, used for inter-program communication
+        self._pubsub_hub = None
+
+        self.cache = None  # KeyCache of slowly changing keys, see enable_cache
+        if cache_prefixes:
+            self.enable_cache(cache_prefixes, ttl=cache_ttl)
+
+        self._archive = TSArchive(archive_dir) if archive_dir else None
+
+        self.store_policies = {}  # key: StorePolicy, see set_store_policies
+        self.store_stats = {'stored': 0, 'suppressed': 0}
+        self._last_stored = {}  # key: (value, time.monotonic()) of the last write of keys with a store policy
+        self._store_lock = threading.Lock()
+        if store_policies:
+            self.set_store_policies(store_policies)
+
+    @property
+    def pubsub_hub(self):
+        """ The process-wide PubSubHub shared by all listen() calls on this client """
+        if self._pubsub_hub is None:
+            self._pubsub_hub = PubSubHub(self.redis)
+        return self._pubsub_hub
+
+    @property
+    def archive(self):
+        """
+        The TSArchive of timeseries samples that have aged out of redis (see tsarchiverAgent). Unless given to the
+        constructor its location is read from TS_ARCHIVE_DIR_KEY, None if that is not set.
+        """
+        if self._archive is None:
+            path = self.read(TS_ARCHIVE_DIR_KEY, error_missing=False)
+            if path:
+                self._archive = TSArchive(path)
+        return self._archive
+
+    def enable_cache(self, prefixes, ttl=60.0):
+        """
+        Serve reads of normal keys starting with any of prefixes (e.g. 'device-settings:') from a local KeyCache that
+        is kept up to date by keyspace notifications, falling back to expiring entries after ttl seconds.
+        Hit/miss counts are available from self.cache.stats()
+        """
+        self.cache = KeyCache(prefixes, ttl=ttl)
+        self.cache.watch(self.pubsub_hub, db=self.redis.connection_pool.connection_kwargs['db'])
+
+    def set_store_policies(self, policies):
+        """
+        Set the StorePolicy for keys. policies is a dict of key: StorePolicy or key: dict of StorePolicy arguments
+        (e.g. REDIS_SCHEMA['store_policies']). Policies only track the writes made by this client, so they only make
+        sense for keys that are written by a single program.
+        """
+        with self._store_lock:
+            for k, p in policies.items():
+                self.store_policies[k] = p if isinstance(p, StorePolicy) else StorePolicy(**p)
+                self._last_stored.pop(k, None)
+
+    def _apply_store_policies(self, items):
+        """ Return the (key, value) items that should be written under the store policies, see StorePolicy """
+        if not self.store_policies:
+            return items
+        now = time.monotonic()
+        keep = []
+        with self._store_lock:
+            for k, v in items:
+                policy = self.store_policies.get(k)
+                if policy is not None:
+                    try:
+                        last, last_time = self._last_stored[k]
+                    except KeyError:
+                        pass
+                    else:
+                        if not policy.should_store(last, last_time, v, now):
+                            self.store_stats['suppressed'] += 1
+                            continue
+                    self._last_stored[k] = (v, now)
+                self.store_stats['stored'] += 1
+                keep.append((k, v))
+        return keep
 
     def _connect_ts(self, force=False):
         """ Establish a redis time series client using the same connection info as for redis """
         if self.redis_ts is not None and not force:
             return
+        if self.backend == 'memory':
+            self.redis_ts = _RTSClient(connection_pool=self.redis.connection_pool)
+            return
         args = self.redis.connection_pool.connection_kwargs
         self.redis_ts = _RTSClient(args['host'], args['port'], args['db'],  socket_keepalive=args['socket_keepalive'])
 
-    def create_ts_keys(self, keys):
+    def create_ts_keys(self, keys, compactions=None):
         """
         Given a list of keys, create them in the redis database.
         :param keys: list of strings to create as redis timeseries keys. If the keys have been created it will be
         logged but no other action will be taken.
+        :param compactions: Optional dict of key:((bucket_ms, aggregation, retention_ms), ...) compaction rules to
+        create for the keys (see create_compaction_rules)
 
         keys may a single string for a single key or a dictionary of key:retention_time_ms pairs
         """
@@ -60,11 +638,56 @@ class MKIDRedis:
 
         for k in keys:
             try:
-                self.redis_ts.create(k)
+                self.redis_ts.create(k, labels=ts_labels(k))
             except ResponseError:
                 logging.getLogger(__name__).debug(f"Redistimeseries key '{k}' already exists.")
+                try:
+                    self.redis_ts.alter(k, labels=ts_labels(k))
+                except ResponseError:
+                    logging.getLogger(__name__).warning(f"Unable to label redistimeseries key '{k}'")
+
+        for k, rules in (compactions or {}).items():
+            self.create_compaction_rules(k, rules)
 
-    def store(self, data, timeseries=False, encode_json=False):
+    def create_compaction_rules(self, key, rules):
+        """
+        Create downsampled copies of the timeseries key which redis keeps up to date as samples are added.
+        :param key: The (existing) source timeseries key
+        :param rules: iterable of (bucket_ms, aggregation, retention_ms) tuples, e.g. (60000, 'avg', 7*86400000). Each
+        rule is stored in '<key>:<aggregation>-<bucket_ms>ms'. Rules which already exist are left alone.
+        """
+        if self.redis_ts is None:
+            self._connect_ts()
+        for bucket_ms, aggregation, retention_ms in rules:
+            dest = compaction_key(key, aggregation, bucket_ms)
+            labels = ts_labels(key, series=f"{aggregation.lower()}-{int(bucket_ms)}ms")
+            try:
+                self.redis_ts.create(dest, retention_msecs=retention_ms, labels=labels)
+            except ResponseError:
+                logging.getLogger(__name__).debug(f"Redistimeseries key '{dest}' already exists.")
+            try:
+                self.redis_ts.createrule(key, dest, aggregation, bucket_ms)
+            except ResponseError:
+                logging.getLogger(__name__).debug(f"Compaction rule '{key}' -> '{dest}' already exists.")
+        self._ts_rules.pop(key, None)
+
+    def compaction_rules(self, key):
+        """
+        Return a list of (dest_key, bucket_ms, aggregation) for the compaction rules of a timeseries key, as reported
+        by TS.INFO. Results are cached, the rules rarely change.
+        """
+        try:
+            return self._ts_rules[key]
+        except KeyError:
+            pass
+        if self.redis_ts is None:
+            self._connect_ts()
+        rules = [(d.decode() if isinstance(d, bytes) else d, int(b),
+                  (a.decode() if isinstance(a, bytes) else a).lower()) for d, b, a in self.redis_ts.info(key).rules]
+        self._ts_rules[key] = rules
+        return rules
+
+    def store(self, data, timeseries=False, encode_json=False, batch=False, force=False):
         """
         Function for storing data in redis. This is a wrapper that allows us to store either type of redis key:value
         pairs (timeseries or 'normal'). Any TS keys must have been previously created.
@@ -73,9 +696,24 @@ class MKIDRedis:
         :param timeseries: Bool
         If True: uses redis_ts.add() and uses the automatic UNIX timestamp generation keyword (timestamp='*')
         If False: uses redis.set() and stores the keys normally
+        :param batch: Bool
+        If True: all of the keys are written in a single round trip, see store_batch()
+        If False: each key is written (and published) with its own command
+        :param force: Bool
+        If True: write every key, ignoring any StorePolicy set for it (see set_store_policies)
+        If False: values that carry no news under the key's StorePolicy are skipped
         :return: None
         """
+        if batch:
+            if timeseries:
+                self.store_batch(ts_data=data, encode_json=encode_json, force=force)
+            else:
+                self.store_batch(data=data, encode_json=encode_json, force=force)
+            return
+
         generator = data.items() if isinstance(data, dict) else iter(data)
+        if not force:
+            generator = self._apply_store_policies(generator)
         if timeseries:
             if self.redis_ts is None:
                 self._connect_ts()
@@ -91,6 +729,59 @@ class MKIDRedis:
                     v = json.dumps(v)
                 self.redis.set(k, v)
                 self.publish(k, v, store=False, encode_json=False)
+                self._invalidate_cached(k)
+
+    def store_batch(self, data=None, ts_data=None, encode_json=False, timestamp=None, force=False):
+        """
+        Store normal and timeseries keys together in a single MULTI/EXEC transaction (one round trip to redis).
+        Timeseries values are written with one TS.MADD sharing a single timestamp, normal keys are SET and PUBLISHed
+        to the channel with the name of the key, exactly as store() would do one key at a time.
+        :param data: Dict or iterable of key value pairs to store as normal keys
+        :param ts_data: Dict or iterable of key value pairs to add to (previously created) timeseries keys
+        :param timestamp: UNIX timestamp in ms shared by all the timeseries samples. Defaults to the current time.
+        :param force: If True ignore the keys' StorePolicy, see store()
+        :return: None. Raises a RedisError if the transaction or any of the timeseries adds failed.
+        """
+        data = list(data.items() if isinstance(data, dict) else data or ())
+        ts_data = list(ts_data.items() if isinstance(ts_data, dict) else ts_data or ())
+        if not force:
+            data = self._apply_store_policies(data)
+            ts_data = self._apply_store_policies(ts_data)
+        if not data and not ts_data:
+            return
+
+        if self.redis_ts is None:
+            self._connect_ts()
+        if timestamp is None:
+            timestamp = int(time.time() * 1000)
+
+        pipe = self.redis_ts.pipeline(transaction=True)
+        if ts_data:
+            ktv = []
+            for k, v in ts_data:
+                logging.getLogger(__name__).info(f"Setting ts {k} to {v}")
+                if encode_json:
+                    v = json.dumps(v)
+                ktv.append((k, timestamp, v))
+            pipe.madd(ktv)
+        for k, v in data:
+            logging.getLogger(__name__).info(f"Setting {k} to {v}")
+            if encode_json:
+                v = json.dumps(v)
+            pipe.set(k, v)
+            pipe.publish(k, v)
+        results = pipe.execute()
+        for k, _ in data:
+            self._invalidate_cached(k)
+
+        if ts_data:
+            failed = [(k, r) for (k, _), r in zip(ts_data, results[0]) if isinstance(r, Exception)]
+            if failed:
+                raise ResponseError(f"TS.MADD failed for {failed}")
+
+    def _invalidate_cached(self, key):
+        if self.cache is not None and self.cache.cacheable(key):
+            self.cache.invalidate(key)
 
     def publish(self, channel, message, store=True, encode_json=False):
         """
@@ -125,21 +816,7 @@ class MKIDRedis:
                 pass
 
         if len(keys) > 1:
-            vals = []
-
-            for k in keys:
-                if k in self.ts_keys:
-                    try:
-                        ts, v = self.redis_ts.get(k)
-                        v = v if ts_value_only else (ts, v, datetime.fromtimestamp(ts / 1000).strftime("%H:%M:%S"))
-                        vals.append(v)
-                    except (ResponseError, TypeError):
-                        vals.append(None)
-                else:
-                    try:
-                        vals.append(self.redis.get(k).decode('utf-8'))
-                    except AttributeError:
-                        vals.append(None)
+            vals = self._read_many(keys, ts_value_only=ts_value_only)
 
             missing = [k for k, v in zip(keys, vals) if v is None]
 
@@ -166,13 +843,9 @@ class MKIDRedis:
                     else:
                         val = None
             else:
-                try:
-                    val = self.redis.get(keys[0]).decode('utf-8')
-                except AttributeError:
-                    if error_missing:
-                        raise KeyError(f"Key not in redis: {keys[0]}")
-                    else:
-                        val = None
+                val = self._get_plain(keys)[0]
+                if val is None and error_missing:
+                    raise KeyError(f"Key not in redis: {keys[0]}")
             if decode_json:
                 try:
                     val = json.loads(val)
@@ -180,6 +853,82 @@ class MKIDRedis:
                     pass
             return val
 
+    def _get_plain(self, keys):
+        """
+        Return the decoded values of the normal keys (None where missing), serving what it can from the key cache and
+        fetching the rest with a single GET/MGET
+        """
+        vals, fetch, generation = self._from_cache(keys)
+        if not fetch:
+            return vals
+
+        if len(fetch) == 1:
+            fetched = [self.redis.get(keys[fetch[0]])]
+        else:
+            fetched = self.redis.mget([keys[i] for i in fetch])
+        self._fill_fetched(keys, vals, fetch, fetched, generation)
+        return vals
+
+    def _from_cache(self, keys):
+        """ The cached values of the normal keys (None elsewhere), the indices of the rest and the cache generation """
+        vals = [None] * len(keys)
+        if self.cache is None:
+            return vals, list(range(len(keys))), None
+        generation = self.cache.generation
+        fetch = []
+        for i, k in enumerate(keys):
+            vals[i] = self.cache.get(k) if self.cache.cacheable(k) else None
+            if vals[i] is None:
+                fetch.append(i)
+        return vals, fetch, generation
+
+    def _fill_fetched(self, keys, vals, fetch, fetched, generation):
+        for i, v in zip(fetch, fetched):
+            vals[i] = None if v is None else v.decode('utf-8')
+            if self.cache is not None and self.cache.cacheable(keys[i]):
+                self.cache.put(keys[i], vals[i], generation)
+
+    def _read_many(self, keys, ts_value_only=False):
+        """
+        Read a list of keys in one round trip regardless of its length: a single pipeline holding an MGET of the normal
+        keys not served from the key cache and a TS.GET for each of the timeseries keys. Values are returned in the
+        order of keys, with None in place of any key that is missing (or a timeseries key with no samples).
+        """
+        ts_key_set = set(self.ts_keys)
+        ts_keys = [k for k in keys if k in ts_key_set]
+        plain_keys = [k for k in keys if k not in ts_key_set]
+        found = {}
+
+        if not ts_keys:
+            found.update(zip(plain_keys, self._get_plain(plain_keys)))
+            return [found[k] for k in keys]
+
+        vals, fetch, generation = self._from_cache(plain_keys)
+        if self.redis_ts is None:
+            self._connect_ts()
+        pipe = self.redis_ts.pipeline(transaction=False)
+        if fetch:
+            pipe.mget([plain_keys[i] for i in fetch])
+        for k in ts_keys:
+            # Not pipe.get(), the pipeline resolves that to the plain GET
+            pipe.execute_command('TS.GET', k)
+        results = pipe.execute(raise_on_error=False)
+        if fetch:
+            fetched = results.pop(0)
+            if isinstance(fetched, Exception):
+                raise fetched
+            self._fill_fetched(plain_keys, vals, fetch, fetched, generation)
+        found.update(zip(plain_keys, vals))
+
+        for k, r in zip(ts_keys, results):
+            try:
+                ts, v = r
+                found[k] = v if ts_value_only else (ts, v, datetime.fromtimestamp(ts / 1000).strftime("%H:%M:%S"))
+            except (ResponseError, TypeError, ValueError):
+                found[k] = None
+
+        return [found[k] for k in keys]
+
     def _ps_subscribe(self, channels: list, ignore_sub_msg=False):
         """
         Function which will create a redis pubsub object (in self.ps) and subscribe to the keys given. It will also
@@ -205,40 +954,139 @@ class MKIDRedis:
     def listen(self, channels:(list, tuple, str), value_only=False, decode=None, timeout=None):
         """
         Sets up a subscription for the iterable keys, yielding decoded messages as (k,v) strings.
+        Subscriptions are multiplexed onto the client's shared PubSubHub and are released when the generator is closed
+        (e.g. when an SSE client disconnects). If timeout is given the generator returns after timeout seconds pass
+        without a message.
         Passes up any redis errors that are raised
         """
         log = logging.getLogger(__name__)
-        if isinstance(channels, str):
-            channels = [channels]
         try:
-            ps = self.redis.pubsub()
-            ps.subscribe(channels)
+            listener = self.pubsub_hub.listener(channels)
         except RedisError as e:
             log.debug(f"Redis error while subscribing to redis pubsub!! {e}")
             raise e
 
-        def listen_with_timeout(ps, timeout):
-            kw = dict(block=True) if timeout else dict(timeout=timeout)
-            while ps.subscribed:
-                response = ps.handle_message(ps.parse_response(**kw))
-                if response is not None:
-                    yield response
+        with listener:
+            while True:
+                try:
+                    key, value = listener.get(timeout=timeout)
+                except queue.Empty:
+                    return
+                yield _listen_item(key, value, value_only, decode)
 
-        for msg in listen_with_timeout(ps, timeout):
-            log.debug(f"Pubsub received {msg}")
-            if msg['type'] == 'subscribe':
+    def watch_keys(self, keys: (list, tuple, str)):
+        """
+        Return a PubSubListener receiving a ('__keyspace@<db>__:<key>', event) message, e.g. event 'set' or 'ts.add',
+        whenever one of keys is written. Unlike listen() this sees timeseries samples too, which are not published.
+        Keyspace notifications are enabled as needed. Close the listener (or use it in a with block) when done.
+        Passes up any redis errors that are raised
+        """
+        if isinstance(keys, str):
+            keys = [keys]
+        _enable_keyspace_notifications(self.redis, flags='Kg$', purpose=f'writes to {keys} may go unnoticed')
+        db = self.redis.connection_pool.connection_kwargs['db']
+        return self.pubsub_hub.listener([f'__keyspace@{db}__:{k}' for k in keys])
+
+    def send_command(self, agent, key, value):
+        """
+        Send the command key=value (e.g. 'command:device-settings:ls372:...', 10) to agent on its command stream.
+        Unlike a publish the command is kept until the agent reads it, so it is not lost if the agent is restarting.
+        Returns a PendingCommand, whose wait(timeout) returns the agent's completion record.
+        """
+        id = self.redis.xadd(COMMAND_STREAM_KEY.format(agent), {'key': key, 'value': value},
+                             maxlen=COMMAND_STREAM_MAXLEN, approximate=True).decode()
+        logging.getLogger(__name__).debug(f"Sent {key} -> {value} to {agent} as command {id}")
+        return PendingCommand(self, agent, id, key, value)
+
+    def wait_commands(self, pending, timeout=None):
+        """
+        Wait for the agents to complete the PendingCommands pending, all at once for up to timeout seconds in total
+        (None waits forever, 0 only checks for records already posted; redis blocks for whole seconds, so a wait may run
+        up to a second over), and return their completion records in order, None for any not completed in time.
+        """
+        deadline = None if timeout is None else time.time() + timeout
+        waiting = {COMMAND_RESULT_KEY.format(c.agent, c.id): c for c in pending if c.record is None}
+        while waiting:
+            remaining = None if deadline is None else deadline - time.time()
+            if remaining is not None and remaining <= 0:
+                for key, c in waiting.items():
+                    r = self.redis.lpop(key)
+                    if r is not None:
+                        c.record = json.loads(r)
+                break
+            r = self.redis.blpop(list(waiting), 0 if remaining is None else max(1, int(np.ceil(remaining))))
+            if r is not None:
+                waiting.pop(r[0].decode()).record = json.loads(r[1])
+        return [c.record for c in pending]
+
+    def listen_commands(self, agent, channels: (list, tuple, str) = tuple()):
+        """
+        Yield the Commands sent to agent with send_command, as well as any published to the pubsub channels (e.g. by
+        agents still using publish). Each yielded command should be completed with its complete() or fail() methods,
+        any not completed by the time the next command is requested are completed successfully.
+
+        Commands are read from the agent's stream in a consumer group (named for the agent) so that commands sent
+        while the agent is down are delivered when it starts, as are any it read but never acknowledged.
+        Passes up any redis errors that are raised
+        """
+        stream = COMMAND_STREAM_KEY.format(agent)
+        try:
+            self.redis.xgroup_create(stream, agent, id='0', mkstream=True)
+        except ResponseError as e:
+            if 'BUSYGROUP' not in str(e):
+                raise e
+        listener = self.pubsub_hub.listener(channels)
+        thread = threading.Thread(target=self._read_commands, args=(agent, listener), name=f'{agent} Command Thread',
+                                  daemon=True)
+        with listener:
+            thread.start()
+            for item in listener:
+                cmd = item if isinstance(item, Command) else Command(*item)
+                yield cmd
+                cmd.complete()
+
+    def _read_commands(self, agent, listener):
+        """ Read commands from agent's stream onto listener until it is closed, see listen_commands """
+        log = logging.getLogger(__name__)
+        stream = COMMAND_STREAM_KEY.format(agent)
+        last = '0'  # Start with the commands previously read but never acknowledged, then move on to new ones
+        while not listener.closed:
+            try:
+                resp = self.redis.xreadgroup(agent, agent, {stream: last}, count=100, block=1000)
+                entries = resp[0][1] if resp else []
+                if last != '>' and entries:
+                    deliveries = {p['message_id'].decode(): p['times_delivered'] for p in
+                                  self.redis.xpending_range(stream, agent, entries[0][0], entries[-1][0],
+                                                            len(entries), agent)}
+            except RedisError as e:
+                log.warning(f"Redis error reading commands for {agent}: {e}")
+                listener._put(e)
+                return
+            if last != '>' and not entries:
+                last = '>'
                 continue
-            key = msg['channel'].decode()
-            value = msg['data'].decode()
-            if decode == 'json':
-                try:
-                    value = json.loads(value)
-                except Exception:
-                    pass
-            if value_only:
-                yield value
-            else:
-                yield key, value
+            for id, fields in entries:
+                id = id.decode()
+                cmd = Command(fields[b'key'].decode(), fields[b'value'].decode(), id=id, agent=agent, mkidredis=self)
+                if last != '>':
+                    last = id
+                    if deliveries.get(id, 0) > COMMAND_MAX_DELIVERIES:
+                        log.error(f"Abandoning {cmd}, it has been delivered {deliveries[id]} times")
+                        cmd.fail('Abandoned after repeated delivery')
+                        continue
+                    log.info(f"Redelivering unacknowledged {cmd}")
+                listener._put(cmd)
+
+    def _post_command_result(self, cmd, ok, result=None, error=None):
+        """ Acknowledge cmd on its stream and post its completion record for PendingCommand.wait """
+        record = json.dumps(dict(id=cmd.id, key=cmd.key, value=cmd.value, ok=ok, result=result, error=error),
+                            default=str)
+        result_key = COMMAND_RESULT_KEY.format(cmd.agent, cmd.id)
+        pipe = self.redis.pipeline()
+        pipe.xack(COMMAND_STREAM_KEY.format(cmd.agent), cmd.agent, cmd.id)
+        pipe.rpush(result_key, record)
+        pipe.expire(result_key, COMMAND_RESULT_TTL)
+        pipe.execute()
 
     def handler(self, message):
         """
@@ -249,54 +1097,323 @@ class MKIDRedis:
         """
         print(f"Default message handler: {message}")
 
-    def range(self, key: str, start=None, end=None):
-        if isinstance(start, (int, float)):
-            start = int(start)
-        elif isinstance(start, str):
-            if start == "-":
-                pass
-            else:
-                int(start)
-        elif start is None:
-            start = "-"
-        else:
-            start = int(start.timestamp() * 1000)
-        if isinstance(end, (int, float)):
-            end = int(end)
-        elif isinstance(end, str):
-            if end == "+":
-                pass
+    def range(self, key: str, start=None, end=None, bucket_ms=None, aggregation=None, max_points=None):
+        """
+        Return the samples of a timeseries key between start and end as a list of (timestamp ms, value) tuples, or
+        [(None, None)] if there are none.
+        :param bucket_ms: If given, aggregate the samples server side into buckets of this many ms
+        :param aggregation: The aggregation to use for buckets/compactions, e.g. 'avg' (default), 'min', 'max'
+        :param max_points: If given (and bucket_ms is not), return at most ~max_points samples. The raw series is used
+        if it fits and still holds the start of the window, otherwise the finest compaction rule (see
+        create_compaction_rules) that fits and holds it, further aggregated server side if even the coarsest compaction
+        has too many samples.
+        """
+        start, end = _range_bounds(start, end)
+        if bucket_ms is not None:
+            rang = self.redis_ts.range(key, start, end, aggregation_type=aggregation or 'avg',
+                                       bucket_size_msec=int(bucket_ms))
+        elif max_points is not None:
+            key, bucket_ms = self._pick_series(key, start, end, max_points, aggregation or 'avg')
+            if bucket_ms:
+                rang = self.redis_ts.range(key, start, end, aggregation_type=aggregation or 'avg',
+                                           bucket_size_msec=bucket_ms)
             else:
-                int(end)
-        elif end is None:
-            end = "+"
+                rang = self.redis_ts.range(key, start, end)
         else:
-            end = int(end.timestamp() * 1000)
-
-        rang = self.redis_ts.range(key, start, end)
+            rang = self.redis_ts.range(key, start, end)
         if len(rang):
             return rang
         else:
             return [(None, None)]
 
+    def range_many(self, keys=None, start=None, end=None, filters=None, bucket_ms=None, aggregation=None,
+                   grid_ms=None):
+        """
+        Fetch several timeseries at once as NumPy arrays, in a single round trip.
+        :param keys: The timeseries keys to fetch, fetched with one pipeline of TS.RANGEs
+        :param filters: Alternatively, a list of TS.MRANGE label filters (e.g. ['stage=device-stage']) selecting the
+        keys (see ts_labels). Only raw series are matched unless a 'series=' filter is given.
+        :param bucket_ms: If given, aggregate the samples server side into buckets of this many ms
+        :param aggregation: The aggregation to use for buckets, e.g. 'avg' (default), 'min', 'max'
+        :param grid_ms: If given, place all of the series on a common time grid of this spacing (samples are aggregated
+        into grid_ms buckets server side)
+        :return: Without grid_ms a dict of key: (t, v) where t are the timestamps in ms and v the values, both float64
+        arrays. With grid_ms a tuple (keys, t, v) where t is the common grid in ms and v a 2-D float64 array of shape
+        (len(keys), len(t)) with NaN where a series has no sample.
+        """
+        if (keys is None) == (filters is None):
+            raise ValueError('Exactly one of keys or filters must be given')
+        start, end = _range_bounds(start, end)
+        if self.redis_ts is None:
+            self._connect_ts()
+        if grid_ms is not None:
+            bucket_ms = grid_ms
+        agg = dict(aggregation_type=aggregation or 'avg', bucket_size_msec=int(bucket_ms)) if bucket_ms else {}
+
+        if keys is not None:
+            pipe = self.redis_ts.pipeline(transaction=False)
+            for k in keys:
+                pipe.range(k, start, end, **agg)
+            results = zip(keys, pipe.execute())
+        else:
+            filters = list(filters)
+            if not any(f.startswith('series=') for f in filters):
+                filters.append('series=raw')
+            results = [next(iter(r.items())) for r in self.redis_ts.mrange(start, end, filters, **agg)]
+            results = [(k, samples) for k, (_, samples) in results]
+
+        data = {}
+        for k, samples in results:
+            a = np.array(samples, dtype=np.float64).reshape(-1, 2)
+            data[k] = (a[:, 0], a[:, 1])
+
+        if grid_ms is None:
+            return data
+
+        keys = list(data.keys())
+        nonempty = [t for t, _ in data.values() if t.size]
+        if not nonempty:
+            return keys, np.zeros(0), np.zeros((len(keys), 0))
+        t0 = min(t[0] for t in nonempty)
+        t1 = max(t[-1] for t in nonempty)
+        grid = np.arange(t0, t1 + grid_ms, grid_ms, dtype=np.float64)
+        values = np.full((len(keys), grid.size), np.nan)
+        for i, k in enumerate(keys):
+            t, v = data[k]
+            values[i, ((t - t0) // grid_ms).astype(int)] = v
+        return keys, grid, values
+
+    def range_archived(self, key: str, start=None, end=None):
+        """
+        Return the samples of a timeseries key between start and end from both the long-term archive and live redis,
+        as a tuple (t, v) of float64 arrays (see range_many). Archived samples are only used for the part of the window
+        before the oldest sample still in redis, so the two never overlap. Falls back to redis alone if there is no
+        archive.
+        """
+        t, v = self.range_many([key], start, end)[key]
+        archive = self.archive
+        if archive is None:
+            return t, v
+
+        start, end = _range_bounds(start, end)
+        archive_end = None if end == '+' else int(end)
+        if t.size:
+            archive_end = t[0] - 1 if archive_end is None else min(archive_end, t[0] - 1)
+        at, av = archive.read(key, None if start == '-' else int(start), archive_end)
+        if not at.size:
+            return t, v
+        return np.concatenate((at, t)), np.concatenate((av, v))
+
+    def _pick_series(self, key, start, end, max_points, aggregation):
+        """
+        Pick the series to answer a range query on key with at most max_points samples. Returns the key to query and
+        the bucket size (ms) for additional server side aggregation, or 0 if none is needed. The raw series is kept for
+        much less time than its compactions, so a series is only used if it still holds the start of the window (or
+        its retention reaches back that far); failing that, the one with the longest retention.
+        """
+        info = self.redis_ts.info(key)
+        first = info.first_time_stamp or 0
+        last = info.lastTimeStamp or 0
+        start = first if start == '-' else int(start)
+        end = last if end == '+' else int(end)
+        span = max(end - start, 1)
+
+        def covers(info):
+            return (info.first_time_stamp or 0) <= start or not info.retention_msecs or \
+                   (info.lastTimeStamp or 0) - info.retention_msecs <= start
+
+        if info.total_samples and last > first:
+            # Estimate the raw samples in the window from the average raw sample rate
+            raw_points = info.total_samples * min(span, last - first) / (last - first)
+        else:
+            raw_points = info.total_samples or 0
+        raw_covers = covers(info)
+        if raw_covers and raw_points <= max_points:
+            return key, 0
+
+        rules = sorted((r for r in self.compaction_rules(key) if r[2] == aggregation), key=lambda r: r[1])
+        infos = {dest: self.redis_ts.info(dest) for dest, _, _ in rules}
+        covering = [r for r in rules if covers(infos[r[0]])]
+        if not covering and rules and not raw_covers:
+            covering = [max(rules, key=lambda r: infos[r[0]].retention_msecs)]
+        for dest, bucket, _ in covering:
+            if span / bucket <= max_points:
+                return dest, 0
+        bucket = int(np.ceil(span / max_points))
+        if covering:
+            return covering[-1][0], bucket
+        return key, (bucket if raw_points > max_points else 0)
+
+
+def _listen_item(key, value, value_only=False, decode=None):
+    """ A message as yielded by listen(): (key, value) or value, with value parsed as JSON if decode is 'json' """
+    if decode == 'json':
+        try:
+            value = json.loads(value)
+        except Exception:
+            pass
+    return value if value_only else (key, value)
+
+
+class AsyncMKIDRedis:
+    """
+    The asyncio counterpart of MKIDRedis: store, store_batch, read, publish, range and send_command are coroutines and
+    listen() is an async iterator. redis-py 3.5 (see control.yml) has no asyncio client, so the calls run the methods
+    of an MKIDRedis on a small thread pool, while the subscriptions of all listen() calls are multiplexed onto the
+    MKIDRedis' PubSubHub: one redis connection and reader thread however many are open on the event loop.
+    """
+    def __init__(self, mkidredis=None, max_workers=4, **kwargs):
+        """ Wraps mkidredis, or an MKIDRedis created with kwargs """
+        self.mkidredis = mkidredis if mkidredis is not None else MKIDRedis(**kwargs)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='AsyncMKIDRedis')
+
+    async def _call(self, func, *args, **kwargs):
+        return await asyncio.get_running_loop().run_in_executor(self._executor,
+                                                                functools.partial(func, *args, **kwargs))
+
+    async def store(self, data, **kwargs):
+        """ As MKIDRedis.store() """
+        return await self._call(self.mkidredis.store, data, **kwargs)
+
+    async def store_batch(self, data=None, ts_data=None, **kwargs):
+        """ As MKIDRedis.store_batch() """
+        return await self._call(self.mkidredis.store_batch, data=data, ts_data=ts_data, **kwargs)
+
+    async def read(self, keys: (list, tuple, str), **kwargs):
+        """ As MKIDRedis.read() """
+        return await self._call(self.mkidredis.read, keys, **kwargs)
+
+    async def publish(self, channel, message, **kwargs):
+        """ As MKIDRedis.publish() """
+        return await self._call(self.mkidredis.publish, channel, message, **kwargs)
+
+    async def range(self, key: str, start=None, end=None, **kwargs):
+        """ As MKIDRedis.range() """
+        return await self._call(self.mkidredis.range, key, start, end, **kwargs)
+
+    async def send_command(self, agent, key, value):
+        """ As MKIDRedis.send_command(), the PendingCommand's wait() blocks so await wait_commands() instead """
+        return await self._call(self.mkidredis.send_command, agent, key, value)
+
+    async def wait_commands(self, pending, timeout=None):
+        """ As MKIDRedis.wait_commands() """
+        return await self._call(self.mkidredis.wait_commands, pending, timeout=timeout)
+
+    async def listen(self, channels: (list, tuple, str), value_only=False, decode=None, timeout=None):
+        """
+        As MKIDRedis.listen(), an async iterator of the messages on channels. If timeout is given it stops after timeout
+        seconds pass without a message. The subscription is released when the iterator is closed.
+        Passes up any redis errors that are raised
+        """
+        listener = self.mkidredis.pubsub_hub.listener(cls=AsyncPubSubListener)
+        try:
+            await self._call(listener.subscribe, channels)
+            while True:
+                try:
+                    key, value = await listener.get(timeout=timeout)
+                except asyncio.TimeoutError:
+                    return
+                yield _listen_item(key, value, value_only, decode)
+        finally:
+            await self._call(listener.close)
+
+    def close(self):
+        """ Shut down the thread pool, calls in progress are finished """
+        self._executor.shutdown(wait=False)
+
+
+def ts_labels(key, series='raw'):
+    """
+    Labels for the timeseries key, used to select keys with TS.MRANGE filters (see MKIDRedis.range_many). Every key
+    is labeled with the key itself, its 'quantity' (e.g. temp, current) and, depending on the key, the 'stage'
+    (status:temps:<stage>:...) or the 'device' (status:device:<device>:... or status:<device>:...).
+    series is 'raw' for the key itself or '<aggregation>-<bucket>ms' for a compaction of it.
+    """
+    parts = key.split(':')
+    labels = {'key': key, 'series': series, 'quantity': parts[-1]}
+    if len(parts) > 2 and parts[1] == 'temps':
+        labels['stage'] = parts[2]
+        labels['device'] = 'thermometry'
+    elif len(parts) > 3 and parts[1] == 'device':
+        labels['device'] = parts[2]
+        labels['quantity'] = ':'.join(parts[3:])
+    elif len(parts) > 2:
+        labels['device'] = parts[1]
+        labels['quantity'] = ':'.join(parts[2:])
+    return labels
+
+
+def compaction_key(key, aggregation, bucket_ms):
+    """ Name of the timeseries key holding the aggregation compaction of key in buckets of bucket_ms """
+    return f"{key}:{aggregation.lower()}-{int(bucket_ms)}ms"
+
+
+def _range_bounds(start, end):
+    """
+    Convert the start and end of a timeseries range query to the form TS.RANGE expects. Each may be a UNIX timestamp in
+    ms, a datetime, a string, or None (for the earliest/latest sample)
+    """
+    if isinstance(start, (int, float)):
+        start = int(start)
+    elif isinstance(start, str):
+        if start == "-":
+            pass
+        else:
+            int(start)
+    elif start is None:
+        start = "-"
+    else:
+        start = int(start.timestamp() * 1000)
+    if isinstance(end, (int, float)):
+        end = int(end)
+    elif isinstance(end, str):
+        if end == "+":
+            pass
+        else:
+            int(end)
+    elif end is None:
+        end = "+"
+    else:
+        end = int(end.timestamp() * 1000)
+    return start, end
+
+
 mkidredis = None
 store = None
+store_batch = None
 read = None
+range_many = None
+range_archived = None
 listen = None
+watch_keys = None
 publish = None
+send_command = None
+wait_commands = None
+listen_commands = None
 mkr_range = None  # This breaks the naming mold since range is already a python special function
 redis_ts = None
 hgetall = None
 
 
-def setup_redis(host='localhost', port=6379, db=REDIS_DB, ts_keys=tuple()):
-    global mkidredis, store, read, listen, publish, mkr_range, redis_ts, redis_keys, hgetall
-    mkidredis = MKIDRedis(host=host, port=port, db=db, ts_keys=ts_keys)
+def setup_redis(host='localhost', port=6379, db=REDIS_DB, ts_keys=tuple(), cache_prefixes=tuple(), ts_compactions=None,
+                archive_dir=None, store_policies=None, backend=None):
+    global mkidredis, store, store_batch, read, range_many, range_archived, listen, watch_keys, publish, send_command, \
+        wait_commands, listen_commands, mkr_range, redis_ts, redis_keys, hgetall
+    mkidredis = MKIDRedis(host=host, port=port, db=db, ts_keys=ts_keys, cache_prefixes=cache_prefixes,
+                          ts_compactions=ts_compactions, archive_dir=archive_dir, store_policies=store_policies,
+                          backend=backend)
     store = mkidredis.store
+    store_batch = mkidredis.store_batch
     read = mkidredis.read
     listen = mkidredis.listen
+    watch_keys = mkidredis.watch_keys
     publish = mkidredis.publish
+    send_command = mkidredis.send_command
+    wait_commands = mkidredis.wait_commands
+    listen_commands = mkidredis.listen_commands
     mkr_range = mkidredis.range
+    range_many = mkidredis.range_many
+    range_archived = mkidredis.range_archived
     redis_ts = mkidredis.redis_ts
     redis_keys = mkidredis.redis.keys
     hgetall = mkidredis.redis.hgetall
@@ -16,6 +16,8 @@ TS_KEYS = ['status:temps:50k-stage:temp',
            'status:magnet:current',
            'status:magnet:field']
 
+MAX_POINTS = 5000
+
 
 def plot_cooldown_temperatures(start=None, end=None):
     """
@@ -35,10 +37,10 @@ def plot_cooldown_temperatures(start=None, end=None):
         start = int((time.time() - 24 * 60 * 60) * 1000)
 
     # Query each temperature stage which will be a 2 column array of form [[time1, temp1], [time2, temp2], ...]
-    f = np.array(redis.redis_ts.range('status:temps:50k-stage:temp', start, end))
-    t = np.array(redis.redis_ts.range('status:temps:3k-stage:temp', start, end))
-    o = np.array(redis.redis_ts.range('status:temps:1k-stage:temp', start, end))
-    d = np.array(redis.redis_ts.range('status:temps:device-stage:temp', start, end))
+    f = np.array(redis.mkr_range('status:temps:50k-stage:temp', start, end, max_points=MAX_POINTS))
+    t = np.array(redis.mkr_range('status:temps:3k-stage:temp', start, end, max_points=MAX_POINTS))
+    o = np.array(redis.mkr_range('status:temps:1k-stage:temp', start, end, max_points=MAX_POINTS))
+    d = np.array(redis.mkr_range('status:temps:device-stage:temp', start, end, max_points=MAX_POINTS))
 
     # Create a figure with data from each of the 4 sensors
     plt.figure()
@@ -70,8 +72,8 @@ def plot_cooldown_resistances(start=None, end=None):
         start = int((time.time() - 24 * 60 * 60) * 1000)
 
     # Query each temperature stage which will be a 2 column array of form [[time1, temp1], [time2, temp2], ...]
-    o = np.array(redis.redis_ts.range('status:temps:1k-stage:resistance', start, end))
-    d = np.array(redis.redis_ts.range('status:temps:device-stage:resistance', start, end))
+    o = np.array(redis.mkr_range('status:temps:1k-stage:resistance', start, end, max_points=MAX_POINTS))
+    d = np.array(redis.mkr_range('status:temps:device-stage:resistance', start, end, max_points=MAX_POINTS))
 
     # Create a figure with data from each of the 4 sensors
     plt.figure()
@@ -0,0 +1,21 @@
+"""
+Simulators of the serial instruments, each on a pseudo-terminal that the device classes in mkidcontrol.devices can
+open as if it were the instrument's port. They allow the agents (and the magnet cycle) to be run, benchmarked and
+tested without hardware. Start one from python
+
+    with LakeShore625Simulator(link='/tmp/ls625', latency=0.01, critical_current=9.0) as ls625:
+        device = LakeShore625(port=ls625.port, valid_models=('MODEL625',))
+
+or from the command line, e.g. python -m mkidcontrol.simulators ls625 sim921 --link-dir /tmp
+See base.py for the latency, noise and fault injection options every simulator has.
+"""
+
+from mkidcontrol.simulators.base import FAULTS, PtySimulator, ScpiSimulator, ruox_resistance
+from mkidcontrol.simulators.lakeshore import MagnetModel, LakeShore372Simulator, LakeShore625Simulator
+from mkidcontrol.simulators.srs import SIM921Simulator, SIM960Simulator
+from mkidcontrol.simulators.arduino import CurrentduinoSimulator, HemtduinoSimulator, LaserflipperduinoSimulator
+from mkidcontrol.simulators.conex import ConexSimulator
+
+SIMULATORS = {sim.NAME: sim for sim in (LakeShore372Simulator, LakeShore625Simulator, SIM921Simulator,
+                                        SIM960Simulator, CurrentduinoSimulator, HemtduinoSimulator,
+                                        LaserflipperduinoSimulator, ConexSimulator)}
@@ -0,0 +1,47 @@
+"""
+Run instrument simulators until interrupted, e.g.
+
+    python -m mkidcontrol.simulators ls625 ls372 --link-dir /tmp --latency 0.02 --noise 1e-3 --drop 0.01
+
+and point the agents (or device classes) at /tmp/ls625 and /tmp/ls372.
+"""
+
+import argparse
+import logging
+import os
+import time
+
+from mkidcontrol.simulators import SIMULATORS
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Simulate serial instruments on pseudo-terminals')
+    parser.add_argument('devices', nargs='+', choices=sorted(SIMULATORS), help='Instruments to simulate')
+    parser.add_argument('--link-dir', dest='link_dir', default=None,
+                        help='Directory in which to symlink each pseudo-terminal under the instrument name')
+    parser.add_argument('--latency', type=float, default=0.0, help='Reply latency in s')
+    parser.add_argument('--jitter', type=float, default=0.0, help='Standard deviation of the reply latency in s')
+    parser.add_argument('--noise', type=float, default=0.0, help='Relative noise of the readings')
+    parser.add_argument('--drop', type=float, default=0.0, help='Probability of not replying')
+    parser.add_argument('--garble', type=float, default=0.0, help='Probability of a corrupted reply')
+    parser.add_argument('--stall', type=float, default=0.0, help='Probability of a reply stalling')
+    parser.add_argument('--stall-time', dest='stall_time', type=float, default=2.0, help='Stall duration in s')
+    parser.add_argument('--seed', type=int, default=None, help='Random seed')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    kwargs = {k: getattr(args, k) for k in ('latency', 'jitter', 'noise', 'drop', 'garble', 'stall', 'stall_time',
+                                            'seed')}
+    simulators = []
+    for name in args.devices:
+        link = os.path.join(args.link_dir, name) if args.link_dir else None
+        simulators.append(SIMULATORS[name](link=link, **kwargs).start())
+        print(f"{name}: {simulators[-1].port}")
+
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for sim in simulators:
+            sim.stop()
@@ -0,0 +1,97 @@
+"""
+Simulated PICTURE-C/XKID arduinos: the currentduino, hemtduino and laserflipperduino.
+
+The arduinos take single character (laserflipperduino: two byte) commands without a terminator and answer each with
+one line. See Currentduino, Hemtduino and Laserflipperduino in mkidcontrol.devices.
+"""
+
+from mkidcontrol.simulators.base import PtySimulator
+
+
+class ArduinoSimulator(PtySimulator):
+    TERMINATOR = None
+    FRAME_SIZE = 1
+    FIRMWARE = 0.1
+
+
+class CurrentduinoSimulator(ArduinoSimulator):
+    """
+    Measures current (A, or a callable returning it, e.g. the magnet current of a LakeShore625Simulator
+    lambda: ls625.magnet.current) through the divider and the calibration used by Currentduino and reports the raw
+    10 bit ADC count ('?'). 'o' and 'c' open and close the heat switch.
+    """
+    NAME = 'currentduino'
+    FIRMWARE = 0.2
+    R1 = 11760
+    R2 = 11710
+
+    def __init__(self, current=0.0, **kwargs):
+        super().__init__(**kwargs)
+        self.current = current
+        self.heat_switch = 'open'
+
+    def adc(self):
+        current = self.current() if callable(self.current) else self.current
+        voltage = (self.noisy(current, 1e-2) - 0.0681135) / 2.84324895
+        count = voltage / ((5.0 / 1023.0) * ((self.R1 + self.R2) / self.R2))
+        return min(max(int(round(count)), 0), 1023)
+
+    def handle(self, msg):
+        if msg == '?':
+            return f"{self.adc()} ?"
+        if msg == 'v':
+            return f"{self.FIRMWARE} v"
+        if msg in ('o', 'c'):
+            self.heat_switch = 'open' if msg == 'o' else 'close'
+            return msg
+        return None
+
+
+class HemtduinoSimulator(ArduinoSimulator):
+    """
+    Reports the 10 bit ADC counts of the 15 HEMT bias monitors (A0-A14, for each of the 5 HEMTs the gate voltage,
+    drain voltage and drain current), self.counts, on '?'
+    """
+    NAME = 'hemtduino'
+
+    def __init__(self, counts=None, **kwargs):
+        super().__init__(**kwargs)
+        self.counts = list(counts) if counts is not None else [460, 205, 123] * 5
+
+    def handle(self, msg):
+        if msg == '?':
+            counts = (min(max(int(round(self.noisy(c, 1))), 0), 1023) for c in self.counts)
+            return ' '.join(map(str, counts)) + ' ?'
+        if msg == 'v':
+            return f"{self.FIRMWARE} v"
+        return None
+
+
+class LaserflipperduinoSimulator(ArduinoSimulator):
+    """
+    Commands are (pin, value) byte pairs: pins 0-4 set the PWM (0-255) of the laser diodes and pin 5 the flip mirror
+    (0 down, otherwise up), each answered with 'pin:value'. (6, x) reports every pin and (7, x) the firmware.
+    """
+    NAME = 'laserflipperduino'
+    FRAME_SIZE = 2
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.pins = [0] * 6
+
+    def decode(self, raw):
+        return tuple(raw)
+
+    def handle(self, msg):
+        pin, value = msg
+        if pin < 5:
+            self.pins[pin] = value
+        elif pin == 5:
+            self.pins[pin] = int(value != 0)
+        elif pin == 6:
+            return ','.join(f"{p}:{v}" for p, v in enumerate(self.pins))
+        elif pin == 7:
+            return f"{pin}:{self.FIRMWARE}"
+        else:
+            return None
+        return f"{pin}:{self.pins[pin]}"
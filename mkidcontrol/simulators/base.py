@@ -0,0 +1,259 @@
+"""
+The pseudo-terminal plumbing shared by the instrument simulators.
+
+A PtySimulator opens a pseudo-terminal pair, hands the slave end (optionally via a symlink, e.g. /tmp/ls625) to the
+device class exactly as if it were the instrument's serial port, and answers the commands written to it from a
+reader thread. Every simulator has the same knobs:
+
+    latency, jitter   seconds before each reply (gaussian, never negative)
+    noise             relative standard deviation of the readings, see PtySimulator.noisy()
+    drop              probability that a reply is never sent (the device sees a timeout)
+    garble            probability that a reply is corrupted or cut short
+    stall             probability that a reply is held back for stall_time seconds
+    online            set False to stop answering altogether (unplugged cable, powered off instrument)
+
+and faults may be forced deterministically with inject().
+"""
+
+import logging
+import math
+import os
+import random
+import select
+import threading
+import time
+import tty
+from collections import deque
+
+log = logging.getLogger(__name__)
+
+FAULTS = ('drop', 'garble', 'stall')
+
+
+def ruox_resistance(kelvin, r0=222.0, t0=20.6):
+    """
+    Resistance in Ohms of a ruthenium oxide thermometer at kelvin, from a variable range hopping law
+    R = r0 exp((t0 / T)^(1/4)). The defaults give roughly 1 kOhm at 4 K and 20 kOhm at 50 mK, about an RX-102A.
+    """
+    return r0 * math.exp((t0 / max(kelvin, 1e-3)) ** 0.25)
+
+
+class PtySimulator:
+    """
+    A simulated serial instrument on a pseudo-terminal, see the module docstring.
+
+    Subclasses implement handle(), which is given each decoded command and returns the reply (without its
+    terminator) or None if the command has no reply. Commands are split on TERMINATOR, or if it is None into
+    FRAME_SIZE byte frames. handle() is always called with self.lock held, take it to change the state of the
+    simulated instrument from another thread. Use self.clock for the time so the simulators may be run on a virtual
+    clock.
+    """
+    NAME = 'simulator'
+    TERMINATOR = b'\n'
+    FRAME_SIZE = 1
+    RESPONSE_TERMINATOR = '\r\n'
+    ENCODING = 'ascii'
+
+    def __init__(self, link=None, latency=0.0, jitter=0.0, noise=0.0, drop=0.0, garble=0.0, stall=0.0,
+                 stall_time=2.0, seed=None, clock=time.monotonic):
+        self.link = link
+        self.latency = latency
+        self.jitter = jitter
+        self.noise = noise
+        self.probabilities = {'drop': drop, 'garble': garble, 'stall': stall}
+        self.stall_time = stall_time
+        self.clock = clock
+        self.rng = random.Random(seed)
+        self.online = True
+        self.lock = threading.RLock()
+        self.stats = {'commands': 0, 'replies': 0, 'dropped': 0, 'garbled': 0, 'stalled': 0, 'overflowed': 0}
+        self._forced = deque()
+        self._master = None
+        self._slave = None
+        self._tty = None
+        self._thread = None
+        self._stop = threading.Event()
+
+    @property
+    def port(self):
+        """ The path to open as the instrument's serial port """
+        return self.link if self.link else self._tty
+
+    def start(self):
+        """ Open the pseudo-terminal and start answering. Returns self """
+        self._master, self._slave = os.openpty()
+        tty.setraw(self._slave)  # No echo or newline translation, the device classes expect a bare serial line
+        os.set_blocking(self._master, False)
+        self._tty = os.ttyname(self._slave)
+        if self.link:
+            if os.path.islink(self.link):
+                os.remove(self.link)
+            os.symlink(self._tty, self.link)
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name=f'{self.NAME} simulator', daemon=True)
+        self._thread.start()
+        log.info(f"Simulated {self.NAME} on {self.port}")
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        for fd in (self._master, self._slave):
+            if fd is not None:
+                os.close(fd)
+        self._master = self._slave = None
+        if self.link and os.path.islink(self.link):
+            os.remove(self.link)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def inject(self, fault, count=1):
+        """ Force the next count replies to suffer fault (one of FAULTS) """
+        if fault not in FAULTS:
+            raise ValueError(f"Unknown fault '{fault}', must be one of {FAULTS}")
+        self._forced.extend([fault] * count)
+
+    def noisy(self, value, floor=0.0):
+        """ value with gaussian noise of standard deviation noise * max(|value|, floor) """
+        if not self.noise:
+            return value
+        return value + self.rng.gauss(0, self.noise * max(abs(value), floor))
+
+    def handle(self, msg):
+        raise NotImplementedError
+
+    def decode(self, raw):
+        return raw.decode(self.ENCODING, errors='replace').strip()
+
+    def split(self, buffer):
+        """ Return the list of complete commands in buffer and the remaining bytes """
+        if self.TERMINATOR is None:
+            n = len(buffer) - len(buffer) % self.FRAME_SIZE
+            return [buffer[i:i + self.FRAME_SIZE] for i in range(0, n, self.FRAME_SIZE)], buffer[n:]
+        *commands, rest = buffer.split(self.TERMINATOR)
+        return commands, rest
+
+    def _run(self):
+        buffer = b''
+        while not self._stop.is_set():
+            readable, _, _ = select.select([self._master], [], [], 0.05)
+            if not readable:
+                continue
+            try:
+                buffer += os.read(self._master, 4096)
+            except BlockingIOError:
+                continue
+            except OSError as e:
+                log.error(f"{self.NAME} simulator could not read from its pseudo-terminal: {e}")
+                break
+            commands, buffer = self.split(buffer)
+            for raw in commands:
+                self._respond(raw)
+
+    def _next_fault(self):
+        if self._forced:
+            return self._forced.popleft()
+        for fault, p in self.probabilities.items():
+            if p and self.rng.random() < p:
+                return fault
+        return None
+
+    def _respond(self, raw):
+        self.stats['commands'] += 1
+        if not self.online:
+            return
+        try:
+            with self.lock:
+                reply = self.handle(self.decode(raw))
+        except Exception:
+            log.exception(f"{self.NAME} simulator failed to handle {raw!r}")
+            return
+        if reply is None:
+            return
+
+        fault = self._next_fault()
+        if fault == 'drop':
+            self.stats['dropped'] += 1
+            return
+        delay = max(self.rng.gauss(self.latency, self.jitter), 0.0) if self.jitter else self.latency
+        if fault == 'stall':
+            self.stats['stalled'] += 1
+            delay += self.stall_time
+        if delay > 0:
+            time.sleep(delay)
+
+        data = f"{reply}{self.RESPONSE_TERMINATOR}".encode(self.ENCODING, errors='replace')
+        if fault == 'garble':
+            self.stats['garbled'] += 1
+            data = self._garble(data)
+        try:
+            os.write(self._master, data)
+            self.stats['replies'] += 1
+        except BlockingIOError:
+            # Nobody is reading the port and its buffer is full, a real instrument's replies would be lost too
+            self.stats['overflowed'] += 1
+
+    def _garble(self, data):
+        """ Either corrupt a character of data or cut it short (losing the terminator) """
+        if len(data) > 1 and self.rng.random() < 0.5:
+            return data[:self.rng.randrange(len(data) - 1)]
+        i = self.rng.randrange(len(data))
+        return data[:i] + bytes([self.rng.randrange(33, 127)]) + data[i + 1:]
+
+
+class ScpiSimulator(PtySimulator):
+    """
+    An instrument with 'CMD arg,arg' commands and 'CMD? arg' queries, several of which may be chained with ';' into
+    one message (answered with the replies joined with ';', the SCPI ';:' separator is accepted too).
+
+    A command CMD calls set_CMD(*args) and a query calls query_CMD(*args) if the subclass has them (the '*' of common
+    commands is dropped, so '*IDN?' calls query_IDN). Every command is also stored in self.settings, so queries
+    without a handler return what was last set: 'CMD?' returns all of the arguments of the last 'CMD ...' and
+    'CMD? x' the arguments after x of the last 'CMD x,...' (e.g. 'INSET? 1' after 'INSET 1,1,10,3,1,1'). DEFAULTS
+    gives the power-up settings in the same form, {('CMD', None or x): 'value'}. Unknown queries return '0'.
+    """
+    IDN = 'Simulated,SIMULATOR,0,0'
+    DEFAULTS = {}
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.settings = dict(self.DEFAULTS)
+
+    def handle(self, msg):
+        replies = [r for r in map(self.handle_one, msg.split(';')) if r is not None]
+        return ';'.join(replies) if replies else None
+
+    def handle_one(self, msg):
+        cmd, _, args = msg.strip().lstrip(':').partition(' ')
+        if not cmd:
+            return None
+        args = [a.strip() for a in args.split(',')] if args.strip() else []
+        query = cmd.endswith('?')
+        name = cmd.rstrip('?').lstrip('*').upper()
+
+        if query:
+            handler = getattr(self, f'query_{name}', None)
+            return handler(*args) if handler else self.setting(name, *args[:1])
+
+        self.settings[(name, None)] = ','.join(args)
+        if len(args) > 1:
+            self.settings[(name, args[0].upper())] = ','.join(args[1:])
+        handler = getattr(self, f'set_{name}', None)
+        if handler:
+            handler(*args)
+        return None
+
+    def setting(self, name, index=None, default='0'):
+        return self.settings.get((name, index.upper() if index else None), default)
+
+    def query_IDN(self):
+        return self.IDN
+
+    def query_OPC(self):
+        return '1'
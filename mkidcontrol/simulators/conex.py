@@ -0,0 +1,87 @@
+"""
+Simulated Newport Conex-AG tip/tilt mirror controller.
+"""
+
+import re
+
+from mkidcontrol.simulators.base import PtySimulator
+
+COMMAND = re.compile(r'^(\d{1,2})([A-Z]{2})([UV]?)(\??)(.*)$')
+
+
+class ConexSimulator(PtySimulator):
+    """
+    A Conex-AG controller with its U and V axes, see Conex in mkidcontrol.devices.
+
+    Messages are 'nnAA[axis]value' or 'nnAA[axis]?', replies 'nnAA[axis]value'. PA moves an axis at speed
+    (degrees/s) if the target is within the SL/SR limits, TP? reads the positions, TS? the (error, state) status
+    (state MOVING CL while moving, READY from MOVING CL after), MM0/MM1 disable/enable the controller, ST stops and
+    RS resets. Set self.error (a 4 hex digit code, e.g. '0020' for a motion time out) to report an error.
+    """
+    NAME = 'conex'
+    TERMINATOR = b'\r\n'
+
+    def __init__(self, controller=1, speed=0.5, limit=0.75, **kwargs):
+        super().__init__(**kwargs)
+        self.controller = str(controller)
+        self.speed = speed
+        self.lower = {'U': -limit, 'V': -limit}
+        self.upper = {'U': limit, 'V': limit}
+        self.position = {'U': 0.0, 'V': 0.0}
+        self.target = {'U': 0.0, 'V': 0.0}
+        self.state = '32'
+        self.error = '0000'
+        self._t = self.clock()
+
+    def advance(self):
+        now = self.clock()
+        step = self.speed * (now - self._t)
+        self._t = now
+        for axis, target in self.target.items():
+            delta = target - self.position[axis]
+            self.position[axis] = target if abs(delta) <= step else \
+                self.position[axis] + step * (1 if delta > 0 else -1)
+        if self.state == '28' and self.position == self.target:
+            self.state = '33'
+
+    def handle(self, msg):
+        match = COMMAND.match(msg)
+        if not match or match.group(1).lstrip('0') != self.controller:
+            return None
+        _, cmd, axis, query, value = match.groups()
+        self.advance()
+        name = f"{cmd}{axis}"
+        if query:
+            reply = {'TS': lambda: f"{self.error}{self.state}",
+                     'TP': lambda: f"{self.position[axis]:.4f}",
+                     'PA': lambda: f"{self.target[axis]:.4f}",
+                     'SL': lambda: f"{self.lower[axis]:.4f}",
+                     'SR': lambda: f"{self.upper[axis]:.4f}",
+                     'ID': lambda: " CONEX-AG-M100D_SIM",
+                     'VE': lambda: " CONEX-AGP 1.0.0 SIM"}.get(cmd)
+            return f"{self.controller}{name}{reply()}" if reply else None
+
+        if cmd == 'PA' and axis and self.state not in ('3C', '3D'):
+            target = float(value)
+            if self.lower[axis] <= target <= self.upper[axis]:
+                self.target[axis] = target
+                self.state = '28' if self.position != self.target else '33'
+        elif cmd == 'SL' and axis:
+            self.lower[axis] = float(value)
+        elif cmd == 'SR' and axis:
+            self.upper[axis] = float(value)
+        elif cmd == 'ST':
+            self.target = dict(self.position)
+            if self.state == '28':
+                self.state = '33'
+        elif cmd == 'MM':
+            if value.strip() == '0':
+                self.state = '3D' if self.state == '28' else '3C'
+                self.target = dict(self.position)
+            elif self.state in ('3C', '3D'):
+                self.state = '34'
+        elif cmd == 'RS':
+            self.target = dict(self.position)
+            self.state = '32'
+            self.error = '0000'
+        return None
@@ -0,0 +1,261 @@
+"""
+Simulated Lake Shore 372 AC resistance bridge and Lake Shore 625 superconducting magnet power supply.
+"""
+
+import math
+import serial
+
+from mkidcontrol.simulators.base import ScpiSimulator, ruox_resistance
+
+
+class MagnetModel:
+    """
+    A superconducting magnet on a current source.
+
+    The current ramps linearly to target at rate (A/s), or as fast as the compliance voltage can drive the inductance
+    if that is slower, and the supply's output voltage is inductance * dI/dt + resistance * I (the leads). When the
+    current exceeds critical_current, or quench() is called, the magnet quenches: it turns normal, its current decays
+    exponentially with time constant quench_tau (putting a large negative voltage across it) and the target is zeroed.
+    advance(t) brings the model up to time t (seconds, any clock) and may be called as often or rarely as needed.
+    """
+    def __init__(self, inductance=10.0, resistance=0.01, critical_current=None, quench_tau=0.5, t=0.0):
+        self.inductance = inductance
+        self.resistance = resistance
+        self.critical_current = critical_current
+        self.quench_tau = quench_tau
+        self.t = t
+        self.current = 0.0
+        self.target = 0.0
+        self.rate = 0.005
+        self.compliance = 5.0
+        self.voltage = 0.0
+        self.quenching = False
+        self.quenches = 0
+
+    @property
+    def ramping(self):
+        return not self.quenching and self.current != self.target
+
+    @property
+    def ramp_rate(self):
+        """ The rate the current can ramp at, the lower of rate and what the compliance voltage allows """
+        return min(self.rate, self.compliance / self.inductance) if self.inductance > 0 else self.rate
+
+    def advance(self, t):
+        while t > self.t:
+            dt = t - self.t
+            end = t
+            if self.quenching:
+                current = self.current * math.exp(-dt / self.quench_tau)
+                if abs(current) < 1e-4:
+                    current = 0.0
+                    self.quenching = False
+            else:
+                delta = self.target - self.current
+                current = self.current + math.copysign(min(abs(delta), self.ramp_rate * dt), delta)
+                critical = self.critical_current
+                if critical is not None and abs(current) > critical:
+                    if abs(self.current) >= critical:
+                        self.quench()
+                        continue
+                    # Quench at the moment the critical current is reached
+                    dt *= (critical - abs(self.current)) / (abs(current) - abs(self.current))
+                    end = self.t + dt
+                    current = math.copysign(critical, current)
+            self.voltage = self.inductance * (current - self.current) / dt + self.resistance * current
+            self.current = current
+            self.t = end
+            if end != t:
+                self.quench()
+
+    def quench(self):
+        self.quenching = True
+        self.quenches += 1
+        self.target = 0.0
+
+
+class LakeShore625Simulator(ScpiSimulator):
+    """
+    A Lake Shore 625 driving a MagnetModel (self.magnet), see LakeShore625 in mkidcontrol.devices.
+
+    SETI, RATE, SETV, LIMIT and STOP act on the magnet, RDGI?, RDGV? and RDGF? read it (the field from the FLDS
+    constant in kG/A) and SETI? reports the setpoint, which a quench zeroes. Call quench() to quench the magnet at
+    will or give critical_current to quench it whenever the current exceeds it. The external program input (XPGM 1
+    or 2) is not modelled, the output always follows SETI. The 625 does not reply to commands.
+    """
+    NAME = 'ls625'
+    IDN = 'LSCI,MODEL625,SIM625,1.6'
+    DEFAULTS = {('XPGM', None): '0', ('FLDS', None): '1,4.0609', ('FLDS', '1'): '4.0609',
+                ('QNCH', None): '1,0.5', ('QNCH', '1'): '0.5'}
+
+    def __init__(self, inductance=10.0, resistance=0.01, critical_current=None, quench_tau=0.5,
+                 limits=(9.4, 5.0, 99.999), **kwargs):
+        super().__init__(**kwargs)
+        self.magnet = MagnetModel(inductance=inductance, resistance=resistance, critical_current=critical_current,
+                                  quench_tau=quench_tau, t=self.clock())
+        self.limits = list(limits)  # current (A), voltage (V), rate (A/s)
+        self.setpoint = 0.0
+        self._quenches = 0
+
+    def handle(self, msg):
+        self.advance()
+        return super().handle(msg)
+
+    def advance(self):
+        """ Bring the magnet up to the present, zeroing the setpoint if it has quenched """
+        with self.lock:
+            self.magnet.advance(self.clock())
+            if self.magnet.quenches != self._quenches:
+                self._quenches = self.magnet.quenches
+                self.setpoint = 0.0
+
+    def quench(self):
+        with self.lock:
+            self.advance()
+            self.magnet.quench()
+            self.advance()
+
+    def set_SETI(self, amps):
+        self.setpoint = min(max(float(amps), -self.limits[0]), self.limits[0])
+        self.magnet.target = self.setpoint
+
+    def set_RATE(self, rate):
+        self.magnet.rate = min(abs(float(rate)), self.limits[2])
+
+    def set_SETV(self, volts):
+        self.magnet.compliance = min(abs(float(volts)), self.limits[1])
+
+    def set_LIMIT(self, current, voltage, rate):
+        self.limits = [float(current), float(voltage), float(rate)]
+        self.set_SETI(self.setpoint)
+        self.set_RATE(self.magnet.rate)
+        self.set_SETV(self.magnet.compliance)
+
+    def set_STOP(self):
+        self.setpoint = self.magnet.target = self.magnet.current
+
+    def query_SETI(self):
+        return f"{self.setpoint:+.4f}"
+
+    def query_RATE(self):
+        return f"{self.magnet.rate:.4f}"
+
+    def query_SETV(self):
+        return f"{self.magnet.compliance:.4f}"
+
+    def query_LIMIT(self):
+        return f"{self.limits[0]:.4f},{self.limits[1]:.4f},{self.limits[2]:.4f}"
+
+    def query_RDGI(self):
+        return f"{self.noisy(self.magnet.current, 1e-3):+.4f}"
+
+    def query_RDGV(self):
+        return f"{self.noisy(self.magnet.voltage, 1e-3):+.4f}"
+
+    def query_RDGF(self):
+        field = self.magnet.current * float(self.setting('FLDS', '1', default='1'))
+        return f"{self.noisy(field, 1e-3):+.4E}"
+
+
+class LakeShore372Simulator(ScpiSimulator):
+    """
+    A Lake Shore 372 with its control input 'A' and the scanned measurement inputs '1'-'16', as used through the
+    lakeshore package by LakeShore372 in mkidcontrol.devices.
+
+    The lakeshore package only opens serial ports it finds by their USB VID/PID, so hand LakeShore372 an open port
+    from serial_connection() instead of the port name.
+
+    The scanner (SCAN, INSET) dwells on each enabled input for its pause + dwell time, moving on to the next enabled
+    input if autoscan is on. The input the scanner is on (once past its pause time) and the control input make a new
+    conversion every CONVERSION_TIME, every other input holds its last reading. Readings (KRDG?, RDGR?, RDGPWR?)
+    follow self.temperatures (K per input, change them with set_temperature()) through ruox_resistance(), RDGST?
+    returns self.status (0 unless set) and HTR? the heater output self.heater (%).
+    """
+    NAME = 'ls372'
+    IDN = 'LSCI,MODEL372,SIM372,1.0'
+    INPUTS = ('A',) + tuple(str(i) for i in range(1, 17))
+    CONVERSION_TIME = 0.1
+    EXCITATION = 1e-9  # A
+    DEFAULTS = {('INSET', c): '1,1,3,1,1' if c in ('A', '1') else '0,10,3,1,1' for c in INPUTS}
+
+    def __init__(self, temperatures=None, **kwargs):
+        super().__init__(**kwargs)
+        self.temperatures = {c: 0.1 if c == 'A' else 4.0 for c in self.INPUTS}
+        self.temperatures.update(temperatures or {})
+        self.status = {}
+        self.heater = 0.0
+        self.scan_input = '1'
+        self.autoscan = False
+        self._scan_since = self.clock()
+        self._readings = {}  # input: (kelvin, ohms)
+        self._converted = {}  # input: clock time of the last conversion
+
+    def serial_connection(self, baudrate=57600, timeout=0.1):
+        """ An open serial port to the simulator, configured as the lakeshore package configures a 372's """
+        return serial.Serial(self.port, baudrate=baudrate, bytesize=serial.SEVENBITS, parity=serial.PARITY_ODD,
+                             stopbits=serial.STOPBITS_ONE, timeout=timeout)
+
+    def set_temperature(self, channel, kelvin):
+        with self.lock:
+            self.temperatures[self._input(channel)] = kelvin
+
+    @staticmethod
+    def _input(channel):
+        channel = str(channel).strip().upper()
+        return str(int(channel)) if channel.isdigit() else channel
+
+    def _inset(self, channel):
+        enabled, dwell, pause, *_ = self.setting('INSET', channel, default='0,10,3,1,1').split(',')
+        return enabled.strip() == '1', float(dwell), float(pause)
+
+    def _advance_scanner(self, now):
+        while self.autoscan:
+            _, dwell, pause = self._inset(self.scan_input)
+            period = max(dwell + pause, self.CONVERSION_TIME)
+            if now - self._scan_since < period:
+                break
+            scanned = list(self.INPUTS[1:])
+            i = scanned.index(self.scan_input)
+            following = scanned[i + 1:] + scanned[:i + 1]
+            self.scan_input = next((c for c in following if self._inset(c)[0]), self.scan_input)
+            self._scan_since += period
+
+    def _reading(self, channel):
+        channel = self._input(channel)
+        now = self.clock()
+        self._advance_scanner(now)
+        measuring = channel == 'A' or (channel == self.scan_input and
+                                       now - self._scan_since >= self._inset(channel)[2])
+        if channel not in self._readings or (measuring and
+                                             now - self._converted[channel] >= self.CONVERSION_TIME):
+            kelvin = self.temperatures.get(channel, 0.0)
+            self._readings[channel] = (self.noisy(kelvin), self.noisy(ruox_resistance(kelvin)))
+            self._converted[channel] = now
+        return self._readings[channel]
+
+    def handle(self, msg):
+        self._advance_scanner(self.clock())
+        return super().handle(msg)
+
+    def set_SCAN(self, channel, autoscan='0'):
+        self.scan_input = self._input(channel)
+        self.autoscan = autoscan.strip() == '1'
+        self._scan_since = self.clock()
+
+    def query_SCAN(self):
+        return f"{int(self.scan_input):02d},{int(self.autoscan)}"
+
+    def query_KRDG(self, channel):
+        return f"{self._reading(channel)[0]:+.6E}"
+
+    def query_RDGR(self, channel):
+        return f"{self._reading(channel)[1]:+.6E}"
+
+    def query_RDGPWR(self, channel):
+        return f"{self.EXCITATION ** 2 * self._reading(channel)[1]:+.6E}"
+
+    def query_RDGST(self, channel):
+        return f"{self.status.get(self._input(channel), 0):03d}"
+
+    def query_HTR(self, *output):
+        return f"{self.heater:+.4E}"
@@ -0,0 +1,420 @@
+"""
+Fast-forward magnet cycles: the magnet state machines run against simulated instruments on a virtual clock.
+
+MagnetCycleSimulation runs the XKID MagnetController (agents/xkid/magnetAgent.py) with the lakeshore625, heatswitch
+and lakeshore372 agents played by models: after each tick of the controller the commands it published are applied to
+the models, and every interval the models' readings are stored as the agents would store them. The magnet is a
+MagnetModel, the device stage an ADRModel and the heat switch a HeatswitchModel. PicturecCycleSimulation does the same
+for the PICTURE-C MagnetController of agents/picturec/sim960Agent.py, which drives a SIM960 device class on a
+SIM960Simulator directly.
+
+The controllers are given the VirtualClock for their time and scheduled cooldowns and are ticked by the simulation
+instead of running their main loop. The simulations use the in-process redis (memredis), which delivers published
+commands synchronously, so a run is deterministic and only as slow as the controller itself: a cycle of several hours
+takes seconds.
+
+    sim = MagnetCycleSimulation(ramp_rate=0.005, soak_current=9.4, soak_time=30)
+    result = sim.run_cycle()
+    print(result['time_to_cold'], result['states'])
+
+Running a simulation takes over the module level mkidredis client (mkidredis.setup_redis), so nothing else in the
+process should be using redis. See tests/magnetCycleBenchmark.py for a benchmark of ramp rate and soak settings.
+"""
+
+import heapq
+import itertools
+import logging
+import math
+import os
+import random
+import tempfile
+import time
+from datetime import datetime
+
+from transitions import MachineError
+
+import mkidcontrol.mkidredis as redis
+from mkidcontrol.mkidredis import RedisError
+from mkidcontrol.devices import HeatswitchPosition, SIM960
+from mkidcontrol.simulators.lakeshore import MagnetModel
+from mkidcontrol.simulators.srs import SIM960Simulator
+
+log = logging.getLogger(__name__)
+
+SIMULATION_PORT = 16379  # The memredis server of the simulations, kept apart from any other in the process
+
+
+class VirtualTimer:
+    """ A threading.Timer on a VirtualClock, see VirtualClock.timer() """
+    def __init__(self, clock, interval, function, args=None, kwargs=None):
+        self.clock = clock
+        self.interval = interval
+        self.function = function
+        self.args = args or ()
+        self.kwargs = kwargs or {}
+        self.daemon = True
+        self.cancelled = False
+        self.due = None
+
+    def start(self):
+        self.due = self.clock.now + self.interval
+        self.clock.schedule(self)
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class VirtualClock:
+    """
+    Simulated UNIX time that only moves on when advance() is called. Call the clock for the time. timer() has the
+    signature of threading.Timer, its timers fire during the advance() that reaches their due time.
+    """
+    def __init__(self, start=None):
+        self.now = time.time() if start is None else start
+        self._timers = []  # heap of (due, sequence number, timer)
+        self._sequence = itertools.count()
+
+    def __call__(self):
+        return self.now
+
+    def timer(self, interval, function, args=None, kwargs=None):
+        return VirtualTimer(self, interval, function, args=args, kwargs=kwargs)
+
+    def schedule(self, timer):
+        heapq.heappush(self._timers, (timer.due, next(self._sequence), timer))
+
+    def advance(self, dt):
+        end = self.now + dt
+        while self._timers and self._timers[0][0] <= end:
+            due, _, timer = heapq.heappop(self._timers)
+            self.now = max(self.now, due)
+            if not timer.cancelled:
+                timer.function(*timer.args, **timer.kwargs)
+        self.now = end
+
+
+class HeatswitchModel:
+    """
+    A heat switch that takes travel_time seconds to open or close, starting closed or open (closed=False). position()
+    is one of the HeatswitchPosition.OPENED/CLOSED/OPENING/CLOSING values the heatswitchAgent reports.
+    """
+    def __init__(self, travel_time=10.0, closed=False, t=0.0):
+        self.travel_time = travel_time
+        self.closed = closed  # Where the switch is headed (or is)
+        self.arrival = t
+
+    def move(self, position, t):
+        """ Start moving towards position (HeatswitchPosition.OPEN or CLOSE) at time t """
+        closed = position == HeatswitchPosition.CLOSE
+        if closed != self.closed:
+            # A reversal takes as long to undo as the travel so far
+            self.arrival = t + self.travel_time - max(self.arrival - t, 0.0)
+            self.closed = closed
+
+    def arrived(self, t):
+        return t >= self.arrival
+
+    def position(self, t):
+        if self.closed:
+            return HeatswitchPosition.CLOSED if self.arrived(t) else HeatswitchPosition.CLOSING
+        return HeatswitchPosition.OPENED if self.arrived(t) else HeatswitchPosition.OPENING
+
+
+class ADRModel:
+    """
+    The device stage of an adiabatic demagnetization refrigerator.
+
+    While the heat switch is closed the stage relaxes towards bath_temp (K) with time constant tau (s). Once it opens
+    the salt is adiabatic and the temperature follows the magnet current, T = ratio * |I| with the ratio fixed when the
+    switch opened, except that the heat leak raises the ratio by leak K/A each second. The stage never gets colder than
+    base_temp. advance(t, current, heatswitch_closed) brings the model up to time t.
+    """
+    def __init__(self, bath_temp=3.5, base_temp=0.03, tau=60.0, leak=2e-6, t=0.0):
+        self.bath_temp = bath_temp
+        self.base_temp = base_temp
+        self.tau = tau
+        self.leak = leak
+        self.t = t
+        self.temp = bath_temp
+        self.ratio = None  # K/A, set while the heat switch is open
+
+    def advance(self, t, current, heatswitch_closed):
+        dt = t - self.t
+        if dt <= 0:
+            return
+        if heatswitch_closed:
+            self.ratio = None
+            self.temp = self.bath_temp + (self.temp - self.bath_temp) * math.exp(-dt / self.tau)
+        else:
+            if self.ratio is None:
+                self.ratio = self.temp / max(abs(current), 1e-3)
+            self.ratio += self.leak * dt
+            self.temp = max(self.ratio * abs(current), self.base_temp)
+        self.t = t
+
+
+class CycleSimulation:
+    """
+    The common part of the magnet cycle simulations: the virtual clock, the simulated redis, the step loop and the
+    bookkeeping of states. Subclasses create self.controller and implement _sample() and _apply(channel, value).
+    """
+    COLD_STATE = 'regulating'
+    TS_KEYS = tuple()
+    COMMAND_CHANNELS = tuple()
+
+    def __init__(self, interval=1.0, heatswitch_time=10.0, adr=None, noise=1e-4, seed=None, start=None):
+        self.clock = VirtualClock(start=start)
+        self.interval = interval
+        self.rng = random.Random(seed)
+        self.noise = noise
+        self.heatswitch = HeatswitchModel(travel_time=heatswitch_time, t=self.clock())
+        self.adr = adr or ADRModel()
+        self.adr.t = self.clock()
+        self.controller = None
+        self.states = []  # (time, state) for every state entered
+        self.ticks = 0
+        self.errors = 0
+        self._position = None  # The last heat switch position stored
+        self._statedir = tempfile.TemporaryDirectory(prefix='magnetcycle')
+        self.statefile = os.path.join(self._statedir.name, 'magnet.statefile')
+
+        redis.setup_redis(port=SIMULATION_PORT, backend='memory')
+        redis.mkidredis.redis.flushall()
+        redis.mkidredis.create_ts_keys(self.TS_KEYS)
+        redis.mkidredis.ts_keys = self.TS_KEYS
+        self._commands = redis.mkidredis.redis.pubsub(ignore_subscribe_messages=True)
+        self._commands.subscribe(*self.COMMAND_CHANNELS)
+
+    def close(self):
+        self._commands.close()
+        self._statedir.cleanup()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def noisy(self, value):
+        return value + self.rng.gauss(0, self.noise) if self.noise else value
+
+    def step(self):
+        """
+        Advance by interval: bring the instruments up to the new time and store their readings, tick the controller
+        and then carry out the commands it sent
+        """
+        self.clock.advance(self.interval)
+        self._record_state()  # A scheduled cooldown may have started
+        self._sample()
+        try:
+            self._tick()
+        except (IOError, MachineError, RedisError):
+            # As the controller's main loop would
+            log.info("Error in magnet controller tick", exc_info=True)
+            self.errors += 1
+        self.ticks += 1
+        self._record_state()
+        self._drain_commands()
+
+    def run(self, until, timeout):
+        """ Step until until() is true or timeout simulated seconds pass, return whether until() was met """
+        end = self.clock() + timeout
+        while not until():
+            if self.clock() >= end:
+                return False
+            self.step()
+        return True
+
+    def run_cycle(self, cold_by=None, timeout=8 * 3600):
+        """
+        Run a cycle: wait for the controller to be off, then start a cooldown (or with cold_by, a UNIX time, schedule
+        one to be cold by then) and run until the controller reaches COLD_STATE or timeout simulated seconds pass.
+        Returns a dict of the simulated time from the start of the cooldown to cold (None if it never got cold), the
+        states entered, the number of controller ticks and errors and the wall clock time and rate of the run.
+        """
+        wall = time.perf_counter()
+        ticks = self.ticks
+        if not self.run(lambda: self.controller.state == 'off', timeout=600):
+            raise RuntimeError(f"Magnet controller did not turn off, it is {self.controller.state}")
+        if cold_by is None:
+            self.controller.start()
+        else:
+            self.controller.schedule_cooldown(datetime.fromtimestamp(cold_by))
+        self._record_state()
+        requested = self.clock()
+        cold = self.run(lambda: self.controller.state == self.COLD_STATE, timeout=timeout)
+        wall = time.perf_counter() - wall
+        ticks = self.ticks - ticks
+
+        started = next((t for t, s in self.states if t >= requested and s not in ('off', 'deramping')), None)
+        cold_at = self.clock() if cold else None
+        return {'time_to_cold': cold_at - started if cold and started is not None else None,
+                'cold_at': cold_at, 'started': started, 'cold_by': cold_by, 'final_state': self.controller.state,
+                'states': [(t - requested, s) for t, s in self.states if t >= requested],
+                'ticks': ticks, 'errors': self.errors, 'wall_time': wall, 'ticks_per_s': ticks / wall,
+                'speedup': ticks * self.interval / wall}
+
+    def _record_state(self):
+        state = self.controller.state
+        if not self.states or self.states[-1][1] != state:
+            self.states.append((self.clock(), state))
+
+    def _drain_commands(self):
+        while True:
+            msg = self._commands.get_message()
+            if msg is None:
+                return
+            channel, value = msg['channel'].decode(), msg['data'].decode()
+            log.debug(f"Simulated instruments got {channel} -> {value}")
+            self._apply(channel, value)
+
+    def _tick(self):
+        raise NotImplementedError
+
+    def _sample(self):
+        raise NotImplementedError
+
+    def _apply(self, channel, value):
+        raise NotImplementedError
+
+
+class MagnetCycleSimulation(CycleSimulation):
+    """
+    The XKID magnet controller with a simulated LakeShore 625 (a MagnetModel, by default a 35 H magnet), heat switch
+    and device stage. Rates are in A/s, soak_time in minutes and regulation_temp in K, as the controller's settings.
+    Pass critical_current to have the magnet quench above it.
+    """
+    def __init__(self, ramp_rate=0.005, deramp_rate=0.005, soak_current=9.4, soak_time=30, regulation_temp=0.1,
+                 inductance=35.0, resistance=0.16, critical_current=None, **kwargs):
+        import mkidcontrol.agents.xkid.magnetAgent as magnet
+        self.magnet_agent = magnet
+        ls625, heatswitch, ls372 = magnet.ls625, magnet.heatswitch, magnet.ls372
+        self.TS_KEYS = (magnet.MAGNET_CURRENT_KEY, magnet.MAGNET_FIELD_KEY, magnet.DEVICE_TEMP_KEY)
+        self.COMMAND_CHANNELS = (f"command:{ls625.DESIRED_CURRENT_KEY}", f"command:{ls625.RAMP_RATE_KEY}",
+                                 f"command:{heatswitch.HEATSWITCH_MOVE_KEY}", ls372.OUTPUT_MODE_COMMAND_KEY,
+                                 ls372.OUTPUT_RANGE_COMMAND_KEY)
+        super().__init__(**kwargs)
+        self.magnet = MagnetModel(inductance=inductance, resistance=resistance, critical_current=critical_current,
+                                  t=self.clock())
+        self.field_constant = 4.0609  # kG/A
+
+        redis.store({ls625.STATUS_KEY: 'OK', ls625.OUTPUT_MODE_KEY: 'Sum', ls625.DESIRED_CURRENT_KEY: 0,
+                     magnet.RAMP_RATE_KEY: ramp_rate, magnet.DERAMP_RATE_KEY: deramp_rate,
+                     magnet.SOAK_CURRENT_KEY: soak_current, magnet.SOAK_TIME_KEY: soak_time,
+                     magnet.REGULATION_TEMP_KEY: regulation_temp, magnet.IMPOSE_UPPER_LIMIT_ON_REGULATION_KEY: 'off',
+                     heatswitch.HEATSWITCH_POSITION_KEY: self.heatswitch.position(self.clock()),
+                     ls372.OUTPUT_MODE_KEY: 'Off', ls372.OUTPUT_RANGE_KEY: '0'}, batch=True)
+        self._sample()
+        self.controller = magnet.MagnetController(statefile=self.statefile, clock=self.clock, timer=self.clock.timer,
+                                                  start=False)
+        self._record_state()
+
+    def _tick(self):
+        self.controller.tick({self.magnet_agent.MAGNET_CURRENT_KEY: 1})
+
+    def _sample(self):
+        """ Store what the lakeshore625, heatswitch and lakeshore372 agents would """
+        magnet = self.magnet_agent
+        now = self.clock()
+        self.magnet.advance(now)
+        closed = self.heatswitch.position(now) == HeatswitchPosition.CLOSED
+        self.adr.advance(now, self.magnet.current, closed)
+        ts_data = {magnet.MAGNET_CURRENT_KEY: self.noisy(self.magnet.current),
+                   magnet.MAGNET_FIELD_KEY: self.field_constant * self.magnet.current,
+                   magnet.DEVICE_TEMP_KEY: self.adr.temp}
+        position = self.heatswitch.position(now)
+        data = {}
+        if position != self._position:
+            data[magnet.heatswitch.HEATSWITCH_POSITION_KEY] = position
+            self._position = position
+        redis.store_batch(data=data, ts_data=ts_data, timestamp=int(1000 * now))
+
+    def _apply(self, channel, value):
+        magnet = self.magnet_agent
+        key = channel.removeprefix('command:')
+        if key == magnet.ls625.DESIRED_CURRENT_KEY:
+            self.magnet.advance(self.clock())
+            self.magnet.target = float(value)
+        elif key == magnet.ls625.RAMP_RATE_KEY:
+            self.magnet.advance(self.clock())
+            self.magnet.rate = abs(float(value))
+        elif key == magnet.heatswitch.HEATSWITCH_MOVE_KEY:
+            self.heatswitch.move(value, self.clock())
+            return
+        redis.store({key: value})
+
+
+class PicturecCycleSimulation(CycleSimulation):
+    """
+    The PICTURE-C magnet controller of the sim960Agent driving a SIM960 (the device class, on a SIM960Simulator), with
+    a simulated heat switch (the currentduino's) and device stage. Rates are in A/s, soak_time in seconds and
+    regulation_temp in K, as the controller's settings.
+    """
+    SIM960_SETTINGS = {'device-settings:sim960:vout-min-limit': -0.01, 'device-settings:sim960:vout-max-limit': 9.0,
+                       'device-settings:sim960:vin-setpoint-mode': 'internal',
+                       'device-settings:sim960:vin-setpoint': 0.0, 'device-settings:sim960:pid-p:value': -16.0,
+                       'device-settings:sim960:pid-i:value': 0.2, 'device-settings:sim960:pid-d:value': 0.0,
+                       'device-settings:sim960:pid-offset:value': 0.0,
+                       'device-settings:sim960:vin-setpoint-slew-enable': 'off',
+                       'device-settings:sim960:vin-setpoint-slew-rate': 0.1,
+                       'device-settings:sim960:pid-p:enabled': 'on', 'device-settings:sim960:pid-i:enabled': 'on',
+                       'device-settings:sim960:pid-d:enabled': 'off',
+                       'device-settings:sim960:pid-offset:enabled': 'off'}
+
+    def __init__(self, ramp_rate=0.005, deramp_rate=0.005, soak_current=9.4, soak_time=1800, regulation_temp=0.1,
+                 **kwargs):
+        import mkidcontrol.agents.picturec.sim960Agent as sim960
+        self.sim960_agent = sim960
+        self.TS_KEYS = (sim960.DEVICE_TEMP_KEY,)
+        self.COMMAND_CHANNELS = (sim960.heatswitch.HEATSWITCH_MOVE_KEY, sim960.sim921.OUTPUT_MODE_COMMAND_KEY)
+        super().__init__(**kwargs)
+
+        redis.store({sim960.RAMP_SLOPE_KEY: ramp_rate, sim960.DERAMP_SLOPE_KEY: -abs(deramp_rate),
+                     sim960.SOAK_CURRENT_KEY: soak_current, sim960.SOAK_TIME_KEY: soak_time,
+                     sim960.REGULATION_TEMP_KEY: regulation_temp,
+                     sim960.IMPOSE_UPPER_LIMIT_ON_REGULATION_KEY: 'off',
+                     sim960.heatswitch.HEATSWITCH_STATUS_KEY: HeatswitchPosition.OPEN,
+                     sim960.sim921.OUTPUT_MODE_KEY: sim960.sim921.SIM921OutputMode.MANUAL, **self.SIM960_SETTINGS},
+                    batch=True)
+        self.simulator = SIM960Simulator(clock=self.clock).start()
+        self.simulator.settings[('APOL', None)] = '0'  # As configured, otherwise the controller would initialize it
+        self.sim = SIM960(port=self.simulator.port, clock=self.clock)
+        self._sample()
+        self.controller = sim960.MagnetController(statefile=self.statefile, sim=self.sim, clock=self.clock,
+                                                  timer=self.clock.timer, start=False)
+        self.controller.LOOP_INTERVAL = self.interval  # The current is stepped by the ramp rate each LOOP_INTERVAL
+        self._record_state()
+
+    def close(self):
+        self.sim.disconnect()
+        self.simulator.stop()
+        super().close()
+
+    def _tick(self):
+        self.controller.tick()
+
+    def current(self):
+        """ The magnet current the SIM960's output drives """
+        with self.simulator.lock:
+            return SIM960._out_volt_2_current(self.simulator.output())
+
+    def _sample(self):
+        """ Store what the currentduino and sim921 agents would """
+        sim960 = self.sim960_agent
+        now = self.clock()
+        closed = self.heatswitch.position(now) == HeatswitchPosition.CLOSED
+        self.adr.advance(now, self.current(), closed)
+        data = {}
+        if self.heatswitch.arrived(now):
+            position = HeatswitchPosition.CLOSE if self.heatswitch.closed else HeatswitchPosition.OPEN
+            if position != self._position:
+                data[sim960.heatswitch.HEATSWITCH_STATUS_KEY] = position
+                self._position = position
+        redis.store_batch(data=data, ts_data={sim960.DEVICE_TEMP_KEY: self.adr.temp}, timestamp=int(1000 * now))
+
+    def _apply(self, channel, value):
+        sim960 = self.sim960_agent
+        if channel == sim960.heatswitch.HEATSWITCH_MOVE_KEY:
+            self.heatswitch.move(value, self.clock())
+        else:
+            redis.store({channel.removeprefix('command:'): value})
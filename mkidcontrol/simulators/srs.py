@@ -0,0 +1,73 @@
+"""
+Simulated Stanford Research Systems SIM921 AC resistance bridge and SIM960 analog PID controller.
+
+Both are simulated as directly connected modules, not through a SIM900 mainframe: SimDevice's mainframe walk finds
+no SIM900 and talks to the module as is.
+"""
+
+from mkidcontrol.simulators.base import ScpiSimulator, ruox_resistance
+
+
+class SIM921Simulator(ScpiSimulator):
+    """
+    A SIM921 reading a ruthenium oxide thermometer at self.temperature (K), see SIM921 in mkidcontrol.devices.
+
+    TVAL? and RVAL? read the thermometer (through ruox_resistance()), RDEV? is the resistance less the RSET
+    setpoint, and the scaled analog output (AMAN 0) is VOHM * RDEV. It powers up with ATEM 1 and EXON 0, as the
+    device class insists on the opposite.
+    """
+    NAME = 'sim921'
+    IDN = 'Stanford_Research_Systems,SIM921,s/n000921,ver3.6'
+    DEFAULTS = {('ATEM', None): '1', ('EXON', None): '0', ('AMAN', None): '0', ('AOUT', None): '0.000',
+                ('VOHM', None): '1.0E-4', ('RSET', None): '1.0E+4'}
+
+    def __init__(self, temperature=0.1, **kwargs):
+        super().__init__(**kwargs)
+        self.temperature = temperature
+
+    def resistance(self):
+        return ruox_resistance(self.temperature)
+
+    def query_TVAL(self):
+        return f"{self.noisy(self.temperature):+.6E}"
+
+    def query_RVAL(self):
+        return f"{self.noisy(self.resistance()):+.6E}"
+
+    def query_RDEV(self):
+        return f"{self.noisy(self.resistance()) - float(self.setting('RSET')):+.6E}"
+
+
+class SIM960Simulator(ScpiSimulator):
+    """
+    A SIM960, see SIM960 in mkidcontrol.devices.
+
+    MMON? reads self.measure, the input voltage (e.g. the SIM921's scaled output). In manual (AMAN 0) the output
+    OMON? is MOUT plus OUTPUT_OFFSET, in PID (AMAN 1) it is the proportional only GAIN * error + OFST (the integral
+    and derivative terms are not modelled), where the error is SETP - measure for APOL 1 and measure - SETP for APOL
+    0, clipped to [LLIM, ULIM]. It powers up with positive polarity (APOL 1).
+    """
+    NAME = 'sim960'
+    IDN = 'Stanford_Research_Systems,SIM960,s/n000960,ver2.17'
+    OUTPUT_OFFSET = 0.002  # V, the output monitor reads a little above the manual output
+    DEFAULTS = {('APOL', None): '1', ('AMAN', None): '0', ('MOUT', None): '0.000', ('SETP', None): '0.000',
+                ('GAIN', None): '1.0', ('OFST', None): '0.000', ('ULIM', None): '10.000', ('LLIM', None): '-10.000'}
+
+    def __init__(self, measure=0.0, **kwargs):
+        super().__init__(**kwargs)
+        self.measure = measure
+
+    def output(self):
+        if self.setting('AMAN') == '0':
+            return float(self.setting('MOUT')) + self.OUTPUT_OFFSET
+        error = float(self.setting('SETP')) - self.measure
+        if self.setting('APOL') == '0':
+            error = -error
+        output = float(self.setting('GAIN')) * error + float(self.setting('OFST'))
+        return min(max(output, float(self.setting('LLIM'))), float(self.setting('ULIM')))
+
+    def query_MMON(self):
+        return f"{self.noisy(self.measure, 1e-3):+.6f}"
+
+    def query_OMON(self):
+        return f"{self.noisy(self.output(), 1e-3):+.6f}"
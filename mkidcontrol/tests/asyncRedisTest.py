@@ -0,0 +1,59 @@
+"""
+Exercise AsyncMKIDRedis: store, read, range and publish as coroutines, and many listen() subscriptions multiplexed on
+one event loop over the shared pubsub hub (so on one redis connection and thread). Uses the in-process stand-in for
+redis, so needs no redis-server.
+"""
+
+import asyncio
+import threading
+import time
+
+import mkidcontrol.mkidredis as redis
+
+KEY = 'status:test:async:value'
+TS_KEY = 'status:test:async:temp'
+N_LISTENERS = 200
+
+
+async def first_message(client, channel):
+    messages = client.listen(channel, timeout=5)
+    try:
+        return await messages.__anext__()
+    finally:
+        await messages.aclose()
+
+
+async def main(client):
+    await client.store({KEY: 'on'})
+    assert await client.read(KEY) == 'on', 'Stored value not read back'
+
+    now = int(time.time() * 1000)
+    await client.store_batch(ts_data={TS_KEY: 0.1}, timestamp=now)
+    assert (await client.range(TS_KEY, now - 1000))[-1][1] == 0.1, 'Timeseries sample not read back'
+
+    threads = threading.active_count()
+    tasks = [asyncio.ensure_future(first_message(client, f'test:async:{i}')) for i in range(N_LISTENERS)]
+    start = time.perf_counter()
+    added = 0
+    while not all(task.done() for task in tasks):  # Publish until each listener has subscribed and heard it
+        for i, task in enumerate(tasks):
+            if not task.done():
+                await client.publish(f'test:async:{i}', i, store=False)
+        added = max(added, threading.active_count() - threads)
+        await asyncio.sleep(0.01)
+    elapsed = time.perf_counter() - start
+    received = [task.result() for task in tasks]
+    assert received == [(f'test:async:{i}', str(i)) for i in range(N_LISTENERS)], 'Messages lost or misrouted'
+    assert client.mkidredis.pubsub_hub.n_listeners == 0, 'Subscriptions not released'
+    print(f"{N_LISTENERS} subscriptions on one loop: all heard within {elapsed:.3f} s, at most {added} threads added")
+
+
+if __name__ == "__main__":
+    redis.setup_redis(port=16396, backend='memory')
+    redis.mkidredis.redis.flushall()
+    redis.mkidredis.create_ts_keys((TS_KEY,))
+    client = redis.AsyncMKIDRedis(redis.mkidredis)
+    try:
+        asyncio.run(main(client))
+    finally:
+        client.close()
@@ -0,0 +1,53 @@
+"""
+Benchmark of full magnet cycles in simulated time (mkidcontrol/simulators/magnetcycle.py).
+
+Runs a cooldown of the XKID magnet controller (or with --picturec the PICTURE-C one) for each combination of the given
+ramp rates, soak currents and soak times and reports the simulated time to cold, the controller ticks (state machine
+evaluations) per second of wall clock and how much faster than real time the cycle ran. Needs no hardware or
+redis-server, the simulations use the in-process stand-in for redis.
+"""
+
+import argparse
+import itertools
+import logging
+
+from mkidcontrol.simulators.magnetcycle import MagnetCycleSimulation, PicturecCycleSimulation
+
+
+def report(params, result):
+    cold = f"{result['time_to_cold'] / 60:8.1f} min" if result['time_to_cold'] is not None else \
+        f"never ({result['final_state']})"
+    print(f"{params}: cold after {cold}, {result['ticks']} ticks, {result['errors']} errors, "
+          f"{result['ticks_per_s']:8.0f} ticks/s, {result['speedup']:6.0f}x real time")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark simulated magnet cycles')
+    parser.add_argument('--ramp-rates', dest='ramp_rates', type=float, nargs='+', default=[0.005, 0.01],
+                        help='Ramp (and deramp) rates in A/s')
+    parser.add_argument('--soak-currents', dest='soak_currents', type=float, nargs='+', default=[9.4],
+                        help='Soak currents in A')
+    parser.add_argument('--soak-times', dest='soak_times', type=float, nargs='+', default=[30, 60],
+                        help='Soak times in minutes')
+    parser.add_argument('--regulation-temp', dest='regulation_temp', type=float, default=0.1,
+                        help='Regulation temperature in K')
+    parser.add_argument('--noise', dest='noise', type=float, default=1e-4,
+                        help='Relative noise of the simulated readings')
+    parser.add_argument('--picturec', dest='picturec', action='store_true',
+                        help='Cycle the PICTURE-C controller (SIM960) instead of the XKID one (LakeShore 625)')
+    parser.add_argument('--timeout', dest='timeout', type=float, default=8, help='Simulated hours to give a cycle')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.ERROR)
+
+    controller = 'PICTURE-C' if args.picturec else 'XKID'
+    print(f"{controller} magnet cycles, regulating at {1e3 * args.regulation_temp:.0f} mK")
+    for rate, current, soak in itertools.product(args.ramp_rates, args.soak_currents, args.soak_times):
+        params = f"{1e3 * rate:5.1f} mA/s to {current:4.2f} A for {soak:4.0f} min"
+        if args.picturec:  # The sim960Agent takes its soak time in seconds
+            sim = PicturecCycleSimulation(ramp_rate=rate, deramp_rate=rate, soak_current=current, soak_time=60 * soak,
+                                          regulation_temp=args.regulation_temp, noise=args.noise, seed=0)
+        else:
+            sim = MagnetCycleSimulation(ramp_rate=rate, deramp_rate=rate, soak_current=current, soak_time=soak,
+                                        regulation_temp=args.regulation_temp, noise=args.noise, seed=0)
+        with sim:
+            report(params, sim.run_cycle(timeout=3600 * args.timeout))
@@ -0,0 +1,52 @@
+"""
+Check that the quench monitor (agents/picturec/quenchAgent.py) detects a quench, and does not mistake the fastest
+allowed deramp for one, at the sample rates of both the PICTURE-C currentduino (10 Hz) and the XKID Lake Shore 625
+(1 Hz). Uses the in-process stand-in for redis, so needs no redis-server.
+"""
+
+import math
+import time
+
+import mkidcontrol.mkidredis as redis
+import mkidcontrol.agents.picturec.quenchAgent as quench
+
+CURRENT = 9.4  # A
+TAU = 0.5  # s, the decay time of the current in a quench
+
+
+def feed(q, interval, current, duration, start):
+    """
+    Add samples every interval s of current(t) (t in s from start) for duration s, return the time in s from start of
+    the first sample on which a quench is detected or None
+    """
+    for i in range(int(duration / interval)):
+        t = i * interval
+        q.add(1000 * (start + t), current(t))
+        if q.check_quench():
+            return t
+    return None
+
+
+def run(name, key, interval, max_deramp_rate):
+    npoints = quench.window_points(interval)
+    start = time.time() - 3600
+
+    q = quench.QuenchMonitor(npoints, key=key, max_deramp_rate=max_deramp_rate)
+    deramp = feed(q, interval, lambda t: max(CURRENT - max_deramp_rate * t, 0), CURRENT / max_deramp_rate, start)
+    assert deramp is None, f"{name}: deramping at {max_deramp_rate} A/s taken for a quench after {deramp} s"
+
+    q = quench.QuenchMonitor(npoints, key=key, max_deramp_rate=max_deramp_rate)
+    quench_at = 60  # s, after a minute at full current
+    detected = feed(q, interval, lambda t: CURRENT if t < quench_at else CURRENT * math.exp(-(t - quench_at) / TAU),
+                    2 * quench_at, start)
+    assert detected is not None, f"{name}: a {CURRENT} A quench (tau {TAU} s) at {1 / interval:g} Hz was not detected"
+    print(f"{name}: {npoints} point window, quench detected {detected - quench_at:.1f} s after it began, none while "
+          f"deramping at {max_deramp_rate} A/s")
+
+
+if __name__ == "__main__":
+    redis.setup_redis(port=16390, backend='memory')
+    redis.mkidredis.redis.flushall()
+    redis.mkidredis.create_ts_keys((quench.CURRENT_KEY, quench.XKID_CURRENT_KEY))
+    run('PICTURE-C', quench.CURRENT_KEY, quench.SAMPLE_INTERVAL, quench.SIM960.MAX_CURRENT_SLOPE)
+    run('XKID', quench.XKID_CURRENT_KEY, quench.XKID_SAMPLE_INTERVAL, quench.XKID_MAX_DERAMP_RATE)
@@ -0,0 +1,39 @@
+"""
+Check that MKIDRedis.range(max_points=...) answers long windows from the compactions when the raw samples have already
+expired, as the 24 h plots of monitor_cooldown.py need. Stores 5 h of 1 Hz samples in a key with the deployed raw
+retention (config.REDIS_TS_RETENTION) and compactions (config.REDIS_TS_COMPACTIONS). Uses the in-process stand-in for
+redis, so needs no redis-server.
+"""
+
+import time
+
+import mkidcontrol.mkidredis as redis
+from mkidcontrol.config import REDIS_TS_RETENTION, REDIS_TS_COMPACTIONS
+
+KEY = 'status:test:range:current'
+HOURS = 5
+
+if __name__ == "__main__":
+    redis.setup_redis(port=16391, backend='memory')
+    redis.mkidredis.redis.flushall()
+    redis.mkidredis.create_ts_keys((KEY,), compactions={KEY: REDIS_TS_COMPACTIONS})
+    redis.redis_ts.alter(KEY, retention_msecs=REDIS_TS_RETENTION)
+
+    now = int(time.time() * 1000)
+    start = now - HOURS * 3600 * 1000
+    for chunk in range(0, HOURS * 3600, 3600):
+        redis.redis_ts.madd([(KEY, start + 1000 * s, 1.0) for s in range(chunk, chunk + 3600)])
+
+    raw = redis.mkr_range(KEY, now - 24 * 3600 * 1000)
+    assert raw[0][0] >= now - REDIS_TS_RETENTION - 1000, 'The raw samples should only go back REDIS_TS_RETENTION'
+
+    rang = redis.mkr_range(KEY, now - 24 * 3600 * 1000, now, max_points=5000)
+    assert len(rang) <= 5000, f'{len(rang)} samples returned for max_points=5000'
+    assert rang[0][0] <= start + 60 * 1000, \
+        f'A 24 h window started {(rang[0][0] - start) / 3.6e6:.2f} h into the {HOURS} h of data'
+    print(f"24 h window of {HOURS} h of data: {len(rang)} samples from {(now - rang[0][0]) / 3.6e6:.2f} h ago "
+          f"(the raw series only holds {len(raw)})")
+
+    rang = redis.mkr_range(KEY, now - 30 * 60 * 1000, now, max_points=5000)
+    assert len(rang) > 1700, 'A 30 min window should come from the raw samples'
+    print(f"30 min window: {len(rang)} raw samples")
@@ -0,0 +1,69 @@
+"""
+Benchmark of MKIDRedis.store throughput, comparing the per-key (one TS.ADD or SET + PUBLISH per key) and batched
+(TS.MADD + SET/PUBLISH in one MULTI) store modes.
+
+Assumes that a redis-server with the timeseries module is running on localhost, unless run with --memory to use the
+in-process stand-in for redis (mkidcontrol/memredis.py), which isolates the client-side cost. Writes only to keys under
+the 'benchmark:' namespace, which are deleted at the end of the run.
+"""
+
+import argparse
+import time
+import numpy as np
+
+import mkidcontrol.mkidredis as redis
+
+TS_KEYS = tuple(f'benchmark:store:ts-{i}' for i in range(7))
+KEYS = tuple(f'benchmark:store:key-{i}' for i in range(7))
+
+
+def time_it(func, n):
+    """Call func n times and return the per-call durations in seconds"""
+    durations = np.zeros(n)
+    for i in range(n):
+        t = time.perf_counter()
+        func()
+        durations[i] = time.perf_counter() - t
+    return durations
+
+
+def report(name, durations, n_keys):
+    print(f"{name:>24}: {1e3 * durations.mean():8.3f} ms/call (median {1e3 * np.median(durations):.3f}, "
+          f"p99 {1e3 * np.percentile(durations, 99):.3f})  {n_keys / durations.mean():10.0f} keys/s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark per-key vs batched MKIDRedis.store')
+    parser.add_argument('-n', dest='n', type=int, default=2000, help='Number of store calls per mode')
+    parser.add_argument('--host', dest='host', default='localhost', help='redis host')
+    parser.add_argument('--port', dest='port', type=int, default=6379, help='redis port')
+    parser.add_argument('--memory', dest='memory', action='store_true', help='Use the in-memory stand-in for redis')
+    args = parser.parse_args()
+
+    redis.setup_redis(host=args.host, port=args.port, backend='memory' if args.memory else None)
+    redis.mkidredis.redis.delete(*(KEYS + TS_KEYS))
+    # Many samples land in the same millisecond here, so the benchmark keys must accept duplicate timestamps
+    for k in TS_KEYS:
+        redis.redis_ts.create(k, duplicate_policy='last')
+    redis.mkidredis.ts_keys = TS_KEYS
+
+    ts_data = {k: float(i) for i, k in enumerate(TS_KEYS)}
+    data = {k: 'OK' for k in KEYS}
+
+    # Silence the per-key info logging so that it does not dominate the measurement
+    redis.logging.getLogger(redis.__name__).setLevel('WARNING')
+
+    print(f"{args.n} calls of {len(TS_KEYS)} timeseries keys and {len(KEYS)} normal keys each")
+    report('ts per-key', time_it(lambda: redis.store(ts_data, timeseries=True), args.n), len(TS_KEYS))
+    report('ts batched', time_it(lambda: redis.store(ts_data, timeseries=True, batch=True), args.n), len(TS_KEYS))
+    report('keys per-key', time_it(lambda: redis.store(data), args.n), len(KEYS))
+    report('keys batched', time_it(lambda: redis.store(data, batch=True), args.n), len(KEYS))
+
+    def agent_tick_per_key():
+        redis.store(ts_data, timeseries=True)
+        redis.store({KEYS[0]: 'OK'})
+    report('agent tick per-key', time_it(agent_tick_per_key, args.n), len(TS_KEYS) + 1)
+    report('agent tick batched', time_it(lambda: redis.store_batch(data={KEYS[0]: 'OK'}, ts_data=ts_data), args.n),
+           len(TS_KEYS) + 1)
+
+    redis.mkidredis.redis.delete(*(KEYS + TS_KEYS))
@@ -0,0 +1,116 @@
+"""
+Exercise each serial device class against its simulator (mkidcontrol/simulators) and report the query latency.
+
+Needs no hardware. Pass --latency to give the simulated instruments a reply latency. Finishes by querying several
+simulators concurrently through their asyncio transports.
+"""
+
+import argparse
+import asyncio
+import logging
+import time
+
+from mkidcontrol.devices import LakeShore372, LakeShore372ScanAcquisition, LakeShore625, SIM921, SIM960, Currentduino, \
+    Hemtduino, Laserflipperduino, Conex, AsyncLakeShoreDevice, AsyncSimDevice, AsyncArduino
+from mkidcontrol.simulators import LakeShore372Simulator, LakeShore625Simulator, SIM921Simulator, \
+    SIM960Simulator, CurrentduinoSimulator, HemtduinoSimulator, LaserflipperduinoSimulator, ConexSimulator
+from mkidcontrol.agents.lakeshore372Agent import SCAN_POLL_INTERVAL
+
+
+def report(device):
+    """
+    Print the query latency of SerialDevices (the LakeShore 372 goes through the lakeshore package instead) and the
+    I/O metrics of every device
+    """
+    if hasattr(device, 'latency'):
+        stats = device.latency.stats()
+        if stats['count']:
+            print(f"    {stats['count']} queries, p50 {1e3 * stats['p50']:.2f} ms, p99 {1e3 * stats['p99']:.2f} ms")
+    io, commands = device.metrics.snapshot()
+    print(f"    {io['bytes_out']} B out, {io['bytes_in']} B in, {io['timeouts']} timeouts, {len(commands)} commands, "
+          f"busiest {max(commands, key=lambda c: commands[c]['total'])}")
+
+
+async def query_concurrently(devices, n=5):
+    """ Connect the asyncio transports and query each n times, all devices at once """
+    await asyncio.gather(*(device.connect() for device, _ in devices))
+    start = time.perf_counter()
+    replies = await asyncio.gather(*(device.query(cmd) for device, cmd in devices * n))
+    elapsed = time.perf_counter() - start
+    await asyncio.gather(*(device.disconnect() for device, _ in devices))
+    return replies[:len(devices)], elapsed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Run the serial device classes against the simulators')
+    parser.add_argument('--latency', type=float, default=0.0, help='Simulated reply latency in s')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+
+    with LakeShore625Simulator(latency=args.latency, critical_current=9.0) as sim:
+        ls625 = LakeShore625(port=sim.port, valid_models=('MODEL625',))
+        print(f"LakeShore 625 {ls625.sn}: limits {ls625.limits}, mode {ls625.mode}")
+        ls625.send("RATE 0.5")
+        ls625.send("SETI 1.0")
+        time.sleep(1)
+        print(f"  ramping: {ls625.current()} A, {ls625.output_voltage()} V, {ls625.field()} kG")
+        sim.quench()
+        time.sleep(1)
+        print(f"  quenched: {ls625.current()} A, setpoint {ls625.query('SETI?')} A")
+        report(ls625)
+
+    with LakeShore372Simulator(latency=args.latency, noise=1e-3) as sim:
+        ls372 = LakeShore372('LakeShore372', connection=sim.serial_connection(), enabled_input_channels=('A', '1'))
+        print(f"LakeShore 372: {ls372.read_all()}")
+        acquisition = LakeShore372ScanAcquisition(ls372, ('A', '1'))
+        acquisition.refresh_scanner_settings()
+        job = ls372.monitor(SCAN_POLL_INTERVAL, acquisition.poll)
+        time.sleep(10 * SCAN_POLL_INTERVAL)
+        job.cancel()
+        time.sleep(SCAN_POLL_INTERVAL)  # Let a poll in progress finish
+        print(f"  scanning every {SCAN_POLL_INTERVAL} s: {acquisition.stats}, {job.stats()['missed']} missed polls")
+        assert job.stats()['missed'] == 0, f"Scan polls missed their deadlines: {job.stats()}"
+        report(ls372)
+
+    with SIM921Simulator(latency=args.latency) as sim:
+        sim921 = SIM921(port=sim.port)
+        print(f"SIM921 {sim921.sn}: {sim921.temp()} K, {sim921.resistance()} Ohm, {sim921.output_voltage()} V")
+        report(sim921)
+
+    with SIM960Simulator(latency=args.latency) as sim:
+        sim960 = SIM960(port=sim.port)
+        print(f"SIM960 {sim960.sn}: {sim960.state}, in {sim960.input_voltage()} V, out {sim960.output_voltage()} V")
+        report(sim960)
+
+    with CurrentduinoSimulator(latency=args.latency, current=4.2) as sim:
+        currentduino = Currentduino(port=sim.port)
+        print(f"Currentduino {currentduino.firmware}: {currentduino.read_current():.3f} A")
+        report(currentduino)
+
+    with HemtduinoSimulator(latency=args.latency) as sim:
+        hemtduino = Hemtduino(port=sim.port)
+        print(f"Hemtduino {hemtduino.firmware}: {hemtduino.read_hemt_data()}")
+        report(hemtduino)
+
+    with LaserflipperduinoSimulator(latency=args.latency) as sim:
+        names = ['808 nm', '904 nm', '980 nm', '1120 nm', '1310 nm', 'mirror']
+        flipper = Laserflipperduino(port=sim.port, lasernames=names)
+        flipper.set_diode(2, 50)
+        flipper.set_mirror_position('up')
+        print(f"Laserflipperduino {flipper.firmware}: {flipper.statuses()}")
+        report(flipper)
+
+    with ConexSimulator(latency=args.latency) as sim:
+        conex = Conex(port=sim.port)
+        conex.move((0.3, -0.2), blocking=True)
+        print(f"Conex {conex.id_number.strip()}: at {conex.position()}, {conex.status()[1]}")
+        report(conex)
+
+    with LakeShore625Simulator(latency=args.latency) as ls625_sim, \
+            SIM921Simulator(latency=args.latency) as sim921_sim, \
+            CurrentduinoSimulator(latency=args.latency, current=4.2) as currentduino_sim:
+        devices = [(AsyncLakeShoreDevice('LakeShore625', ls625_sim.port, valid_models=('MODEL625',)), 'RDGI?'),
+                   (AsyncSimDevice('SIM921', sim921_sim.port), 'TVAL?'),
+                   (AsyncArduino('currentduino', currentduino_sim.port), '?')]
+        replies, elapsed = asyncio.run(query_concurrently(devices))
+        print(f"asyncio: {replies}, {5 * len(devices)} queries of {len(devices)} devices in {1e3 * elapsed:.1f} ms")
@@ -2,7 +2,7 @@
 A testing script to write generic values to a redis key. Meant for testing plotly.js plotting tools.
 """
 
-from mkidcontrol.pcredis import PCRedis
+from mkidcontrol.mkidredis import MKIDRedis
 import numpy as np
 import time
 
@@ -10,7 +10,7 @@ if __name__ == "__main__":
     REDIS_DB = 0
     TS_KEYS = ['test_key']
 
-    redis = PCRedis(host='127.0.0.1', port=6379, db=REDIS_DB, create_ts_keys=TS_KEYS)
+    redis = MKIDRedis(host='127.0.0.1', port=6379, db=REDIS_DB, ts_keys=TS_KEYS)
 
     vals = np.array([0], dtype=int)
     a = np.arange(0,100)
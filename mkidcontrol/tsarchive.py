@@ -0,0 +1,146 @@
+"""
+Long-term on-disk archive of redis timeseries samples.
+
+Redis only keeps REDIS_TS_RETENTION of raw samples. The tsarchiverAgent periodically copies new samples of every
+timeseries key into this archive before they age out. The archive is laid out as
+
+    <base dir>/<key>/<YYYYMMDD (UTC)>/<first timestamp ms>-<last timestamp ms>.npz
+
+where each chunk file is a compressed NumPy archive of the columns 't' (int64 UNIX timestamps in ms) and 'v'
+(float64 values). Since the chunk bounds are in the file names a query only opens the chunks that overlap it, and
+consolidate() merges the many small chunks written over a day into a single file once the day is over.
+
+Use MKIDRedis.range_archived to query the archive and live redis together.
+"""
+
+import logging
+import os
+import numpy as np
+
+DAY_MS = 24 * 60 * 60 * 1000
+CHUNK_SUFFIX = '.npz'
+
+
+class TSArchive:
+    """
+    A directory of day partitioned, compressed (t, v) chunk files per timeseries key. See the module docstring for
+    the layout. Samples within a key must be written in increasing time order (as redis stores them).
+    """
+    def __init__(self, path):
+        self.path = path
+
+    def key_dir(self, key):
+        return os.path.join(self.path, key)
+
+    def keys(self):
+        """ The keys with anything archived """
+        if not os.path.isdir(self.path):
+            return []
+        return sorted(k for k in os.listdir(self.path) if os.path.isdir(self.key_dir(k)))
+
+    def days(self, key):
+        """ The days (as UTC YYYYMMDD strings) with samples of key archived, oldest first """
+        try:
+            return sorted(d for d in os.listdir(self.key_dir(key)) if d.isdigit())
+        except FileNotFoundError:
+            return []
+
+    def chunks(self, key, day):
+        """ List of (first ms, last ms, file) of the chunks of key on day, oldest first """
+        try:
+            files = os.listdir(os.path.join(self.key_dir(key), day))
+        except FileNotFoundError:
+            return []
+        chunks = []
+        for f in files:
+            if not f.endswith(CHUNK_SUFFIX):
+                continue
+            try:
+                first, last = map(int, f[:-len(CHUNK_SUFFIX)].split('-'))
+            except ValueError:
+                continue
+            chunks.append((first, last, os.path.join(self.key_dir(key), day, f)))
+        return sorted(chunks)
+
+    def last_timestamp(self, key):
+        """ The timestamp (ms) of the newest archived sample of key, or None if nothing is archived """
+        for day in reversed(self.days(key)):
+            chunks = self.chunks(key, day)
+            if chunks:
+                return max(c[1] for c in chunks)
+        return None
+
+    def write(self, key, t, v):
+        """
+        Archive the samples (t ms, v) of key, splitting them into one new chunk per (UTC) day they span.
+        Returns the number of samples written
+        """
+        t = np.asarray(t, dtype=np.int64)
+        v = np.asarray(v, dtype=np.float64)
+        if not t.size:
+            return 0
+        day_index = t // DAY_MS
+        bounds = np.flatnonzero(np.diff(day_index)) + 1
+        for ct, cv in zip(np.split(t, bounds), np.split(v, bounds)):
+            self._write_chunk(key, ct, cv)
+        return t.size
+
+    def _write_chunk(self, key, t, v):
+        day_dir = os.path.join(self.key_dir(key), utc_day(t[0]))
+        os.makedirs(day_dir, exist_ok=True)
+        file = os.path.join(day_dir, f'{t[0]}-{t[-1]}{CHUNK_SUFFIX}')
+        # Write then rename so that a reader (or a crash) never sees a partial chunk
+        tmp = file + '.tmp'
+        with open(tmp, 'wb') as f:
+            np.savez_compressed(f, t=t, v=v)
+        os.replace(tmp, file)
+        return file
+
+    def read(self, key, start=None, end=None):
+        """
+        Return the archived samples of key with start <= t <= end (UNIX timestamps in ms, None for unbounded) as a
+        tuple (t, v) of float64 arrays, matching MKIDRedis.range_many
+        """
+        start = -np.inf if start is None else start
+        end = np.inf if end is None else end
+        first_day = None if start == -np.inf else utc_day(start)
+        last_day = None if end == np.inf else utc_day(end)
+
+        ts, vs = [], []
+        for day in self.days(key):
+            if (first_day and day < first_day) or (last_day and day > last_day):
+                continue
+            for first, last, file in self.chunks(key, day):
+                if last < start or first > end:
+                    continue
+                with np.load(file) as chunk:
+                    ts.append(chunk['t'])
+                    vs.append(chunk['v'])
+        if not ts:
+            return np.zeros(0), np.zeros(0)
+
+        t = np.concatenate(ts).astype(np.float64)
+        v = np.concatenate(vs)
+        # Chunks never overlap unless a consolidation was interrupted, in which case drop the repeated samples
+        t, idx = np.unique(t, return_index=True)
+        v = v[idx]
+        keep = (t >= start) & (t <= end)
+        return t[keep], v[keep]
+
+    def consolidate(self, key, day):
+        """ Merge all of the chunks of key on day into a single chunk. Returns the number of chunks merged """
+        chunks = self.chunks(key, day)
+        if len(chunks) < 2:
+            return 0
+        t, v = self.read(key, chunks[0][0], chunks[-1][1])
+        new = self._write_chunk(key, t.astype(np.int64), v)
+        for _, _, file in chunks:
+            if file != new:
+                os.remove(file)
+        logging.getLogger(__name__).debug(f"Consolidated {len(chunks)} chunks of {key} on {day}")
+        return len(chunks)
+
+
+def utc_day(t_ms):
+    """ The UTC day of the UNIX timestamp t_ms as a YYYYMMDD string """
+    return np.datetime_as_string(np.datetime64(int(t_ms), 'ms'), unit='D').replace('-', '')
@@ -103,6 +103,7 @@ setuptools.setup(
              'mkidcontrol/agents/lakeshore336Agent.py',
              'mkidcontrol/agents/lakeshore372Agent.py',
              'mkidcontrol/agents/lakeshore625Agent.py',
+             'mkidcontrol/agents/tsarchiverAgent.py',
              'mkidcontrol/agents/picturec/currentduinoAgent.py',
              'mkidcontrol/agents/picturec/hemttempAgent.py',
              'mkidcontrol/controlflask/mkidDirector.py',